@@ -5,6 +5,7 @@
 import click
 import sys
 import os
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -16,7 +17,10 @@ sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from storage.database import Database
 from storage.init_db import initialize_database
+from storage.ann_index import IVFIndex
+from extraction.ocr_server import OCRServer
 from pipeline.orchestrator import DocumentPipeline
+from pipeline.scheduler import StageScheduler
 
 
 # Default paths
@@ -46,7 +50,13 @@ def init():
 @click.option('--party', '-p', help='Specific party abbreviation to process')
 @click.option('--limit', '-l', type=int, help='Limit number of documents to process')
 @click.option('--category', '-c', help='Specific category to process')
-def process(party, limit, category):
+@click.option('--concurrency', '-j', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of LLM analyses to run in parallel')
+@click.option('--multi-category', is_flag=True, default=None,
+              help='Analyze all categories of a document in shared requests')
+@click.option('--async', 'use_async', is_flag=True,
+              help='Run all analyses on one asyncio event loop (--concurrency then bounds extractions)')
+def process(party, limit, category, concurrency, multi_category, use_async):
     """Process political party documents through the analysis pipeline.
 
     Examples:
@@ -54,28 +64,20 @@ def process(party, limit, category):
       python main.py process --limit 3          # Process first 3 documents (POC)
       python main.py process --party PLN        # Process specific party
       python main.py process --category economia # Process specific category
+      python main.py process --concurrency 8    # Run 8 analyses in parallel
+      python main.py process --multi-category   # One request for all categories
+      python main.py process --async            # All documents concurrently via asyncio
     """
     if not DB_PATH.exists():
         click.echo("❌ Database not found. Run 'python main.py init' first.")
         return
 
     db = Database(str(DB_PATH))
-    pipeline = DocumentPipeline(db_path=str(DB_PATH))
+    pipeline = DocumentPipeline(db_path=str(DB_PATH), concurrency=concurrency,
+                                multi_category=multi_category)
 
     # Get documents to process
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-
-        if party:
-            cursor.execute("""
-                SELECT d.* FROM documents d
-                JOIN parties p ON d.party_id = p.id
-                WHERE p.abbreviation = ?
-            """, (party,))
-        else:
-            cursor.execute("SELECT * FROM documents")
-
-        documents = [dict(row) for row in cursor.fetchall()]
+    documents = _select_documents(db, party)
 
     if not documents:
         click.echo("❌ No documents found.")
@@ -98,43 +100,179 @@ def process(party, limit, category):
     if categories:
         click.echo(f"📁 Category filter: {categories[0]['name']}")
 
+    if use_async:
+        click.echo(f"⚡ asyncio: analyses share one event loop, {concurrency} extraction(s) at a time")
+    elif concurrency > 1:
+        click.echo(f"⚡ Concurrency: {concurrency} analyses in flight")
+
     click.echo()
 
     # Process documents
     doc_ids = [doc['id'] for doc in documents]
-    results = pipeline.process_multiple_documents(doc_ids, categories=categories)
+    try:
+        if use_async:
+            results = asyncio.run(pipeline.process_multiple_documents_async(doc_ids, categories=categories))
+        else:
+            results = pipeline.process_multiple_documents(doc_ids, categories=categories)
+    finally:
+        pipeline.close()
+    client_stats = pipeline.llm_analyzer.client.stats
 
     # Summary
     successful = len([r for r in results if not r.get('failed')])
     total_cost = sum(r.get('total_cost', 0) for r in results if not r.get('failed'))
+    prompt_tokens = sum(r.get('prompt_tokens', 0) for r in results if not r.get('failed'))
+    completion_tokens = sum(r.get('completion_tokens', 0) for r in results if not r.get('failed'))
 
     click.echo(f"\n{'=' * 70}")
     click.echo(f"📊 SUMMARY")
     click.echo(f"{'=' * 70}")
     click.echo(f"Documents processed: {successful}/{len(documents)}")
+    click.echo(f"Tokens: {prompt_tokens:,} prompt + {completion_tokens:,} completion")
+    if client_stats['prompt_tokens']:
+        click.echo(f"Prompt cache: {client_stats['cached_tokens']:,} of {client_stats['prompt_tokens']:,} "
+                   f"prompt tokens sent this run were cached "
+                   f"({pipeline.llm_analyzer.client.cached_token_ratio():.0%})")
     click.echo(f"Total cost: ${total_cost:.2f}")
     click.echo(f"{'=' * 70}\n")
 
 
+@cli.command()
+@click.option('--party', '-p', help='Specific party abbreviation to run')
+@click.option('--limit', '-l', type=int, help='Limit number of documents to run')
+@click.option('--category', '-c', help='Specific category to analyze')
+@click.option('--extract-workers', type=click.IntRange(min=1), default=2, show_default=True,
+              help='Documents extracted at the same time (CPU: PDF and OCR process pools)')
+@click.option('--embed-workers', type=click.IntRange(min=1), default=2, show_default=True,
+              help='Embedding batches sent at the same time (network)')
+@click.option('--analyze-workers', type=click.IntRange(min=1), default=4, show_default=True,
+              help='Documents analyzed at the same time (network)')
+@click.option('--no-embeddings', is_flag=True, help='Skip the embed stage')
+@click.option('--no-analysis', is_flag=True, help='Skip the analyze stage')
+@click.option('--status-interval', type=float, default=10.0, show_default=True,
+              help='Seconds between queue depth reports (0 = off)')
+def run(party, limit, category, extract_workers, embed_workers, analyze_workers, no_embeddings,
+        no_analysis, status_interval):
+    """Extract, embed and analyze documents in one run, with the stages overlapping.
+
+    Pages stream from extraction into embedding as they are saved, and each
+    document is analyzed as soon as its extraction finishes, so CPU work
+    (PDF parsing, OCR) and network work (embeddings, analysis) run at the
+    same time. Queue depths per stage are reported while it runs.
+
+    Examples:
+      python main.py run                       # Everything still missing
+      python main.py run --party PLN           # One party
+      python main.py run --extract-workers 4   # More documents read at once
+      python main.py run --no-analysis         # Extract and embed only
+    """
+    if not DB_PATH.exists():
+        click.echo("❌ Database not found. Run 'python main.py init' first.")
+        return
+
+    db = Database(str(DB_PATH))
+    documents = _select_documents(db, party)
+    if not documents:
+        click.echo("❌ No documents found.")
+        return
+    if limit:
+        documents = documents[:limit]
+
+    categories = None
+    if category:
+        cat = db.get_category_by_key(category)
+        if not cat:
+            click.echo(f"❌ Category not found: {category}")
+            return
+        categories = [cat]
+
+    pipeline = DocumentPipeline(db_path=str(DB_PATH), concurrency=extract_workers)
+    # New embeddings are added to the ANN index, if one has been built
+    pipeline.db.ann_index = IVFIndex.open(pipeline.db)
+    scheduler = StageScheduler(
+        pipeline,
+        extract_workers=extract_workers,
+        embed_workers=embed_workers,
+        analyze_workers=analyze_workers,
+        embeddings=not no_embeddings,
+        analysis=not no_analysis,
+        status_interval=status_interval
+    )
+
+    click.echo(f"\n🚀 Running {len(documents)} document(s): "
+               f"extract ({extract_workers} workers)"
+               f"{f' → embed ({embed_workers} workers)' if not no_embeddings else ''}"
+               f"{f' → analyze ({analyze_workers} workers)' if not no_analysis else ''}\n")
+
+    try:
+        outcome = asyncio.run(scheduler.run([doc['id'] for doc in documents], categories=categories))
+    finally:
+        pipeline.close()
+
+    results = outcome['results']
+    failed = [r for r in results if r.get('failed')]
+    total_cost = sum(r.get('total_cost', 0) for r in results if not r.get('failed'))
+    stats = outcome['stats']
+
+    click.echo(f"\n{'=' * 70}")
+    click.echo(f"📊 SUMMARY")
+    click.echo(f"{'=' * 70}")
+    click.echo(f"Documents: {len(results) - len(failed)}/{len(results)} completed")
+    click.echo(f"Extracted: {stats['extract']['done']} documents")
+    if not no_embeddings:
+        click.echo(f"Embedded: {stats['embed']['done']} pages ({stats['embed']['failed']} failed)")
+    if not no_analysis:
+        click.echo(f"Analyzed: {stats['analyze']['done']} documents, cost ${total_cost:.2f}")
+    click.echo(f"Duration: {outcome['duration_seconds']:.1f}s")
+    click.echo(f"{'=' * 70}\n")
+
+
+def _select_documents(db: Database, party=None):
+    """Documents of one party (by abbreviation) or all documents."""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+
+        if party:
+            cursor.execute("""
+                SELECT d.* FROM documents d
+                JOIN parties p ON d.party_id = p.id
+                WHERE p.abbreviation = ?
+            """, (party,))
+        else:
+            cursor.execute("SELECT * FROM documents")
+
+        return [dict(row) for row in cursor.fetchall()]
+
+
 @cli.command()
 @click.argument('category_key')
-def backfill(category_key):
+@click.option('--concurrency', '-j', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of documents to analyze in parallel')
+@click.option('--batch', is_flag=True,
+              help='Run the analyses as one Batch API job (half price, results within 24h)')
+def backfill(category_key, concurrency, batch):
     """Backfill all documents for a newly added category.
 
     This is useful when you add a new category and want to process
     all existing documents for that category.
 
+    With --batch the requests are submitted as one Batch API job and the
+    command polls until it finishes. Interrupting it is safe: running it
+    again resumes the same job instead of submitting a new one.
+
     Example:
       python main.py backfill impuestos
+      python main.py backfill impuestos --concurrency 8
+      python main.py backfill impuestos --batch
     """
     if not DB_PATH.exists():
         click.echo("❌ Database not found. Run 'python main.py init' first.")
         return
 
-    pipeline = DocumentPipeline(db_path=str(DB_PATH))
+    pipeline = DocumentPipeline(db_path=str(DB_PATH), concurrency=concurrency)
 
     try:
-        result = pipeline.backfill_category(category_key)
+        result = pipeline.backfill_category(category_key, batch=batch)
         click.echo(f"\n✓ Backfill complete!")
         click.echo(f"  Category: {result['category']}")
         click.echo(f"  Documents: {result['documents_processed']}/{result['total_documents']}")
@@ -144,6 +282,8 @@ def backfill(category_key):
         click.echo(f"❌ Error: {e}")
     except Exception as e:
         click.echo(f"❌ Unexpected error: {e}")
+    finally:
+        pipeline.close()
 
 
 @cli.command()
@@ -195,6 +335,16 @@ def status():
         """)
         cost_stats = cursor.fetchone()
 
+        # Prompt caching, from analyses logged with their usage breakdown
+        cursor.execute("""
+            SELECT SUM(prompt_tokens) as prompt_tokens, SUM(cached_tokens) as cached_tokens
+            FROM processing_log
+            WHERE stage = 'category_analysis' AND status = 'completed'
+        """)
+        prompt_stats = cursor.fetchone()
+
+    cache_stats = db.get_llm_cache_stats()
+
     click.echo(f"\n{'=' * 70}")
     click.echo(f"📊 PIPELINE STATUS")
     click.echo(f"{'=' * 70}\n")
@@ -209,6 +359,17 @@ def status():
         click.echo(f"\n💰 Cost Summary:")
         click.echo(f"  Total cost: ${cost_stats['total_cost']:.2f}")
         click.echo(f"  Total tokens: {cost_stats['total_tokens']:,}")
+    if prompt_stats['prompt_tokens']:
+        click.echo(f"  Prompt tokens cached by the API: {prompt_stats['cached_tokens'] or 0:,} "
+                   f"of {prompt_stats['prompt_tokens']:,} "
+                   f"({(prompt_stats['cached_tokens'] or 0) / prompt_stats['prompt_tokens']:.0%})")
+
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    if lookups or cache_stats['entries']:
+        hit_rate = (cache_stats['hits'] / lookups * 100) if lookups else 0
+        click.echo(f"\n💾 LLM Response Cache:")
+        click.echo(f"  Hits: {cache_stats['hits']:,}  Misses: {cache_stats['misses']:,} ({hit_rate:.1f}% hit rate)")
+        click.echo(f"  Entries: {cache_stats['entries']:,} ({cache_stats['size_bytes'] / 1024 / 1024:.1f} MB)")
 
     click.echo(f"\n📁 Category Processing Status:")
     for cat in category_stats:
@@ -219,6 +380,132 @@ def status():
     click.echo(f"\n{'=' * 70}\n")
 
 
+@cli.command()
+@click.option('--nlist', type=click.IntRange(min=1), help='IVF lists per party (default: 4·√party embeddings)')
+def build_index(nlist):
+    """Build the approximate nearest neighbour index over all embeddings.
+
+    The index is saved next to the database and updated automatically as
+    new embeddings are stored. Summary regeneration and add_party.py search
+    through it when it exists. Set ANN_NPROBE to trade recall for speed.
+    """
+    if not DB_PATH.exists():
+        click.echo("❌ Database not found. Run 'python main.py init' first.")
+        return
+
+    db = Database(str(DB_PATH))
+    try:
+        index = IVFIndex.build_from_database(db, nlist=nlist)
+    except ValueError as e:
+        click.echo(f"❌ {e}")
+        return
+    index.save()
+
+    click.echo(f"✅ Indexed {len(index):,} embeddings in {index.nlist} per-party lists "
+               f"(nprobe={index.nprobe})")
+    click.echo(f"   Saved to {index.path}")
+
+
+@cli.command()
+@click.option('--party', '-p', help='Specific party abbreviation to sync')
+@click.option('--dry-run', is_flag=True, help='Only report what would change')
+@click.option('--process', 'run_process', is_flag=True, help='Re-analyze changed documents afterwards')
+def sync(party, dry_run, run_process):
+    """Re-ingest plan PDFs that changed on disk since they were loaded.
+
+    A PDF whose hash differs from the stored one is diffed page by page:
+    unchanged pages keep their text and embeddings, changed pages are
+    re-extracted, and positions whose context included an edited or removed
+    page, or a page next to newly inserted ones, are invalidated.
+
+    Examples:
+      python main.py sync --dry-run           # Show what changed
+      python main.py sync --party PLN         # Sync one party
+      python main.py sync --process           # Sync, then re-analyze
+    """
+    if not DB_PATH.exists():
+        click.echo("❌ Database not found. Run 'python main.py init' first.")
+        return
+
+    db = Database(str(DB_PATH))
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        query = """
+            SELECT d.id, d.file_path, p.abbreviation FROM documents d
+            JOIN parties p ON d.party_id = p.id
+        """
+        if party:
+            cursor.execute(query + " WHERE p.abbreviation = ?", (party,))
+        else:
+            cursor.execute(query)
+        documents = [dict(row) for row in cursor.fetchall()]
+
+    if not documents:
+        click.echo("❌ No documents found.")
+        return
+
+    pipeline = DocumentPipeline(db_path=str(DB_PATH))
+    # Keep the ANN index in step with the embeddings that are deleted
+    pipeline.db.ann_index = IVFIndex.open(pipeline.db)
+
+    click.echo(f"\n🔄 Syncing {len(documents)} document(s){' (dry run)' if dry_run else ''}...\n")
+    changed = []
+    try:
+        for doc in documents:
+            pdf_path = Path(doc['file_path'])
+            if not pdf_path.exists():
+                click.echo(f"  ⚠️  {doc['abbreviation']:10s} file not found: {pdf_path}")
+                continue
+
+            result = pipeline.sync_document(doc['id'], pdf_path, dry_run=dry_run)
+            if result['status'] == 'unchanged':
+                click.echo(f"  ✓ {doc['abbreviation']:10s} unchanged")
+                continue
+
+            changed.append(doc['id'])
+            click.echo(f"  ✏️  {doc['abbreviation']:10s} "
+                       f"{result['pages_kept']} pages kept ({result['pages_renumbered']} renumbered), "
+                       f"{result['pages_removed']} removed, {result['pages_added']} added; "
+                       f"{result['embeddings_deleted']} embeddings deleted; "
+                       f"positions: {result['positions_invalidated']} invalidated, "
+                       f"{result['positions_renumbered']} renumbered")
+
+        if not party:
+            known = {Path(doc['file_path']).resolve() for doc in documents}
+            for pdf_path in sorted((PROJECT_ROOT.parent / "data" / "partidos").glob("*/*.pdf")):
+                if pdf_path.resolve() not in known:
+                    click.echo(f"  ➕ {pdf_path.relative_to(PROJECT_ROOT.parent)} not in database "
+                               f"(use scripts/add_party.py)")
+
+        click.echo(f"\n📊 {len(changed)} of {len(documents)} document(s) changed")
+        if changed and not dry_run:
+            if run_process:
+                click.echo()
+                pipeline.process_multiple_documents(changed)
+            else:
+                click.echo("   Next: make embeddings, then python main.py process to re-analyze")
+    finally:
+        pipeline.close()
+
+
+@cli.command()
+def ocr_server():
+    """Run a long-lived OCR worker with the EasyOCR models kept loaded.
+
+    While it runs, `process` and `scripts/add_party.py` send scanned pages to
+    it instead of loading the models themselves. Listens on OCR_SERVER
+    (default 127.0.0.1:6010, loopback only) and only OCRs PDFs under data/.
+    Clients authenticate with OCR_SERVER_AUTHKEY, or with the random key the
+    server writes to data/.ocr_server_key (owner-readable) when it is unset.
+    """
+    try:
+        OCRServer(languages=['es', 'en']).serve_forever()
+    except ValueError as e:
+        click.echo(f"❌ {e}")
+    except KeyboardInterrupt:
+        click.echo("\n👋 OCR server stopped")
+
+
 @cli.command()
 def list_categories():
     """List all available categories."""
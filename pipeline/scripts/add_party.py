@@ -5,51 +5,50 @@
 import os
 import sys
 import json
-import hashlib
 import struct
 import re
+import asyncio
+import argparse
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 from slugify import slugify
 
-import fitz  # PyMuPDF
-from openai import OpenAI
 from dotenv import load_dotenv
-import sqlite_vec
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.storage.database import Database
-from src.extraction.pdf_extractor import PDFExtractor
+from src.storage.ann_index import IVFIndex
+from src.storage.chunk_search import search_chunks
+from src.analysis.openai_client import AsyncRateLimitedClient, get_shared_client
+from src.analysis.response_cache import ResponseCache
+from src.analysis.embedding_cache import EmbeddingCache
+from src.extraction.pdf_extractor import ingest_pdf
+from src.extraction.ocr_server import get_ocr_processor
 from src.analysis.llm_analyzer import LLMAnalyzer
+from src.analysis.embedding_batcher import EmbeddingBatcher
 
 # Load environment variables
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(env_path)
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared rate-limited OpenAI client (RPM/TPM buckets, retries on 429)
+openai_client = get_shared_client(os.getenv("OPENAI_API_KEY"))
 
 # Paths
 PARTIDOS_DIR = Path(__file__).parent.parent.parent / "data" / "partidos"
 DB_PATH = Path(__file__).parent.parent.parent / "data" / "database.db"
 
 
-def calculate_file_hash(file_path: Path) -> str:
-    """Calculate SHA256 hash of a file."""
-    sha256 = hashlib.sha256()
-    with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b''):
-            sha256.update(chunk)
-    return sha256.hexdigest()
-
-
-def extract_metadata_from_pdf(pdf_path: Path) -> Dict:
+def extract_metadata_from_pdf(ingest: Dict) -> Dict:
     """
     Use GPT-4o-mini to extract party metadata from PDF first pages.
 
+    Args:
+        ingest: Result of ingest_pdf() for the party's PDF
+
     Returns:
         {
             'name': 'Partido Liberación Nacional',
@@ -58,18 +57,8 @@ def extract_metadata_from_pdf(pdf_path: Path) -> Dict:
             'website': 'https://pln.or.cr' (optional)
         }
     """
-    print(f"  📄 Reading PDF: {pdf_path.name}")
-
-    # Read first 2 pages of PDF
-    doc = fitz.open(pdf_path)
-    num_pages = min(2, len(doc))
-
-    text = ""
-    for page_num in range(num_pages):
-        page = doc[page_num]
-        text += page.get_text()
-
-    doc.close()
+    # First 2 pages of PDF
+    text = "\n".join(page['text'] for page in ingest['pages'][:2])
 
     # Truncate to first 3000 characters to save tokens
     text = text[:3000]
@@ -169,16 +158,17 @@ def discover_new_parties(db: Database) -> List[Tuple[Path, Path]]:
     return new_parties
 
 
-def add_party_to_database(db: Database, metadata: Dict, pdf_path: Path, folder_path: Path) -> int:
+def add_party_to_database(db: Database, metadata: Dict, pdf_path: Path, folder_path: Path,
+                          ingest: Dict) -> int:
     """
     Add party and document to database.
 
+    Args:
+        ingest: Result of ingest_pdf() for the party's PDF (hash and page count)
+
     Returns:
         party_id
     """
-    # Calculate file stats
-    file_hash = calculate_file_hash(pdf_path)
-    file_size = pdf_path.stat().st_size
 
     with db.get_connection() as conn:
         cursor = conn.cursor()
@@ -198,11 +188,6 @@ def add_party_to_database(db: Database, metadata: Dict, pdf_path: Path, folder_p
 
         party_id = cursor.lastrowid
 
-        # Count pages
-        doc = fitz.open(pdf_path)
-        page_count = len(doc)
-        doc.close()
-
         # Insert document
         cursor.execute("""
             INSERT INTO documents (
@@ -220,8 +205,8 @@ def add_party_to_database(db: Database, metadata: Dict, pdf_path: Path, folder_p
             f"Plan de Gobierno {metadata['name']} 2026",
             'plan_gobierno',
             str(pdf_path.absolute()),
-            file_hash,
-            page_count,
+            ingest['sha256'],
+            ingest['page_count'],
             datetime.now().isoformat()
         ))
 
@@ -234,6 +219,37 @@ def generate_embeddings_for_party(db: Database, party_id: int):
     """Generate embeddings for a specific party's document pages."""
     print(f"  📊 Generating embeddings...")
 
+    items = party_chunks(db, party_id)
+    if not items:
+        return
+
+    # Generate embeddings with multi-input requests
+    batcher = EmbeddingBatcher(openai_client, model="text-embedding-3-small")
+    store_party_embeddings(db, items, batcher.embed(items), batcher)
+
+
+async def generate_embeddings_for_party_async(db: Database, party_id: int, client: AsyncRateLimitedClient,
+                                              write_lock: asyncio.Lock):
+    """asyncio version of generate_embeddings_for_party (batches are requested concurrently)."""
+    print(f"  📊 Generating embeddings...")
+
+    items = await asyncio.to_thread(party_chunks, db, party_id)
+    if not items:
+        return
+
+    batcher = EmbeddingBatcher(client, model="text-embedding-3-small")
+    results = await batcher.embed_async(items)
+    async with write_lock:
+        await asyncio.to_thread(store_party_embeddings, db, items, results, batcher)
+
+
+def party_chunks(db: Database, party_id: int) -> List[Tuple[Tuple[int, int], str]]:
+    """
+    Chunk the party's document pages that have no embeddings yet.
+
+    Returns:
+        ((page_id, chunk_index), chunk_text) items for the embedding batcher
+    """
     # Get document
     with db.get_connection() as conn:
         cursor = conn.cursor()
@@ -242,7 +258,7 @@ def generate_embeddings_for_party(db: Database, party_id: int):
 
         if not doc_row:
             print(f"  ❌ No document found for party_id {party_id}")
-            return
+            return []
 
         document_id = doc_row[0]
 
@@ -259,13 +275,12 @@ def generate_embeddings_for_party(db: Database, party_id: int):
 
     if not pages:
         print(f"  ℹ️  All pages already have embeddings")
-        return
+        return []
 
     print(f"  📄 Processing {len(pages)} pages...")
 
-    total_tokens = 0
-    total_chunks = 0
-
+    # Chunk every page first so chunks can be packed into batched requests
+    items = []
     for page_id, page_num, raw_text in pages:
         # Adaptive chunking strategy
         text_length = len(raw_text)
@@ -292,59 +307,113 @@ def generate_embeddings_for_party(db: Database, party_id: int):
                 chunks.append(raw_text[start:end])
                 start = end - overlap
 
-        # Generate embeddings for each chunk
         for chunk_index, chunk_text in enumerate(chunks):
             if len(chunk_text.strip()) < 50:
                 continue
+            items.append(((page_id, chunk_index), chunk_text))
 
-            # Call OpenAI embeddings API
-            response = openai_client.embeddings.create(
-                model="text-embedding-3-small",
-                input=chunk_text
-            )
+    return items
+
+
+def store_party_embeddings(db: Database, items: List[Tuple[Tuple[int, int], str]], results: Dict,
+                           batcher: EmbeddingBatcher):
+    """Save the embedded chunks in one transaction and report the totals."""
+    rows = []
+    for (page_id, chunk_index), chunk_text in items:
+        if (page_id, chunk_index) not in results:
+            print(f"  ❌ Embedding failed for page id {page_id}, chunk {chunk_index}: "
+                  f"{batcher.failures.get((page_id, chunk_index))}")
+            continue
+
+        embedding, token_count = results[(page_id, chunk_index)]
+
+        # Serialize embedding as binary
+        embedding_blob = struct.pack(f'{len(embedding)}f', *embedding)
 
-            embedding = response.data[0].embedding
-            token_count = response.usage.total_tokens
-
-            # Serialize embedding as binary
-            embedding_blob = struct.pack(f'{len(embedding)}f', *embedding)
-
-            # Store in database
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO document_embeddings (
-                        document_text_id,
-                        chunk_index,
-                        chunk_text,
-                        embedding,
-                        embedding_model,
-                        token_count,
-                        created_at
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    page_id,
-                    chunk_index,
-                    chunk_text,
-                    embedding_blob,
-                    'text-embedding-3-small',
-                    token_count,
-                    datetime.now().isoformat()
-                ))
-                conn.commit()
-
-            total_tokens += token_count
-            total_chunks += 1
+        rows.append({
+            'document_text_id': page_id,
+            'chunk_index': chunk_index,
+            'chunk_text': chunk_text,
+            'embedding': embedding_blob,
+            'embedding_model': 'text-embedding-3-small',
+            'token_count': token_count
+        })
+
+    # Store all chunks in one transaction
+    if rows:
+        db.save_embeddings_bulk(rows)
+
+    total_tokens = sum(row['token_count'] for row in rows)
+    total_chunks = len(rows)
 
     cost = (total_tokens / 1_000_000) * 0.020
-    print(f"  ✅ Generated {total_chunks} embeddings ({total_tokens:,} tokens, ${cost:.4f})")
+    print(f"  ✅ Generated {total_chunks} embeddings in {batcher.requests_made} requests "
+          f"({total_tokens:,} tokens, ${cost:.4f})")
 
 
 def run_category_analysis(db: Database, party_id: int):
     """Run LLM analysis for all categories using semantic search."""
     print(f"  🔍 Running category analysis with semantic search...")
 
+    party_name, document_id, categories, search_results = analysis_inputs(db, party_id)
+    total_categories = len(categories)
+
+    for idx, (category_id, category_name, category_description) in enumerate(categories, 1):
+        print(f"  [{idx}/{total_categories}] {category_name}...", end=" ")
+
+        try:
+            chunks = search_results[category_name]
+
+            if not chunks:
+                print("⚠️  No relevant chunks found")
+                continue
+
+            # Generate summary
+            result = generate_summary(chunks, category_name, party_name)
+
+            # Update database
+            save_position(db, party_id, document_id, category_id, result, chunks)
+
+            print(f"✅ {len(result['key_proposals'])} proposals")
+
+        except Exception as e:
+            print(f"❌ Error: {str(e)}")
+            continue
+
+
+async def run_category_analysis_async(db: Database, party_id: int, client: AsyncRateLimitedClient,
+                                      write_lock: asyncio.Lock):
+    """asyncio version of run_category_analysis (all categories are requested concurrently)."""
+    print(f"  🔍 Running category analysis with semantic search...")
+
+    party_name, document_id, categories, search_results = await asyncio.to_thread(analysis_inputs, db, party_id)
+
+    async def analyze(category_id, category_name):
+        chunks = search_results[category_name]
+        if not chunks:
+            print(f"  {category_name}: ⚠️  No relevant chunks found")
+            return
+
+        try:
+            response = await client.chat.completions.create(**summary_request(chunks, category_name, party_name))
+            result = parse_summary(response)
+            async with write_lock:
+                await asyncio.to_thread(save_position, db, party_id, document_id, category_id, result, chunks)
+        except Exception as e:
+            print(f"  {category_name}: ❌ Error: {str(e)}")
+            return
+        print(f"  {category_name}: ✅ {len(result['key_proposals'])} proposals")
+
+    await asyncio.gather(*(analyze(category_id, category_name) for category_id, category_name, _ in categories))
+
+
+def analysis_inputs(db: Database, party_id: int):
+    """
+    Load what the category analysis of a party needs and run its semantic searches.
+
+    Returns:
+        (party_name, document_id, categories rows, category name → chunks)
+    """
     # Category-specific search queries
     CATEGORY_QUERIES = {
         'Educación': 'propuestas sobre educación, escuelas, colegios, universidades, maestros, profesores, estudiantes, sistema educativo, primera infancia, MEP',
@@ -376,103 +445,68 @@ def run_category_analysis(db: Database, party_id: int):
         cursor.execute("SELECT id, name, description FROM categories WHERE active = 1 ORDER BY display_order")
         categories = cursor.fetchall()
 
-    total_categories = len(categories)
-
-    for idx, (category_id, category_name, category_description) in enumerate(categories, 1):
-        print(f"  [{idx}/{total_categories}] {category_name}...", end=" ")
-
-        try:
-            # Generate search query
-            query = CATEGORY_QUERIES.get(category_name, f"{category_name} {category_description}")
-
-            # Perform semantic search
-            chunks = semantic_search(db, query, party_id, limit=15)
-
-            if not chunks:
-                print("⚠️  No relevant chunks found")
-                continue
-
-            # Generate summary
-            result = generate_summary(chunks, category_name, party_name)
-
-            # Update database
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO party_positions (
-                        party_id,
-                        document_id,
-                        category_id,
-                        summary,
-                        key_proposals,
-                        ideology_position,
-                        budget_mentioned
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    party_id,
-                    document_id,
-                    category_id,
-                    result['summary'],
-                    json.dumps(result['key_proposals'], ensure_ascii=False),
-                    result['ideology_position'],
-                    result['budget_mentioned']
-                ))
-                conn.commit()
+    # Search all categories together (through the ANN index, if one has been built)
+    queries = {
+        category_name: CATEGORY_QUERIES.get(category_name, f"{category_name} {category_description}")
+        for _, category_name, category_description in categories
+    }
+    search_results = semantic_search_many(db, queries, party_id, limit=15)
+    return party_name, document_id, categories, search_results
 
-            print(f"✅ {len(result['key_proposals'])} proposals")
 
-        except Exception as e:
-            print(f"❌ Error: {str(e)}")
-            continue
+def save_position(db: Database, party_id: int, document_id: int, category_id: int, result: Dict,
+                  chunks: List[Dict]):
+    """Insert the party's position for a category, with the pages of the chunks it was based on."""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO party_positions (
+                party_id,
+                document_id,
+                category_id,
+                summary,
+                key_proposals,
+                ideology_position,
+                budget_mentioned,
+                context_pages
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            party_id,
+            document_id,
+            category_id,
+            result['summary'],
+            json.dumps(result['key_proposals'], ensure_ascii=False),
+            result['ideology_position'],
+            result['budget_mentioned'],
+            json.dumps(sorted({chunk['page_number'] for chunk in chunks}))
+        ))
+        conn.commit()
 
 
-def semantic_search(db: Database, query: str, party_id: int, limit: int = 15) -> List[Dict]:
-    """Perform semantic search for relevant content."""
-    # Generate query embedding
+def semantic_search_many(db: Database, queries: Dict[str, str], party_id: int,
+                         limit: int = 15) -> Dict[str, List[Dict]]:
+    """Find relevant content for every category query with one embedding request."""
+    names = list(queries)
     response = openai_client.embeddings.create(
         model="text-embedding-3-small",
-        input=query,
+        input=[queries[name] for name in names],
     )
-    embedding = response.data[0].embedding
-    query_embedding = struct.pack(f'{len(embedding)}f', *embedding)
-
-    sql = """
-        SELECT
-            dt.page_number,
-            de.chunk_text,
-            vec_distance_cosine(de.embedding, ?) as distance
-        FROM document_embeddings de
-        JOIN document_text dt ON de.document_text_id = dt.id
-        JOIN documents d ON dt.document_id = d.id
-        WHERE d.party_id = ?
-        ORDER BY distance ASC
-        LIMIT ?
-    """
-
-    with db.get_connection() as conn:
-        # Load sqlite-vec extension
-        conn.enable_load_extension(True)
-        sqlite_vec.load(conn)
-        conn.enable_load_extension(False)
+    by_index = {item.index: item.embedding for item in response.data}
+    embeddings = {name: by_index[i] for i, name in enumerate(names)}
 
-        cursor = conn.cursor()
-        cursor.execute(sql, (query_embedding, party_id, limit))
-
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'page_number': row[0],
-                'chunk_text': row[1],
-                'distance': row[2],
-                'similarity': 1 - row[2]
-            })
-
-    return results
+    results = search_chunks(db, embeddings, [party_id], k=limit)
+    return {name: results[(party_id, name)] for name in names}
 
 
 def generate_summary(chunks: List[Dict], category_name: str, party_name: str) -> Dict:
     """Generate summary using GPT-4o with focused context from semantic search."""
+    response = openai_client.chat.completions.create(**summary_request(chunks, category_name, party_name))
+    return parse_summary(response)
+
+
+def summary_request(chunks: List[Dict], category_name: str, party_name: str) -> Dict:
+    """Chat completion parameters summarizing a party's position on a category from its chunks."""
     # Build context from chunks
     context = f"Información relevante sobre {category_name} de la plataforma de {party_name}:\n\n"
     for i, chunk in enumerate(chunks, 1):
@@ -497,16 +531,19 @@ IMPORTANTE:
 - key_proposals debe ser un array de strings, no objetos
 - Responde SOLO con el JSON, sin markdown ni texto adicional"""
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    return {
+        'model': "gpt-4o",
+        'messages': [
             {"role": "system", "content": "Eres un analista político experto en Costa Rica. Respondes únicamente con JSON válido."},
             {"role": "user", "content": prompt}
         ],
-        temperature=0.3,
-        response_format={"type": "json_object"}
-    )
+        'temperature': 0.3,
+        'response_format': {"type": "json_object"}
+    }
 
+
+def parse_summary(response) -> Dict:
+    """Structured summary from the response to a summary_request."""
     result = json.loads(response.choices[0].message.content)
 
     return {
@@ -530,12 +567,56 @@ def process_new_party(db: Database, folder_path: Path, pdf_path: Path):
     6. Generate embeddings
     7. Run category analysis
     """
+    party_id, metadata = ingest_new_party(db, folder_path, pdf_path)
+
+    # Step 6: Generate embeddings
+    generate_embeddings_for_party(db, party_id)
+
+    # Step 7: Run category analysis
+    run_category_analysis(db, party_id)
+
+    print(f"\n✅ Complete! Party '{metadata['name']}' ({metadata['abbreviation']}) added and analyzed")
+
+
+async def process_new_party_async(db: Database, folder_path: Path, pdf_path: Path, client: AsyncRateLimitedClient,
+                                  ingest_slot: asyncio.Semaphore, write_lock: asyncio.Lock):
+    """
+    asyncio version of process_new_party.
+
+    Steps 1-5 (PDF reading, metadata, OCR, database inserts) run in a
+    worker thread, one party at a time (ingest_slot), so only one OCR
+    reader is loaded. Embedding and analysis requests then run on the
+    event loop, overlapping with the next party's ingest.
+    """
+    async with ingest_slot:
+        party_id, metadata = await asyncio.to_thread(ingest_new_party, db, folder_path, pdf_path)
+
+    # Step 6: Generate embeddings
+    await generate_embeddings_for_party_async(db, party_id, client, write_lock)
+
+    # Step 7: Run category analysis
+    await run_category_analysis_async(db, party_id, client, write_lock)
+
+    print(f"\n✅ Complete! Party '{metadata['name']}' ({metadata['abbreviation']}) added and analyzed")
+
+
+def ingest_new_party(db: Database, folder_path: Path, pdf_path: Path) -> Tuple[int, Dict]:
+    """
+    Steps 1-5 of process_new_party: metadata, renames, metadata.json, database rows and page text.
+
+    Returns:
+        (party_id, metadata)
+    """
     print(f"\n{'=' * 80}")
     print(f"📦 Processing: {folder_path.name}")
     print(f"{'=' * 80}")
 
+    # Read the PDF once: hash, page count, page text and OCR classification
+    print(f"  📄 Reading PDF: {pdf_path.name}")
+    ingest = ingest_pdf(pdf_path, logos=False)
+
     # Step 1: Extract metadata
-    metadata = extract_metadata_from_pdf(pdf_path)
+    metadata = extract_metadata_from_pdf(ingest)
 
     # Step 2: Generate standard folder name
     standard_folder_name = generate_folder_name(metadata['abbreviation'], metadata['name'])
@@ -567,8 +648,8 @@ def process_new_party(db: Database, folder_path: Path, pdf_path: Path):
         },
         "pdf": {
             "filename": standard_pdf_name,
-            "file_hash": calculate_file_hash(pdf_path),
-            "file_size": pdf_path.stat().st_size
+            "file_hash": ingest['sha256'],
+            "file_size": ingest['file_size']
         },
         "metadata": {
             "added_date": datetime.now().isoformat(),
@@ -585,44 +666,84 @@ def process_new_party(db: Database, folder_path: Path, pdf_path: Path):
 
     # Step 4: Add to database
     print(f"  💾 Adding to database...")
-    party_id = add_party_to_database(db, metadata, pdf_path, folder_path)
+    party_id = add_party_to_database(db, metadata, pdf_path, folder_path, ingest)
     print(f"  ✅ Party added (ID: {party_id})")
 
-    # Step 5: Extract text from PDF
-    print(f"  📖 Extracting text from PDF...")
-    extractor = PDFExtractor(db)
+    # Step 5: Save text extracted by the ingest pass
+    print(f"  📖 Saving extracted text...")
 
     with db.get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT id FROM documents WHERE party_id = ?", (party_id,))
         document_id = cursor.fetchone()[0]
 
-    extractor.extract_document(document_id)
-    print(f"  ✅ Text extraction complete")
+    db.save_extracted_pages(
+        document_id=document_id,
+        pages=[page for page in ingest['pages'] if not page['needs_ocr']],
+        extraction_method='pymupdf'
+    )
 
-    # Step 6: Generate embeddings
-    generate_embeddings_for_party(db, party_id)
+    # Scanned pages have no text layer: OCR only those
+    if ingest['ocr_pages']:
+        print(f"  🔍 OCR for {len(ingest['ocr_pages'])} scanned pages...")
+        ocr_processor = get_ocr_processor(languages=['es', 'en'])
+        content_hashes = {page['page_number']: page['content_hash'] for page in ingest['pages']}
+        try:
+            for page in ocr_processor.iter_pages(pdf_path, pages=ingest['ocr_pages']):
+                page['content_hash'] = content_hashes[page['page_number']]
+                db.save_extracted_pages(document_id, [page], extraction_method='easyocr')
+        finally:
+            ocr_processor.close()
+    print(f"  ✅ Text extraction complete ({ingest['page_count']} pages)")
+    return party_id, metadata
 
-    # Step 7: Run category analysis
-    run_category_analysis(db, party_id)
 
-    print(f"\n✅ Complete! Party '{metadata['name']}' ({metadata['abbreviation']}) added and analyzed")
+async def process_new_parties_async(db: Database, new_parties: List[Tuple[Path, Path]]):
+    """Process all new parties on one event loop (see process_new_party_async)."""
+    ingest_slot = asyncio.Semaphore(1)
+    write_lock = asyncio.Lock()
+
+    async def process(folder, pdf):
+        try:
+            await process_new_party_async(db, folder, pdf, client, ingest_slot, write_lock)
+        except Exception as e:
+            print(f"\n❌ ERROR processing {folder.name}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+    async with AsyncRateLimitedClient(openai_client) as client:
+        await asyncio.gather(*(process(folder, pdf) for folder, pdf in new_parties))
+    print(f"\n⚡ Peak requests in flight: "
+          f"{', '.join(f'{endpoint} {peak}' for endpoint, peak in client.peak_in_flight.items())}")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Discover new party PDFs and run the full analysis pipeline")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Overlap parties' embedding and analysis requests on one asyncio event loop")
+    args = parser.parse_args()
+
     print("🔍 Discovering New Parties")
     print("=" * 80)
     print(f"Scanning: {PARTIDOS_DIR}")
     print(f"Database: {DB_PATH}\n")
 
     # Initialize database
-    db = Database(str(DB_PATH))
+    db = Database(str(DB_PATH), persistent=True)
+
+    # Metadata extraction and summaries reuse responses recorded by earlier runs;
+    # unchanged chunks of a re-ingested PDF and repeated queries reuse embeddings
+    openai_client.cache = ResponseCache(db)
+    openai_client.embedding_cache = EmbeddingCache(db)
+    # New embeddings are added to the ANN index, if one has been built
+    db.ann_index = IVFIndex.open(db)
 
     # Discover new parties
     new_parties = discover_new_parties(db)
 
     if not new_parties:
         print("✅ No new parties found. All parties are up to date!")
+        db.close()
         return
 
     print(f"📋 Found {len(new_parties)} new part{'y' if len(new_parties) == 1 else 'ies'}:\n")
@@ -641,23 +762,29 @@ def main():
     response = input("\n Continue with full analysis? [y/N] ")
     if response.lower() != 'y':
         print("Aborted.")
+        db.close()
         return
 
     # Process each new party
     start_time = datetime.now()
 
-    for idx, (folder, pdf) in enumerate(new_parties, 1):
-        print(f"\n\n{'#' * 80}")
-        print(f"# Party {idx}/{len(new_parties)}")
-        print(f"{'#' * 80}")
+    if args.use_async:
+        asyncio.run(process_new_parties_async(db, new_parties))
+    else:
+        for idx, (folder, pdf) in enumerate(new_parties, 1):
+            print(f"\n\n{'#' * 80}")
+            print(f"# Party {idx}/{len(new_parties)}")
+            print(f"{'#' * 80}")
+
+            try:
+                process_new_party(db, folder, pdf)
+            except Exception as e:
+                print(f"\n❌ ERROR processing {folder.name}: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                continue
 
-        try:
-            process_new_party(db, folder, pdf)
-        except Exception as e:
-            print(f"\n❌ ERROR processing {folder.name}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            continue
+    db.close()
 
     # Summary
     elapsed = (datetime.now() - start_time).total_seconds()
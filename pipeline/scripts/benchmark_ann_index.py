@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks the per-party IVF index against exact search: recall@k, latency and fallback rate per nprobe
+# ABOUTME: Measures the per-party search_chunks path; clustered synthetic embeddings, or an existing database via --db
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.storage.database import Database
+from src.storage.vector_index import VectorIndex
+from src.storage.ann_index import IVFIndex
+from src.storage.chunk_search import search_chunks, short_parties
+
+
+def synthetic_embeddings(count: int, dimensions: int, topics: int, seed: int = 42):
+    """Embeddings clustered around topics, like chunks of many documents on shared themes."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    labels = rng.integers(0, topics, count)
+    vectors = centres[labels] + 0.9 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors, centres
+
+
+def per_party_benchmark(ann: IVFIndex, exact: VectorIndex, queries: np.ndarray, k: int, group: int,
+                        db=None):
+    """
+    Recall, latency and fallback rate of per-party search, as search_chunks() runs it.
+
+    Queries are grouped like category queries (group per call) and every
+    call searches all parties. With a database, search_chunks() itself is
+    also timed with and without the index attached, including its text
+    lookups and exact fallback.
+    """
+    party_ids = sorted(exact.party_ranges)
+    calls = [{f"q{i}": query for i, query in enumerate(queries[start:start + group])}
+             for start in range(0, len(queries), group)]
+
+    start = time.perf_counter()
+    truth = [exact.search_many(call, party_ids=party_ids, k=k) for call in calls]
+    exact_ms = (time.perf_counter() - start) / len(calls) * 1000
+
+    print(f"Per-party search ({len(party_ids)} parties × {group} queries per call, "
+          f"as search_chunks runs it)\n")
+    print(f"{'search':>14s} {'recall@' + str(k):>10s} {'ms/call':>10s} {'speedup':>9s} {'fallback':>9s}")
+    print("-" * 72)
+    print(f"{'exact':>14s} {1.0:>10.3f} {exact_ms:>10.2f} {1.0:>8.1f}x {'-':>9s}")
+
+    nprobe = 1
+    while nprobe <= max(ann.party_lists(party_id) for party_id in party_ids):
+        start = time.perf_counter()
+        found = [ann.search_many(call, party_ids, k=k, nprobe=nprobe) for call in calls]
+        ann_ms = (time.perf_counter() - start) / len(calls) * 1000
+
+        recalls, short = [], 0
+        for call, hits, expected in zip(calls, found, truth):
+            short += len(short_parties(ann, hits, party_ids, call, k))
+            for pair, results in expected.items():
+                if results:
+                    matched = {r['embedding_id'] for r in hits[pair]} & {r['embedding_id'] for r in results}
+                    recalls.append(len(matched) / len(results))
+        fallback = short / (len(calls) * len(party_ids))
+        print(f"{'nprobe=' + str(nprobe):>14s} {np.mean(recalls):>10.3f} {ann_ms:>10.2f} "
+              f"{exact_ms / ann_ms:>8.1f}x {fallback:>8.1%}")
+        nprobe *= 2
+
+    if db is not None:
+        print(f"\nsearch_chunks() end to end (ANN_NPROBE={ann.nprobe}):")
+        for label, index in (("exact (loads embeddings)", None), ("ANN index", ann)):
+            db.ann_index = index
+            start = time.perf_counter()
+            for call in calls:
+                search_chunks(db, call, party_ids, k=k)
+            print(f"  {label:>26s}: {(time.perf_counter() - start) / len(calls) * 1000:.1f} ms/call")
+        db.ann_index = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall and latency against exact search")
+    parser.add_argument('--db', help='Existing database to index (default: synthetic embeddings)')
+    parser.add_argument('--embeddings', type=int, default=50_000, help='Synthetic embeddings')
+    parser.add_argument('--dimensions', type=int, default=1536)
+    parser.add_argument('--topics', type=int, default=200, help='Synthetic topic clusters')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--nlist', type=int, help='IVF lists per party (default: 4·√party size)')
+    parser.add_argument('-k', type=int, default=15)
+    parser.add_argument('--group', type=int, default=15,
+                        help='Queries per per-party search call (categories)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    db = None
+    if args.db:
+        db = Database(args.db)
+        exact = VectorIndex.from_database(db)
+        start = time.perf_counter()
+        ann = IVFIndex.build_from_database(db, nlist=args.nlist, path=None)
+        build_time = time.perf_counter() - start
+        vectors = exact.vectors
+        queries = vectors[rng.choice(len(vectors), args.queries)] \
+            + 0.05 * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+    else:
+        vectors, centres = synthetic_embeddings(args.embeddings, args.dimensions, args.topics)
+        ids = np.arange(1, len(vectors) + 1)
+        party_ids = (ids % 20) + 1
+        exact = VectorIndex(vectors, ids, party_ids, np.zeros(len(ids)), [''] * len(ids))
+
+        start = time.perf_counter()
+        ann = IVFIndex(args.dimensions, nlist=args.nlist)
+        ann.add(vectors, ids, party_ids)
+        build_time = time.perf_counter() - start
+        queries = centres[rng.integers(0, args.topics, args.queries)] \
+            + 0.9 * rng.standard_normal((args.queries, args.dimensions)).astype(np.float32)
+
+    print("=" * 72)
+    print("ANN Index Benchmark (per-party IVF-flat vs exact)")
+    print("=" * 72)
+    print(f"Embeddings: {len(exact):,} × {exact.dimensions}, {ann.nlist} lists over "
+          f"{len(exact.party_ranges)} parties, built in {build_time:.1f}s, "
+          f"{len(queries)} queries, k={args.k}\n")
+
+    per_party_benchmark(ann, exact, queries, args.k, args.group, db=db)
+
+    print("=" * 72)
+    print("Set ANN_NPROBE to choose the default trade-off")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks Database write throughput (rows/sec) for text and embedding inserts
+# ABOUTME: Compares per-call connections against persistent connections and transactions
+
+import os
+import sys
+import time
+import random
+import struct
+import argparse
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.storage.database import Database
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+def create_fixture(db: Database) -> int:
+    """Create a party and document to attach benchmark rows to."""
+    party_id = db.add_party(name="Partido Benchmark", abbreviation="PB", folder_name="PB-Benchmark")
+    return db.add_document(party_id=party_id, title="Plan Benchmark",
+                           file_path="/tmp/PB.pdf", file_hash="benchmark")
+
+
+def bench_extracted_text(db: Database, document_id: int, rows: int, use_transaction: bool,
+                         bulk: bool = False) -> float:
+    """Insert `rows` pages with save_extracted_text and return rows/sec."""
+    text = "Propuesta de gobierno para el desarrollo económico. " * 40
+
+    start = time.perf_counter()
+    if bulk:
+        pages = [{'page_number': n, 'text': text} for n in range(1, rows + 1)]
+        db.save_extracted_pages(document_id, pages)
+    elif use_transaction:
+        with db.transaction():
+            for page_number in range(1, rows + 1):
+                db.save_extracted_text(document_id, page_number, text)
+    else:
+        for page_number in range(1, rows + 1):
+            db.save_extracted_text(document_id, page_number, text)
+    elapsed = time.perf_counter() - start
+
+    return rows / elapsed
+
+
+def bench_embeddings(db: Database, rows: int, use_transaction: bool, bulk: bool = False) -> float:
+    """Insert `rows` embeddings with save_embedding and return rows/sec."""
+    vector = [random.random() for _ in range(EMBEDDING_DIMENSIONS)]
+    blob = struct.pack(f'{len(vector)}f', *vector)
+    chunk = "Fragmento de texto del plan de gobierno. " * 30
+
+    start = time.perf_counter()
+    if bulk:
+        db.save_embeddings_bulk([
+            {'document_text_id': i + 1, 'chunk_index': 0, 'chunk_text': chunk,
+             'embedding': blob, 'token_count': 350}
+            for i in range(rows)
+        ])
+    elif use_transaction:
+        with db.transaction():
+            for i in range(rows):
+                db.save_embedding(i + 1, 0, chunk, blob, token_count=350)
+    else:
+        for i in range(rows):
+            db.save_embedding(i + 1, 0, chunk, blob, token_count=350)
+    elapsed = time.perf_counter() - start
+
+    return rows / elapsed
+
+
+def run_mode(label: str, rows: int, persistent: bool, use_transaction: bool, bulk: bool = False):
+    """Run both benchmarks against a fresh temporary database."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = Database(os.path.join(tmp_dir, "benchmark.db"), persistent=persistent)
+        document_id = create_fixture(db)
+
+        text_rate = bench_extracted_text(db, document_id, rows, use_transaction, bulk)
+        embedding_rate = bench_embeddings(db, rows, use_transaction, bulk)
+
+        db.close()
+
+    print(f"{label:38s} {text_rate:>12,.0f} {embedding_rate:>14,.0f}")
+    return text_rate, embedding_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Database insert throughput")
+    parser.add_argument('--rows', type=int, default=2000, help='Rows to insert per benchmark')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("Database Write Benchmark")
+    print("=" * 70)
+    print(f"Rows per benchmark: {args.rows:,}\n")
+    print(f"{'Mode':38s} {'text rows/s':>12s} {'embed rows/s':>14s}")
+    print("-" * 70)
+
+    baseline = run_mode("per-call connection (default)", args.rows,
+                        persistent=False, use_transaction=False)
+    run_mode("persistent connection", args.rows,
+             persistent=True, use_transaction=False)
+    pooled = run_mode("persistent connection + transaction()", args.rows,
+                      persistent=True, use_transaction=True)
+    bulk = run_mode("bulk executemany (default connection)", args.rows,
+                    persistent=False, use_transaction=False, bulk=True)
+
+    print("-" * 70)
+    print(f"Speedup (save_extracted_text): {pooled[0] / baseline[0]:.1f}x pooled, "
+          f"{bulk[0] / baseline[0]:.1f}x bulk")
+    print(f"Speedup (save_embedding):      {pooled[1] / baseline[1]:.1f}x pooled, "
+          f"{bulk[1] / baseline[1]:.1f}x bulk")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
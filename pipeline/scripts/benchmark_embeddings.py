@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks per-chunk vs batched embedding requests against a local stand-in API
+# ABOUTME: Reports requests/sec and wall time, and checks results map back to the right chunks
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+from openai import OpenAI
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.analysis.embedding_batcher import EmbeddingBatcher
+from scripts.openai_standin import StandInServer, fake_embedding
+
+WORDS = ("propuesta gobierno educación salud economía seguridad empleo ambiente vivienda "
+         "infraestructura tecnología corrupción cultura agricultura desarrollo").split()
+
+
+def make_chunks(count: int, chunk_chars: int):
+    """Generate (document_text_id, chunk_index) → text items like the chunker produces."""
+    rng = random.Random(42)
+    items = []
+    for i in range(count):
+        words = []
+        while sum(len(w) + 1 for w in words) < chunk_chars:
+            words.append(rng.choice(WORDS))
+        items.append(((i // 3 + 1, i % 3), f"[{i}] " + " ".join(words)))
+    return items
+
+
+def verify(results, items, dimensions: int) -> int:
+    """Count results whose vector matches the stand-in's vector for that chunk's text."""
+    correct = 0
+    for key, text in items:
+        if key in results:
+            expected = fake_embedding(text, dimensions)
+            if all(abs(a - b) < 1e-6 for a, b in zip(results[key][0], expected)):
+                correct += 1
+    return correct
+
+
+def report(label: str, requests: int, elapsed: float, embedded: int, correct: int):
+    print(f"{label:24s} {requests:>9,d} {elapsed:>9.2f}s {requests / elapsed:>10.1f} "
+          f"{embedded / elapsed:>12.1f} {correct:>8,d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched embedding requests")
+    parser.add_argument('--chunks', type=int, default=500, help='Number of chunks to embed')
+    parser.add_argument('--chunk-chars', type=int, default=1500, help='Characters per chunk')
+    parser.add_argument('--latency', type=float, default=0.03, help='Simulated seconds per request')
+    parser.add_argument('--dimensions', type=int, default=256, help='Stand-in embedding size')
+    args = parser.parse_args()
+
+    items = make_chunks(args.chunks, args.chunk_chars)
+    poisoned_key, poisoned_text = items[len(items) // 2]
+    poison = "<<invalid>>"
+    items[len(items) // 2] = (poisoned_key, poisoned_text + poison)
+
+    server = StandInServer(latency=args.latency, dimensions=args.dimensions,
+                           poison_text=poison).start()
+    client = OpenAI(api_key="standin", base_url=server.url, max_retries=0)
+
+    print("=" * 78)
+    print("Embedding Request Benchmark (local stand-in API)")
+    print("=" * 78)
+    print(f"Chunks: {len(items):,} × ~{args.chunk_chars} chars, "
+          f"simulated latency {args.latency * 1000:.0f} ms/request")
+    print(f"One chunk ({poisoned_key}) is rejected by the server to exercise partial failures\n")
+    print(f"{'Mode':24s} {'requests':>9s} {'wall':>10s} {'req/s':>10s} {'chunks/s':>12s} {'correct':>8s}")
+    print("-" * 78)
+
+    # One request per chunk (previous behaviour)
+    server.reset_stats()
+    results = {}
+    start = time.perf_counter()
+    for key, text in items:
+        try:
+            response = client.embeddings.create(input=text, model="text-embedding-3-small")
+            results[key] = (response.data[0].embedding, response.usage.total_tokens)
+        except Exception:
+            pass
+    elapsed = time.perf_counter() - start
+    report("per-chunk", server.stats['requests'], elapsed, len(results),
+           verify(results, items, args.dimensions))
+
+    # Token-budgeted batches
+    server.reset_stats()
+    batcher = EmbeddingBatcher(client, retry_delay=0.0)
+    start = time.perf_counter()
+    results = batcher.embed(items)
+    elapsed = time.perf_counter() - start
+    report("batched", server.stats['requests'], elapsed, len(results),
+           verify(results, items, args.dimensions))
+
+    print("-" * 78)
+    print(f"Failed keys after retries: {sorted(batcher.failures)}")
+    print("=" * 78)
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks serial vs multiprocess PDF text extraction over the party PDFs
+# ABOUTME: Reports pages/sec per mode and checks both modes return identical pages
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.extraction.pdf_extractor import PDFExtractor
+
+PARTIDOS_DIR = Path(__file__).parent.parent.parent / "data" / "partidos"
+
+
+def run(extractor: PDFExtractor, pdf_paths):
+    """Extract every PDF; return (seconds, total pages, results)."""
+    results = []
+    start = time.perf_counter()
+    for pdf_path in pdf_paths:
+        pages = list(extractor.iter_pages(pdf_path))
+        results.append({'page_count': len(pages), 'pages': pages})
+    return time.perf_counter() - start, sum(r['page_count'] for r in results), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multiprocess PDF extraction")
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--pattern', default='*/*.pdf', help='Glob under data/partidos')
+    args = parser.parse_args()
+
+    pdf_paths = sorted(PARTIDOS_DIR.glob(args.pattern))
+    if not pdf_paths:
+        print(f"❌ No PDFs found in {PARTIDOS_DIR}")
+        sys.exit(1)
+
+    serial = PDFExtractor(workers=1)
+    parallel = PDFExtractor(workers=args.workers)
+
+    print("=" * 70)
+    print("PDF Extraction Benchmark")
+    print("=" * 70)
+    print(f"PDFs: {len(pdf_paths)} from {PARTIDOS_DIR}")
+    print(f"Parallel mode: up to {parallel.workers} worker process(es), "
+          f"≥{PDFExtractor.MIN_PAGES_PER_WORKER} pages each\n")
+
+    # Warm the page cache and the worker pool so neither mode pays for it
+    run(parallel, pdf_paths[:1])
+
+    serial_time, pages, serial_results = run(serial, pdf_paths)
+    parallel_time, _, parallel_results = run(parallel, pdf_paths)
+    parallel.close()
+
+    identical = sum(
+        [(p['page_number'], p['text']) for p in a['pages']] == [(p['page_number'], p['text']) for p in b['pages']]
+        for a, b in zip(serial_results, parallel_results)
+    )
+
+    print(f"{'Mode':12s} {'wall':>10s} {'pages/s':>10s}")
+    print("-" * 70)
+    print(f"{'serial':12s} {serial_time:>9.2f}s {pages / serial_time:>10.1f}")
+    print(f"{'parallel':12s} {parallel_time:>9.2f}s {pages / parallel_time:>10.1f}")
+    print("-" * 70)
+    print(f"Pages: {pages:,}   Speedup: {serial_time / parallel_time:.2f}x   "
+          f"Identical output: {identical}/{len(pdf_paths)} PDFs")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks the single-pass PDF ingest against reading each PDF once per consumer
+# ABOUTME: Separate passes: hash, metadata pages, text extraction, info, logos (as before ingest_pdf)
+
+import sys
+import time
+import hashlib
+import argparse
+from pathlib import Path
+
+import pymupdf
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.extraction.pdf_extractor import (
+    LOGO_MIN_BYTES, LOGO_PAGES, MAX_LOGOS, extract_pages, ingest_pdf
+)
+
+PARTIDOS_DIR = Path(__file__).parent.parent.parent / "data" / "partidos"
+
+
+def separate_passes(pdf_path: Path) -> str:
+    """Each consumer opens and reads the PDF itself. Returns the sha256."""
+    # File hash
+    sha256 = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8192), b''):
+            sha256.update(chunk)
+
+    # Metadata prompt: first 2 pages
+    doc = pymupdf.open(pdf_path)
+    for page_num in range(min(2, len(doc))):
+        doc[page_num].get_text()
+    doc.close()
+
+    # Page count / metadata
+    doc = pymupdf.open(pdf_path)
+    page_count = len(doc)
+    dict(doc.metadata)
+    doc.close()
+
+    # Text extraction and OCR classification
+    extract_pages(str(pdf_path), range(page_count))
+
+    # Logo candidates
+    doc = pymupdf.open(pdf_path)
+    logos = 0
+    for page_num in range(min(LOGO_PAGES, len(doc))):
+        for img in doc[page_num].get_images():
+            if logos < MAX_LOGOS and len(doc.extract_image(img[0])["image"]) >= LOGO_MIN_BYTES:
+                logos += 1
+    doc.close()
+
+    return sha256.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-pass PDF ingest")
+    parser.add_argument('--pattern', default='*/*.pdf', help='Glob under data/partidos')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per mode (best is reported)')
+    args = parser.parse_args()
+
+    pdf_paths = sorted(PARTIDOS_DIR.glob(args.pattern))
+    if not pdf_paths:
+        print(f"❌ No PDFs found in {PARTIDOS_DIR}")
+        sys.exit(1)
+
+    def best_of(fn):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results = [fn(pdf_path) for pdf_path in pdf_paths]
+            timings.append(time.perf_counter() - start)
+        return min(timings), results
+
+    # Warm the page cache so both modes read from memory
+    for pdf_path in pdf_paths:
+        pdf_path.read_bytes()
+
+    separate_time, separate_hashes = best_of(separate_passes)
+    ingest_time, ingests = best_of(ingest_pdf)
+
+    pages = sum(ingest['page_count'] for ingest in ingests)
+    matching = sum(ingest['sha256'] == sha for ingest, sha in zip(ingests, separate_hashes))
+
+    print("=" * 70)
+    print("PDF Ingest Benchmark")
+    print("=" * 70)
+    print(f"PDFs: {len(pdf_paths)} ({pages:,} pages) from {PARTIDOS_DIR}\n")
+    print(f"{'Mode':18s} {'wall':>10s} {'pages/s':>10s}")
+    print("-" * 70)
+    print(f"{'separate passes':18s} {separate_time:>9.2f}s {pages / separate_time:>10.1f}")
+    print(f"{'single pass':18s} {ingest_time:>9.2f}s {pages / ingest_time:>10.1f}")
+    print("-" * 70)
+    print(f"Speedup: {separate_time / ingest_time:.2f}x   "
+          f"Matching hashes: {matching}/{len(pdf_paths)}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
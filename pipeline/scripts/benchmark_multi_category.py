@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks one request per category vs shared multi-category requests against a local stand-in API
+# ABOUTME: Reports prompt/completion tokens, requests and wall time per plan document
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+from openai import OpenAI
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.extraction.pdf_extractor import ingest_pdf
+from src.analysis.llm_analyzer import LLMAnalyzer
+from src.analysis.openai_client import RateLimitedClient
+from src.analysis.retrieval import DocumentIndex
+from scripts.openai_standin import StandInServer
+
+
+def load_categories(pipeline_root: Path):
+    """Categories from config, keyed like the database rows."""
+    with open(pipeline_root / "config" / "categories.json", encoding='utf-8') as f:
+        categories = json.load(f)['categories']
+    return [dict(category, category_key=category['id']) for category in categories]
+
+
+def run(analyzer: LLMAnalyzer, server: StandInServer, index: DocumentIndex, categories, grouped: bool):
+    """Analyze all categories of one document. Returns (seconds, prompt, completion, requests)."""
+    server.reset_stats()
+    start = time.perf_counter()
+    if grouped:
+        analyses = list(analyzer.analyze_document_for_categories('', categories, 'Partido', document_index=index).values())
+    else:
+        analyses = [analyzer.analyze_document_for_category('', category, 'Partido', document_index=index)
+                    for category in categories]
+    elapsed = time.perf_counter() - start
+    return (elapsed,
+            sum(a['prompt_tokens'] for a in analyses),
+            sum(a['completion_tokens'] for a in analyses),
+            server.stats['requests'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-category LLM requests")
+    parser.add_argument('pdfs', type=Path, nargs='*', help='Plan PDFs (default: first 4 in data/partidos)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Simulated seconds per request')
+    args = parser.parse_args()
+
+    pipeline_root = Path(__file__).parent.parent
+    pdfs = args.pdfs or sorted((pipeline_root.parent / "data" / "partidos").glob("*/*.pdf"))[:4]
+    categories = load_categories(pipeline_root)
+
+    server = StandInServer(latency=args.latency).start()
+    analyzer = LLMAnalyzer(api_key='standin')
+    # Generous limits: the benchmark measures requests and tokens, not throttling
+    analyzer.client = RateLimitedClient(client=OpenAI(base_url=server.url, api_key='standin', max_retries=0),
+                                        limits={analyzer.model: (100_000, 100_000_000)})
+
+    print(f"{'Plan':8s} {'mode':9s} {'requests':>9s} {'prompt tok':>11s} {'compl tok':>10s} {'wall':>8s}")
+    print("-" * 60)
+    totals = {False: [0.0, 0, 0, 0], True: [0.0, 0, 0, 0]}
+    try:
+        for pdf_path in pdfs:
+            index = DocumentIndex(ingest_pdf(pdf_path, logos=False)['pages'])
+            for grouped in (False, True):
+                row = run(analyzer, server, index, categories, grouped)
+                totals[grouped] = [total + value for total, value in zip(totals[grouped], row)]
+                seconds, prompt, completion, requests = row
+                print(f"{pdf_path.stem:8s} {'grouped' if grouped else 'single':9s} {requests:>9d} "
+                      f"{prompt:>11,} {completion:>10,} {seconds:>7.2f}s")
+    finally:
+        server.stop()
+
+    single, grouped = totals[False], totals[True]
+    print("-" * 60)
+    print(f"Categories: {len(categories)}   Latency: {args.latency}s/request\n")
+    print(f"Prompt tokens: {single[1]:,} → {grouped[1]:,} ({1 - grouped[1] / single[1]:.0%} fewer)")
+    print(f"Requests:      {single[3]} → {grouped[3]}")
+    print(f"Wall time:     {single[0]:.2f}s → {grouped[0]:.2f}s ({single[0] / grouped[0]:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks OCR throughput: PNG round trip vs raw pixmap arrays, worker pool, adaptive DPI
+# ABOUTME: Reports pages/min per mode on the first pages of a scanned PDF (needs easyocr)
+
+import io
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import pymupdf
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.extraction.ocr_processor import OCRProcessor
+
+
+def run_png(processor: OCRProcessor, pdf_path: Path, page_count: int, dpi: int) -> float:
+    """Previous path: pixmap → PNG bytes → PIL image → reader. Returns seconds."""
+    doc = pymupdf.open(pdf_path)
+    start = time.perf_counter()
+    for page_num in range(page_count):
+        pix = doc[page_num].get_pixmap(dpi=dpi)
+        img = Image.open(io.BytesIO(pix.pil_tobytes(format="PNG")))
+        processor.read_image(img)
+    elapsed = time.perf_counter() - start
+    doc.close()
+    return elapsed
+
+
+def run_pages(processor: OCRProcessor, pdf_path: Path, page_count: int, dpi: int) -> float:
+    """iter_pages() over the first pages. Returns seconds."""
+    start = time.perf_counter()
+    for _ in processor.iter_pages(pdf_path, dpi=dpi, pages=range(1, page_count + 1)):
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR throughput")
+    parser.add_argument('pdf', type=Path, help='Scanned PDF to OCR')
+    parser.add_argument('--pages', type=int, default=8, help='Pages to OCR per mode')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for pool mode (default: one per CPU)')
+    parser.add_argument('--dpi', type=int, default=300)
+    args = parser.parse_args()
+
+    if not args.pdf.exists():
+        print(f"❌ File not found: {args.pdf}")
+        sys.exit(1)
+
+    with pymupdf.open(args.pdf) as doc:
+        page_count = min(args.pages, len(doc))
+
+    serial = OCRProcessor(workers=1, gpu=False)
+    pool = OCRProcessor(workers=args.workers, gpu=False)
+    adaptive = OCRProcessor(workers=1, gpu=False, adaptive=True)
+
+    # Load the serial reader (shared with adaptive mode) and the worker readers
+    # so no mode pays model start-up
+    adaptive._reader = serial.reader
+    run_pages(pool, args.pdf, min(args.workers, page_count), dpi=72)
+
+    timings = [
+        ('png serial', run_png(serial, args.pdf, page_count, args.dpi)),
+        ('array serial', run_pages(serial, args.pdf, page_count, args.dpi)),
+        (f'array pool×{args.workers}', run_pages(pool, args.pdf, page_count, args.dpi)),
+        ('adaptive serial', run_pages(adaptive, args.pdf, page_count, args.dpi)),
+    ]
+    pool.close()
+
+    baseline = timings[0][1]
+    print("\n" + "=" * 70)
+    print("OCR Benchmark")
+    print("=" * 70)
+    print(f"PDF: {args.pdf.name}   Pages: {page_count}   DPI: {args.dpi}\n")
+    print(f"{'Mode':18s} {'wall':>10s} {'pages/min':>10s} {'speedup':>8s}")
+    print("-" * 70)
+    for name, seconds in timings:
+        print(f"{name:18s} {seconds:>9.2f}s {page_count / seconds * 60:>10.1f} {baseline / seconds:>7.2f}x")
+    print("-" * 70)
+    stats = adaptive.last_run_stats
+    print(f"Adaptive ({adaptive.low_dpi} dpi first pass, retry below {adaptive.min_confidence} confidence): "
+          f"{stats['pixels'] / 1e6:.1f} MP vs {stats['full_pixels'] / 1e6:.1f} MP rendered, "
+          f"{stats['retries']} retries")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
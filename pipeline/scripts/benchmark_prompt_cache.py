@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# ABOUTME: Measures prompt-cache reuse of the category analysis prompts against a local stand-in API
+# ABOUTME: Compares per-category passages, one shared passage block, and multi-category requests
+
+import sys
+import argparse
+from pathlib import Path
+
+from openai import OpenAI
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.extraction.pdf_extractor import ingest_pdf
+from src.analysis.llm_analyzer import LLMAnalyzer
+from src.analysis.openai_client import RateLimitedClient
+from src.analysis.retrieval import DocumentIndex
+from scripts.openai_standin import StandInServer
+from scripts.benchmark_multi_category import load_categories
+
+
+def run(analyzer: LLMAnalyzer, index: DocumentIndex, categories, mode: str):
+    """Analyze all categories of one document. Returns the analyses."""
+    if mode == 'grouped':
+        return list(analyzer.analyze_document_for_categories('', categories, 'Partido',
+                                                             document_index=index).values())
+    context = analyzer.select_shared_context(index, categories) if mode == 'shared' else None
+    return [analyzer.analyze_document_for_category('', category, 'Partido', document_index=index,
+                                                   context=context)
+            for category in categories]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt-cache reuse of analysis prompts")
+    parser.add_argument('pdfs', type=Path, nargs='*', help='Plan PDFs (default: first 4 in data/partidos)')
+    args = parser.parse_args()
+
+    pipeline_root = Path(__file__).parent.parent
+    pdfs = args.pdfs or sorted((pipeline_root.parent / "data" / "partidos").glob("*/*.pdf"))[:4]
+    categories = load_categories(pipeline_root)
+    indexes = [(pdf_path.stem, DocumentIndex(ingest_pdf(pdf_path, logos=False)['pages'])) for pdf_path in pdfs]
+
+    print(f"{'mode':10s} {'requests':>9s} {'prompt tok':>11s} {'cached':>9s} {'ratio':>6s} "
+          f"{'uncached':>9s} {'input $':>8s}")
+    print("-" * 70)
+    for mode in ('category', 'shared', 'grouped'):
+        # A fresh server per mode, so no mode reuses another's cache entries
+        server = StandInServer().start()
+        analyzer = LLMAnalyzer(api_key='standin')
+        analyzer.client = RateLimitedClient(client=OpenAI(base_url=server.url, api_key='standin', max_retries=0),
+                                            limits={analyzer.model: (100_000, 100_000_000)})
+        try:
+            analyses = [analysis for _, index in indexes for analysis in run(analyzer, index, categories, mode)]
+        finally:
+            server.stop()
+
+        prompt = sum(a['prompt_tokens'] for a in analyses)
+        cached = sum(a['cached_tokens'] for a in analyses)
+        # gpt-4o input: $5/M tokens, cached at half price
+        input_cost = ((prompt - cached) * 5.0 + cached * 2.5) / 1_000_000
+        print(f"{mode:10s} {server.stats['requests']:>9d} {prompt:>11,} {cached:>9,} "
+              f"{cached / prompt:>6.0%} {prompt - cached:>9,} {input_cost:>8.3f}")
+
+    print("-" * 70)
+    print(f"Plans: {', '.join(name for name, _ in indexes)}   Categories: {len(categories)}   "
+          f"Shared block: {analyzer.shared_context_tokens:,} tokens")
+
+
+if __name__ == "__main__":
+    main()
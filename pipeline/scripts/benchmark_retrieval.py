@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# ABOUTME: Compares the document context sent per category: 20K-character prefix vs BM25-packed passages
+# ABOUTME: Reports prompt tokens and how many topic-mentioning pages each approach lets the model see
+
+import sys
+import json
+import time
+import argparse
+import unicodedata
+from pathlib import Path
+
+import tiktoken
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.extraction.pdf_extractor import ingest_pdf
+from src.analysis.retrieval import DocumentIndex
+from src.analysis.llm_analyzer import DEFAULT_CONTEXT_TOKENS
+
+PREFIX_CHARS = 20000
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def topic_pages(pages, category) -> set:
+    """Pages mentioning any of the category's key topics verbatim."""
+    topics = [normalize(topic) for topic in category.get('key_topics', [])]
+    return {page['page_number'] for page in pages
+            if any(topic in normalize(page['text']) for topic in topics)}
+
+
+def prefix_pages(pages, chars: int) -> set:
+    """Pages (at least partly) inside the first `chars` characters of the joined text."""
+    seen, offset = set(), 0
+    for page in pages:
+        if offset >= chars:
+            break
+        seen.add(page['page_number'])
+        offset += len(page['text']) + 2
+    return seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-category context selection")
+    parser.add_argument('pdfs', type=Path, nargs='*', help='Plan PDFs (default: all in data/partidos)')
+    parser.add_argument('--budget', type=int, default=DEFAULT_CONTEXT_TOKENS, help='Context token budget')
+    args = parser.parse_args()
+
+    pipeline_root = Path(__file__).parent.parent
+    pdfs = args.pdfs or sorted((pipeline_root.parent / "data" / "partidos").glob("*/*.pdf"))
+    with open(pipeline_root / "config" / "categories.json", encoding='utf-8') as f:
+        categories = json.load(f)['categories']
+
+    encoding = tiktoken.encoding_for_model("gpt-4o")
+
+    def count_tokens(text):
+        return len(encoding.encode(text))
+
+    totals = {'prefix_tokens': 0, 'packed_tokens': 0, 'topic_pages': 0,
+              'prefix_hits': 0, 'packed_hits': 0, 'index_s': 0.0, 'pack_s': 0.0}
+
+    print(f"{'Plan':10s} {'pages':>6s} {'prefix tok':>11s} {'packed tok':>11s} "
+          f"{'topic pages':>12s} {'prefix sees':>12s} {'packed sees':>12s}")
+    print("-" * 80)
+    for pdf_path in pdfs:
+        pages = ingest_pdf(pdf_path, logos=False)['pages']
+        full_text = "\n\n".join(page['text'] for page in pages)
+
+        start = time.perf_counter()
+        index = DocumentIndex(pages)
+        totals['index_s'] += time.perf_counter() - start
+
+        prefix_tokens = count_tokens(full_text[:PREFIX_CHARS]) * len(categories)
+        prefix_seen = prefix_pages(pages, PREFIX_CHARS)
+        row = {'packed_tokens': 0, 'topic_pages': 0, 'prefix_hits': 0, 'packed_hits': 0}
+        for category in categories:
+            start = time.perf_counter()
+            passages = index.pack(' '.join([category['name'], category['description'],
+                                            category['prompt_context']] + category['key_topics']),
+                                  args.budget, count_tokens)
+            totals['pack_s'] += time.perf_counter() - start
+
+            relevant = topic_pages(pages, category)
+            row['packed_tokens'] += sum(p['tokens'] for p in passages)
+            row['topic_pages'] += len(relevant)
+            row['prefix_hits'] += len(relevant & prefix_seen)
+            row['packed_hits'] += len(relevant & {p['page_number'] for p in passages})
+
+        print(f"{pdf_path.stem:10s} {len(pages):>6d} {prefix_tokens:>11,} {row['packed_tokens']:>11,} "
+              f"{row['topic_pages']:>12,} {row['prefix_hits']:>12,} {row['packed_hits']:>12,}")
+        totals['prefix_tokens'] += prefix_tokens
+        for key in row:
+            totals[key] += row[key]
+
+    print("-" * 80)
+    topic = totals['topic_pages'] or 1
+    print(f"Categories: {len(categories)}   Budget: {args.budget} tokens\n")
+    print(f"Context tokens (all plans × categories): {totals['prefix_tokens']:,} prefix → "
+          f"{totals['packed_tokens']:,} packed "
+          f"({1 - totals['packed_tokens'] / max(totals['prefix_tokens'], 1):.0%} fewer)")
+    print(f"Topic-mentioning pages visible: {totals['prefix_hits'] / topic:.0%} prefix → "
+          f"{totals['packed_hits'] / topic:.0%} packed")
+    print(f"Index build: {totals['index_s']:.2f}s   Packing: {totals['pack_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
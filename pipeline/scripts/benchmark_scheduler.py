@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# ABOUTME: Compares running extract, embed and analyze one after another with the overlapped stage scheduler
+# ABOUTME: Uses a throwaway database and a local stand-in API (in its own process), so no real requests are made
+
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+from openai import OpenAI
+
+# Add parent directory (for scripts.*) and src (for the pipeline's own imports) to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from storage.database import Database
+from analysis.openai_client import RateLimitedClient
+from pipeline.orchestrator import DocumentPipeline
+from pipeline.scheduler import StageScheduler
+from scripts.openai_standin import StandInServer
+
+
+def make_database(db_path: Path, pdfs, pipeline_root: Path):
+    """Throwaway database with the configured categories and one unextracted document per plan."""
+    db = Database(str(db_path))
+    with open(pipeline_root / "config" / "categories.json", encoding='utf-8') as f:
+        categories = json.load(f)['categories']
+    for order, category in enumerate(categories):
+        db.add_category(category['id'], category['name'], category['description'],
+                        category['prompt_context'], order)
+    document_ids = []
+    for pdf_path in pdfs:
+        party_id = db.add_party(pdf_path.stem, pdf_path.stem, pdf_path.parent.name)
+        document_ids.append(db.add_document(party_id, pdf_path.stem, str(pdf_path), pdf_path.stem))
+    return document_ids
+
+
+def serve(latency: float, urls):
+    """Run a stand-in server until terminated (in a child process, like a remote API)."""
+    server = StandInServer(latency=latency)
+    urls.put(server.url)
+    server.httpd.serve_forever()
+
+
+def run(db_path: Path, document_ids, latency: float, overlapped: bool, workers):
+    """Run all stages over the documents. Returns (seconds, scheduler stats of the last run)."""
+    # A separate process, so generating responses doesn't compete with the pipeline for the GIL
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(latency, urls), daemon=True)
+    server.start()
+    server_url = urls.get()
+    pipeline = DocumentPipeline(db_path=str(db_path), openai_api_key='standin', concurrency=workers['extract'])
+    # Generous limits: the benchmark measures overlap, not throttling
+    pipeline.llm_analyzer.client = RateLimitedClient(
+        client=OpenAI(base_url=server_url, api_key='standin', max_retries=0),
+        limits={'gpt-4o': (100_000, 100_000_000), 'text-embedding-3-small': (100_000, 100_000_000)}
+    )
+    # Each stage as its own run over every document, or all stages in one run
+    passes = [(True, True)] if overlapped else [(False, False), (True, False), (False, True)]
+
+    start = time.perf_counter()
+    try:
+        for embeddings, analysis in passes:
+            scheduler = StageScheduler(pipeline, extract_workers=workers['extract'],
+                                       embed_workers=workers['embed'], analyze_workers=workers['analyze'],
+                                       embeddings=embeddings, analysis=analysis, status_interval=0)
+            asyncio.run(scheduler.run(document_ids))
+    finally:
+        pipeline.close()
+        server.terminate()
+    return time.perf_counter() - start, scheduler.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark staged vs overlapped pipeline runs")
+    parser.add_argument('pdfs', type=Path, nargs='*', help='Plan PDFs (default: first 4 in data/partidos)')
+    parser.add_argument('--latency', type=float, default=0.5, help='Simulated seconds per request')
+    parser.add_argument('--extract-workers', type=int, default=2)
+    parser.add_argument('--embed-workers', type=int, default=2)
+    parser.add_argument('--analyze-workers', type=int, default=4)
+    args = parser.parse_args()
+
+    pipeline_root = Path(__file__).parent.parent
+    pdfs = args.pdfs or sorted((pipeline_root.parent / "data" / "partidos").glob("*/*.pdf"))[:4]
+    workers = {'extract': args.extract_workers, 'embed': args.embed_workers, 'analyze': args.analyze_workers}
+
+    timings = {}
+    work_dir = Path(tempfile.mkdtemp(prefix='scheduler-benchmark-'))
+    try:
+        for overlapped in (False, True):
+            mode = 'overlapped' if overlapped else 'staged'
+            db_path = work_dir / f"{mode}.db"
+            document_ids = make_database(db_path, pdfs, pipeline_root)
+            seconds, stats = run(db_path, document_ids, args.latency, overlapped, workers)
+
+            db = Database(str(db_path))
+            with db.get_connection() as conn:
+                embeddings = conn.execute("SELECT COUNT(*) FROM document_embeddings").fetchone()[0]
+                positions = conn.execute("SELECT COUNT(*) FROM party_positions").fetchone()[0]
+            peaks = ', '.join(f"{stage} {stats[stage]['peak_depth']}" for stage in StageScheduler.STAGES)
+            timings[mode] = (seconds, embeddings, positions, peaks)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'mode':11s} {'wall':>8s} {'chunks':>7s} {'positions':>10s}   peak queue depth (last run)")
+    print("-" * 75)
+    for mode, (seconds, embeddings, positions, peaks) in timings.items():
+        print(f"{mode:11s} {seconds:>7.2f}s {embeddings:>7d} {positions:>10d}   {peaks}")
+    print("-" * 75)
+    staged, overlapped = timings['staged'][0], timings['overlapped'][0]
+    print(f"Plans: {len(pdfs)}   Latency: {args.latency}s/request   "
+          f"Overlapped: {staged / overlapped:.2f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# ABOUTME: Benchmarks semantic search via SQL vec_distance_cosine against the in-memory VectorIndex
+# ABOUTME: Runs 1, 13 and 260 per-party top-k queries, plus batched search_many, over an embeddings table
+
+import os
+import sys
+import time
+import struct
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import sqlite_vec
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.storage.database import Database
+from src.storage.vector_index import VectorIndex
+
+# Same statement semantic_search used before the in-memory index
+SQL_SEARCH = """
+    SELECT
+        de.id,
+        dt.page_number,
+        de.chunk_text,
+        vec_distance_cosine(de.embedding, ?) as distance
+    FROM document_embeddings de
+    JOIN document_text dt ON de.document_text_id = dt.id
+    JOIN documents d ON dt.document_id = d.id
+    WHERE d.party_id = ?
+    ORDER BY distance ASC
+    LIMIT ?
+"""
+
+
+def create_fixture(db: Database, parties: int, pages: int, chunks_per_page: int, dimensions: int):
+    """Fill a database with random embeddings laid out like the real corpus."""
+    rng = np.random.default_rng(42)
+    with db.transaction():
+        for p in range(parties):
+            party_id = db.add_party(name=f"Partido {p}", abbreviation=f"P{p}", folder_name=f"P{p}")
+            document_id = db.add_document(party_id=party_id, title=f"Plan {p}",
+                                          file_path=f"/tmp/P{p}.pdf", file_hash=f"hash-{p}")
+            db.save_extracted_pages(document_id, [
+                {'page_number': n, 'text': f"Página {n}"} for n in range(1, pages + 1)
+            ])
+
+    with db.get_connection() as conn:
+        page_ids = [row[0] for row in conn.execute("SELECT id FROM document_text ORDER BY id")]
+
+    rows = []
+    for page_id in page_ids:
+        vectors = rng.standard_normal((chunks_per_page, dimensions)).astype(np.float32)
+        for chunk_index, vector in enumerate(vectors):
+            rows.append({'document_text_id': page_id, 'chunk_index': chunk_index,
+                         'chunk_text': f"Fragmento {page_id}-{chunk_index}",
+                         'embedding': vector.tobytes(), 'token_count': 350})
+    db.save_embeddings_bulk(rows)
+
+
+def sql_search(db: Database, query: np.ndarray, party_id: int, k: int):
+    """Previous semantic_search: load sqlite-vec and scan the party's rows."""
+    with db.get_connection() as conn:
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+        blob = struct.pack(f'{len(query)}f', *query)
+        return [row[0] for row in conn.execute(SQL_SEARCH, (blob, party_id, k)).fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQL vs in-memory vector search")
+    parser.add_argument('--db', help='Existing database to search (default: synthetic fixture)')
+    parser.add_argument('--parties', type=int, default=20, help='Synthetic parties')
+    parser.add_argument('--pages', type=int, default=110, help='Synthetic pages per party')
+    parser.add_argument('--chunks-per-page', type=int, default=2, help='Synthetic chunks per page')
+    parser.add_argument('--dimensions', type=int, default=1536)
+    parser.add_argument('-k', type=int, default=15, help='Results per query')
+    args = parser.parse_args()
+
+    if not hasattr(sqlite3.Connection, 'enable_load_extension'):
+        print("❌ This Python's sqlite3 cannot load extensions (needed for the sqlite-vec baseline)")
+        sys.exit(1)
+
+    tmp_dir = None
+    if args.db:
+        db = Database(args.db)
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db = Database(os.path.join(tmp_dir.name, "benchmark.db"))
+        create_fixture(db, args.parties, args.pages, args.chunks_per_page, args.dimensions)
+
+    with db.get_connection() as conn:
+        party_ids = [row[0] for row in conn.execute("SELECT id FROM parties ORDER BY id")]
+
+    start = time.perf_counter()
+    index = VectorIndex.from_database(db)
+    load_time = time.perf_counter() - start
+
+    print("=" * 78)
+    print("Vector Search Benchmark")
+    print("=" * 78)
+    print(f"Embeddings: {len(index):,} × {index.dimensions} across {len(party_ids)} parties, k={args.k}")
+    print(f"VectorIndex load: {load_time:.2f}s (once per run)\n")
+    print(f"{'queries':>8s} {'SQL total':>12s} {'SQL/query':>12s} {'index total':>12s} "
+          f"{'index/query':>12s} {'speedup':>9s} {'same top-k':>11s}")
+    print("-" * 78)
+
+    rng = np.random.default_rng(7)
+    for count in (1, 13, 260):
+        queries = rng.standard_normal((count, index.dimensions)).astype(np.float32)
+        targets = [party_ids[i % len(party_ids)] for i in range(count)]
+
+        start = time.perf_counter()
+        sql_results = [sql_search(db, q, party_id, args.k) for q, party_id in zip(queries, targets)]
+        sql_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_results = [[r['embedding_id'] for r in index.search(q, k=args.k, party_id=party_id)]
+                         for q, party_id in zip(queries, targets)]
+        index_time = time.perf_counter() - start
+
+        matching = sum(a == b for a, b in zip(sql_results, index_results))
+        print(f"{count:>8d} {sql_time:>11.3f}s {sql_time / count * 1000:>10.2f}ms "
+              f"{index_time:>11.4f}s {index_time / count * 1000:>10.2f}ms "
+              f"{sql_time / index_time:>8.0f}x {matching:>6d}/{count}")
+
+    # Summary regeneration: every category query against every party in one call
+    categories = 13
+    queries = {f"categoria-{i}": q for i, q in
+               enumerate(rng.standard_normal((categories, index.dimensions)).astype(np.float32))}
+
+    start = time.perf_counter()
+    looped = {(party_id, key): [r['embedding_id'] for r in index.search(q, k=args.k, party_id=party_id)]
+              for party_id in party_ids for key, q in queries.items()}
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = index.search_many(queries, party_ids=party_ids, k=args.k)
+    batch_time = time.perf_counter() - start
+
+    matching = sum(looped[pair] == [r['embedding_id'] for r in batched[pair]] for pair in looped)
+    print("-" * 78)
+    print(f"search_many: {categories} queries × {len(party_ids)} parties = {len(looped)} pairs")
+    print(f"  looped search(): {loop_time:.4f}s   search_many(): {batch_time:.4f}s "
+          f"({loop_time / batch_time:.1f}x), same top-k {matching}/{len(looped)}")
+    print("=" * 78)
+
+    db.close()
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
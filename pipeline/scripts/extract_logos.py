@@ -2,10 +2,14 @@
 # ABOUTME: Extracts party logos/images from PDF documents
 # ABOUTME: Saves them as separate PNG files in each party folder
 
-import pymupdf
 from pathlib import Path
 import sys
 
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.extraction.pdf_extractor import ingest_pdf
+
 def extract_images_from_pdf(pdf_path: Path, output_dir: Path, max_images: int = 5):
     """
     Extract images from first few pages of PDF.
@@ -15,48 +19,21 @@ def extract_images_from_pdf(pdf_path: Path, output_dir: Path, max_images: int =
         output_dir: Directory to save extracted images
         max_images: Maximum number of images to extract
     """
-    doc = pymupdf.open(pdf_path)
-
-    images_extracted = 0
+    # Logo candidates (images ≥5KB on the first 3 pages) come from the shared ingest pass
+    logos = ingest_pdf(pdf_path, pages=False)['logos'][:max_images]
     party_abbr = pdf_path.stem
 
-    # Check first 3 pages for images (logo usually on first page)
-    for page_num in range(min(3, len(doc))):
-        page = doc[page_num]
-        image_list = page.get_images()
-
-        for img_index, img in enumerate(image_list):
-            if images_extracted >= max_images:
-                break
-
-            xref = img[0]
-
-            try:
-                # Get image data
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-
-                # Skip very small images (likely not logos)
-                if len(image_bytes) < 5000:  # 5KB minimum
-                    continue
-
-                # Save image
-                output_filename = f"{party_abbr}_logo_{images_extracted + 1}.{image_ext}"
-                output_path = output_dir / output_filename
-
-                with open(output_path, "wb") as img_file:
-                    img_file.write(image_bytes)
+    for images_extracted, logo in enumerate(logos):
+        # Save image
+        output_filename = f"{party_abbr}_logo_{images_extracted + 1}.{logo['ext']}"
+        output_path = output_dir / output_filename
 
-                print(f"  ✓ Extracted: {output_filename} ({len(image_bytes):,} bytes)")
-                images_extracted += 1
+        with open(output_path, "wb") as img_file:
+            img_file.write(logo['image'])
 
-            except Exception as e:
-                print(f"  ✗ Error extracting image {img_index}: {e}")
-                continue
+        print(f"  ✓ Extracted: {output_filename} ({logo['size']:,} bytes)")
 
-    doc.close()
-    return images_extracted
+    return len(logos)
 
 
 def main():
@@ -4,16 +4,25 @@
 import os
 import sys
 import struct
+import asyncio
+import argparse
 import tiktoken
 from pathlib import Path
-from typing import List, Tuple
-from openai import OpenAI
+from typing import Dict, List, Tuple
 from dotenv import load_dotenv
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.storage.database import Database
+from src.storage.ann_index import IVFIndex
+from src.analysis.embedding_batcher import EmbeddingBatcher
+from src.analysis.openai_client import AsyncRateLimitedClient, get_shared_client
+from src.analysis.embedding_cache import EmbeddingCache
+from src.analysis.chunking import (
+    CHUNK_OVERLAP, MEDIUM_PAGE_THRESHOLD, SMALL_PAGE_THRESHOLD, TARGET_CHUNK_SIZE,
+    chunk_page
+)
 
 # Load environment variables from .env file
 env_path = Path(__file__).parent.parent / ".env"
@@ -24,16 +33,21 @@ class EmbeddingGenerator:
     """Generate and store embeddings for document text."""
 
     def __init__(self, db_path: str, api_key: str):
-        self.db = Database(db_path)
-        self.client = OpenAI(api_key=api_key)
+        self.db = Database(db_path, persistent=True)
+        # New embeddings are added to the ANN index, if one has been built
+        self.db.ann_index = IVFIndex.open(self.db)
+        # Chunks whose text was embedded before (e.g. after re-chunking) come from the cache
+        self.embedding_cache = EmbeddingCache(self.db)
+        self.client = get_shared_client(api_key, embedding_cache=self.embedding_cache)
         self.model = "text-embedding-3-small"
         self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.batcher = EmbeddingBatcher(self.client, model=self.model)
 
         # Chunking parameters
-        self.small_page_threshold = 1500  # Keep as-is if below this
-        self.medium_page_threshold = 3500  # Split into 2 if below this
-        self.target_chunk_size = 1500  # Target size for split chunks
-        self.chunk_overlap = 100  # Overlap between chunks
+        self.small_page_threshold = SMALL_PAGE_THRESHOLD  # Keep as-is if below this
+        self.medium_page_threshold = MEDIUM_PAGE_THRESHOLD  # Split into 2 if below this
+        self.target_chunk_size = TARGET_CHUNK_SIZE  # Target size for split chunks
+        self.chunk_overlap = CHUNK_OVERLAP  # Overlap between chunks
 
     def count_tokens(self, text: str) -> int:
         """Count tokens in text."""
@@ -45,138 +59,121 @@ class EmbeddingGenerator:
 
         Returns list of (chunk_index, chunk_text) tuples.
         """
-        char_count = len(text)
-
-        # Small pages: keep as-is
-        if char_count < self.small_page_threshold:
-            return [(0, text)]
-
-        # Medium pages: split into 2 chunks with overlap
-        if char_count < self.medium_page_threshold:
-            midpoint = char_count // 2
-            # Find a good split point (sentence boundary)
-            split_point = self._find_split_point(text, midpoint)
-
-            chunk1 = text[:split_point + self.chunk_overlap]
-            chunk2 = text[split_point - self.chunk_overlap:]
-
-            return [(0, chunk1), (1, chunk2)]
-
-        # Large pages: split into multiple chunks
-        chunks = []
-        start = 0
-        chunk_index = 0
-
-        while start < char_count:
-            end = min(start + self.target_chunk_size, char_count)
-
-            # Find sentence boundary if not at end
-            if end < char_count:
-                end = self._find_split_point(text, end)
-
-            # Extract chunk with overlap from previous
-            chunk_start = max(0, start - self.chunk_overlap)
-            chunk_text = text[chunk_start:end + self.chunk_overlap]
-
-            chunks.append((chunk_index, chunk_text))
-
-            start = end
-            chunk_index += 1
-
-        return chunks
-
-    def _find_split_point(self, text: str, target: int) -> int:
-        """Find nearest sentence boundary to target position."""
-        # Look for sentence endings within 200 chars of target
-        search_start = max(0, target - 100)
-        search_end = min(len(text), target + 100)
-        search_region = text[search_start:search_end]
-
-        # Find last period, exclamation, or question mark
-        for delimiter in ['. ', '! ', '? ', '.\n', '!\n', '?\n']:
-            pos = search_region.rfind(delimiter)
-            if pos != -1:
-                return search_start + pos + len(delimiter)
-
-        # Fallback to target if no sentence boundary found
-        return target
+        return chunk_page(text, self.small_page_threshold, self.medium_page_threshold,
+                          self.target_chunk_size, self.chunk_overlap)
 
     def generate_embedding(self, text: str) -> Tuple[List[float], int]:
-        """Generate embedding for text using OpenAI API."""
-        response = self.client.embeddings.create(
-            input=text,
-            model=self.model
-        )
-
-        embedding = response.data[0].embedding
-        tokens_used = response.usage.total_tokens
-
-        return embedding, tokens_used
+        """Generate embedding for a single text using OpenAI API."""
+        return self.batcher.embed_one(text)
 
     def serialize_embedding(self, embedding: List[float]) -> bytes:
         """Serialize embedding as binary blob (float32 array)."""
         return struct.pack(f'{len(embedding)}f', *embedding)
 
-    def process_document_text(self, document_text_id: int) -> int:
+    def prepare_chunks(self, document_text_id: int) -> List[Tuple[int, int, str]]:
         """
-        Process a single document_text page:
-        1. Chunk the text
-        2. Generate embeddings
-        3. Store in database
+        Load and chunk a single document_text page.
 
-        Returns number of embeddings created.
+        Returns list of (document_text_id, chunk_index, chunk_text) tuples,
+        empty if the page is missing, empty or already embedded.
         """
         # Get document text
         doc_text = self.db.get_document_text_by_id(document_text_id)
         if not doc_text:
             print(f"❌ Document text {document_text_id} not found")
-            return 0
+            return []
 
         # Skip if already has embeddings
         if self.db.has_embeddings(document_text_id):
             print(f"⏭️  Skipping page {doc_text['page_number']} (already has embeddings)")
-            return 0
+            return []
 
         raw_text = doc_text['raw_text']
 
         # Skip empty pages
         if not raw_text or len(raw_text.strip()) < 50:
             print(f"⏭️  Skipping empty page {doc_text['page_number']}")
-            return 0
+            return []
 
         # Chunk the text
         chunks = self.chunk_text(raw_text, document_text_id, doc_text['page_number'])
 
-        print(f"📄 Processing page {doc_text['page_number']} ({doc_text['party_name']})")
+        print(f"📄 Queued page {doc_text['page_number']} ({doc_text['party_name']})")
         print(f"   {len(raw_text)} chars → {len(chunks)} chunks")
 
-        # Generate embeddings for each chunk
-        embeddings_created = 0
-        for chunk_index, chunk_text in chunks:
-            try:
-                # Generate embedding
-                embedding, token_count = self.generate_embedding(chunk_text)
+        return [(document_text_id, chunk_index, chunk_text) for chunk_index, chunk_text in chunks]
+
+    def embed_and_store(self, chunks: List[Tuple[int, int, str]]) -> int:
+        """
+        Embed queued chunks with batched requests and store them in bulk.
+
+        Returns number of embeddings created.
+        """
+        if not chunks:
+            return 0
 
-                # Serialize embedding
-                embedding_bytes = self.serialize_embedding(embedding)
+        return self._store(chunks, self.batcher.embed(self._batch_items(chunks)))
 
-                # Save to database
-                self.db.save_embedding(
-                    document_text_id=document_text_id,
-                    chunk_index=chunk_index,
-                    chunk_text=chunk_text,
-                    embedding=embedding_bytes,
-                    token_count=token_count,
-                    embedding_model=self.model
-                )
+    async def embed_and_store_async(self, chunks: List[Tuple[int, int, str]], save_lock: asyncio.Lock) -> int:
+        """
+        asyncio version of embed_and_store.
 
-                embeddings_created += 1
-                print(f"   ✓ Chunk {chunk_index}: {len(chunk_text)} chars, {token_count} tokens")
+        The batcher must wrap an async client. Saving runs in a worker
+        thread, one batch at a time (save_lock), so the ANN index and the
+        database see the same serial writes as in process_all.
+        """
+        if not chunks:
+            return 0
 
-            except Exception as e:
-                print(f"   ❌ Error generating embedding for chunk {chunk_index}: {e}")
+        results = await self.batcher.embed_async(self._batch_items(chunks))
+        async with save_lock:
+            return await asyncio.to_thread(self._store, chunks, results)
+
+    @staticmethod
+    def _batch_items(chunks: List[Tuple[int, int, str]]) -> List[Tuple[Tuple[int, int], str]]:
+        """Batcher (key, text) items of queued chunks."""
+        return [((doc_text_id, chunk_index), chunk_text)
+                for doc_text_id, chunk_index, chunk_text in chunks]
+
+    def _store(self, chunks: List[Tuple[int, int, str]], results: Dict) -> int:
+        """Save the embedded chunks in bulk and report the ones that failed."""
+        rows = []
+        for doc_text_id, chunk_index, chunk_text in chunks:
+            key = (doc_text_id, chunk_index)
+            if key not in results:
+                print(f"   ❌ Error generating embedding for page id {doc_text_id}, "
+                      f"chunk {chunk_index}: {self.batcher.failures.get(key)}")
+                continue
+
+            embedding, token_count = results[key]
+            rows.append({
+                'document_text_id': doc_text_id,
+                'chunk_index': chunk_index,
+                'chunk_text': chunk_text,
+                'embedding': self.serialize_embedding(embedding),
+                'token_count': token_count,
+                'embedding_model': self.model
+            })
+
+        # Save all chunks of the batch in one transaction
+        if rows:
+            self.db.save_embeddings_bulk(rows)
+
+        print(f"   ✓ Stored {len(rows)}/{len(chunks)} chunks "
+              f"({self.batcher.requests_made} requests so far)")
+
+        return len(rows)
 
-        return embeddings_created
+    def process_document_text(self, document_text_id: int) -> int:
+        """
+        Process a single document_text page:
+        1. Chunk the text
+        2. Generate embeddings (one request for all chunks)
+        3. Store in database
+
+        Returns number of embeddings created.
+        """
+        return self.embed_and_store(self.prepare_chunks(document_text_id))
 
     def process_all(self, skip_existing: bool = True):
         """Process all document_text pages."""
@@ -192,24 +189,82 @@ class EmbeddingGenerator:
         print(f"Found {len(doc_text_ids)} pages to process\n")
 
         total_embeddings = 0
-        total_tokens = 0
-        processed_pages = 0
+        pending = []
+        pending_chars = 0
+
+        # Roughly 4 characters per token; flush once a full request is queued
+        flush_chars = self.batcher.max_batch_tokens * 4
 
         for idx, doc_text_id in enumerate(doc_text_ids, 1):
             print(f"[{idx}/{len(doc_text_ids)}] ", end="")
 
-            embeddings_created = self.process_document_text(doc_text_id)
-            total_embeddings += embeddings_created
+            chunks = self.prepare_chunks(doc_text_id)
+            pending.extend(chunks)
+            pending_chars += sum(len(chunk_text) for _, _, chunk_text in chunks)
 
-            if embeddings_created > 0:
-                processed_pages += 1
+            if pending_chars >= flush_chars:
+                total_embeddings += self.embed_and_store(pending)
+                pending = []
+                pending_chars = 0
 
-            # Print progress every 50 pages
-            if idx % 50 == 0:
                 stats = self.db.get_embedding_stats()
                 print(f"\n📊 Progress: {stats['total_embeddings']} embeddings, "
                       f"{stats['total_tokens']} tokens\n")
 
+        total_embeddings += self.embed_and_store(pending)
+
+        self._print_summary(total_embeddings)
+
+    async def process_all_async(self):
+        """
+        asyncio version of process_all.
+
+        Pages are loaded and chunked in a worker thread, and every full
+        request's worth of chunks is embedded as soon as it is queued, so
+        requests overlap with each other and with chunking instead of
+        running one after another. In-flight requests are bounded by the
+        async client's embeddings semaphore and the shared rate limits.
+        """
+        print("=" * 70)
+        print("Embedding Generation (asyncio)")
+        print("=" * 70)
+        print(f"Model: {self.model}")
+        print()
+
+        doc_text_ids = await asyncio.to_thread(self.db.get_all_document_text_ids)
+        print(f"Found {len(doc_text_ids)} pages to process\n")
+
+        flush_chars = self.batcher.max_batch_tokens * 4
+        save_lock = asyncio.Lock()
+
+        async with AsyncRateLimitedClient(self.client) as client:
+            # Same batcher (and statistics), pointed at the async client for this run
+            self.batcher.client = client
+            try:
+                tasks = []
+                pending = []
+                pending_chars = 0
+                for idx, doc_text_id in enumerate(doc_text_ids, 1):
+                    print(f"[{idx}/{len(doc_text_ids)}] ", end="")
+                    chunks = await asyncio.to_thread(self.prepare_chunks, doc_text_id)
+                    pending.extend(chunks)
+                    pending_chars += sum(len(chunk_text) for _, _, chunk_text in chunks)
+
+                    if pending_chars >= flush_chars:
+                        tasks.append(asyncio.create_task(self.embed_and_store_async(pending, save_lock)))
+                        pending = []
+                        pending_chars = 0
+
+                tasks.append(asyncio.create_task(self.embed_and_store_async(pending, save_lock)))
+                total_embeddings = sum(await asyncio.gather(*tasks))
+            finally:
+                self.batcher.client = self.client
+
+        print(f"\nPeak embedding requests in flight: {client.peak_in_flight['embeddings']}")
+        self._print_summary(total_embeddings)
+
+    def _print_summary(self, total_embeddings: int):
+        """Print the final embedding statistics of a run."""
         # Final stats
         print("\n" + "=" * 70)
         print("✅ Embedding Generation Complete!")
@@ -220,6 +275,10 @@ class EmbeddingGenerator:
         print(f"Pages with embeddings: {stats['documents_with_embeddings']}")
         print(f"Total tokens: {stats['total_tokens']:,}")
         print(f"Average tokens per chunk: {stats['avg_tokens_per_chunk']:.1f}")
+        print(f"Created this run: {total_embeddings} embeddings "
+              f"in {self.batcher.requests_made} requests")
+        print(f"Embedding cache: {self.embedding_cache.hits} chunks reused, "
+              f"{self.embedding_cache.misses} embedded")
 
         # Cost estimate (text-embedding-3-small: $0.020 per 1M tokens)
         cost = (stats['total_tokens'] / 1_000_000) * 0.020
@@ -228,6 +287,11 @@ class EmbeddingGenerator:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate embeddings for all document pages")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Overlap embedding requests on one asyncio event loop')
+    args = parser.parse_args()
+
     # Get API key from environment
     api_key = os.getenv('OPENAI_API_KEY')
     if not api_key:
@@ -246,7 +310,13 @@ def main():
 
     # Generate embeddings
     generator = EmbeddingGenerator(str(db_path), api_key)
-    generator.process_all(skip_existing=True)
+    try:
+        if args.use_async:
+            asyncio.run(generator.process_all_async())
+        else:
+            generator.process_all(skip_existing=True)
+    finally:
+        generator.db.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# ABOUTME: Local stand-in for the OpenAI HTTP API used by benchmarks and offline dry runs
+# ABOUTME: Serves deterministic embeddings, chat completions and batches with latency, failure injection and prompt caching
+
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic pseudo-embedding for a text (same text → same vector)."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dimensions)]
+
+
+class StandInServer:
+    """Threaded HTTP server that mimics the OpenAI endpoints the pipeline uses."""
+
+    # Prompt caching like the API's: prefixes of 1024+ tokens, matched in 128-token steps
+    CACHE_MIN_TOKENS = 1024
+    CACHE_STEP_TOKENS = 128
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        dimensions: int = 1536,
+        poison_text: Optional[str] = None,
+        rate_limit_every: int = 0,
+        retry_after_ms: int = 200,
+        batch_seconds: float = 0.0
+    ):
+        """
+        Initialize stand-in server.
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 = pick a free port)
+            latency: Seconds to sleep per request (simulated network round trip)
+            dimensions: Embedding dimensions to return
+            poison_text: Any embeddings request containing this substring fails
+                with HTTP 400 (used to exercise partial-failure handling)
+            rate_limit_every: Answer every Nth request with HTTP 429 (0 = never)
+            retry_after_ms: retry-after-ms header sent with 429 responses
+            batch_seconds: Seconds a batch stays in progress before its
+                results are ready (poison_text also fails batch lines)
+        """
+        self.latency = latency
+        self.dimensions = dimensions
+        self.poison_text = poison_text
+        self.rate_limit_every = rate_limit_every
+        self.retry_after_ms = retry_after_ms
+        self.batch_seconds = batch_seconds
+
+        # Statistics
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {'requests': 0, 'inputs': 0, 'errors': 0, 'rate_limited': 0,
+                                      'cached_tokens': 0, 'batches': 0}
+        self._prompt_prefixes = set()
+
+        # Uploaded/generated files (id → metadata and content) and batches (id → batch object)
+        self.files: Dict[str, Dict] = {}
+        self.batches: Dict[str, Dict] = {}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to pass to OpenAI(base_url=...)."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StandInServer":
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Shut the server down."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self):
+        """Zero the request counters."""
+        with self.lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def _count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def _cached_prefix_tokens(self, prompt: str) -> int:
+        """Tokens of the longest cacheable prefix seen in an earlier prompt (stand-in tokens are 4 chars)."""
+        step_chars = self.CACHE_STEP_TOKENS * 4
+        digest, digests = hashlib.sha256(), []
+        for end in range(step_chars, len(prompt) + 1, step_chars):
+            digest.update(prompt[end - step_chars:end].encode('utf-8'))
+            if end >= self.CACHE_MIN_TOKENS * 4:
+                digests.append((end // 4, digest.digest()))
+
+        cached = 0
+        with self.lock:
+            for tokens, prefix in digests:
+                if prefix not in self._prompt_prefixes:
+                    break
+                cached = tokens
+            self._prompt_prefixes.update(prefix for _, prefix in digests)
+            self.stats['cached_tokens'] += cached
+        return cached
+
+    def handle_embeddings(self, body: Dict) -> Tuple[int, Dict]:
+        """POST /v1/embeddings"""
+        inputs = body['input']
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        if self.poison_text and any(self.poison_text in text for text in inputs):
+            self._count('errors')
+            return 400, {'error': {'message': 'Invalid input', 'type': 'invalid_request_error'}}
+
+        self._count('inputs', len(inputs))
+        tokens = sum(max(1, len(text) // 4) for text in inputs)
+
+        return 200, {
+            'object': 'list',
+            'data': [
+                {'object': 'embedding', 'index': i,
+                 'embedding': fake_embedding(text, self.dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            'model': body.get('model', 'text-embedding-3-small'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        }
+
+    def handle_chat_completions(self, body: Dict) -> Tuple[int, Dict]:
+        """POST /v1/chat/completions (echoes a JSON digest of the prompt)"""
+        prompt = "\n".join(m.get('content') or '' for m in body.get('messages', []))
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        self._count('inputs')
+
+        answer = {'summary': f'Respuesta simulada {digest[:12]}', 'key_proposals': [],
+                  'ideology_position': 'centrista', 'budget_mentioned': False}
+        response_format = body.get('response_format') or {}
+        if response_format.get('type') == 'json_schema':
+            # One answer per top-level property (e.g. per category key)
+            properties = response_format['json_schema']['schema'].get('properties', {})
+            answer = {key: dict(answer, summary=f"{answer['summary']} ({key})") for key in properties}
+        content = json.dumps(answer)
+        prompt_tokens = max(1, len(prompt) // 4)
+        cached_tokens = self._cached_prefix_tokens(prompt)
+        completion_tokens = max(1, len(content) // 4)
+
+        # Answers longer than max_tokens are cut off like the real API does
+        finish_reason = 'stop'
+        max_tokens = body.get('max_tokens')
+        if max_tokens and completion_tokens > max_tokens:
+            content = content[:max_tokens * 4]
+            completion_tokens = max_tokens
+            finish_reason = 'length'
+
+        return 200, {
+            'id': f'chatcmpl-{digest[:24]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-4o'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': finish_reason
+            }],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens,
+                      'prompt_tokens_details': {'cached_tokens': cached_tokens}}
+        }
+
+    def _store_file(self, filename: str, content: bytes, purpose: str) -> Dict:
+        file = {'id': f'file-{uuid.uuid4().hex[:24]}', 'object': 'file', 'bytes': len(content),
+                'created_at': int(time.time()), 'filename': filename, 'purpose': purpose,
+                'status': 'processed'}
+        with self.lock:
+            self.files[file['id']] = {'meta': file, 'content': content}
+        return file
+
+    def handle_file_upload(self, body: Dict) -> Tuple[int, Dict]:
+        """POST /v1/files (multipart: file, purpose)"""
+        filename, content = body['file']
+        return 200, self._store_file(filename, content, body.get('purpose', 'batch'))
+
+    def handle_file_content(self, file_id: str) -> Tuple[int, object]:
+        """GET /v1/files/{file_id}/content"""
+        file = self.files.get(file_id)
+        if file is None:
+            return 404, {'error': {'message': f'No such file: {file_id}'}}
+        return 200, file['content']
+
+    def handle_batch_create(self, body: Dict) -> Tuple[int, Dict]:
+        """POST /v1/batches"""
+        if body.get('input_file_id') not in self.files:
+            return 400, {'error': {'message': f"No such file: {body.get('input_file_id')}"}}
+        now = int(time.time())
+        total = sum(1 for line in self.files[body['input_file_id']]['content'].splitlines() if line.strip())
+        batch = {'id': f'batch_{uuid.uuid4().hex[:24]}', 'object': 'batch', 'endpoint': body['endpoint'],
+                 'input_file_id': body['input_file_id'], 'completion_window': body['completion_window'],
+                 'status': 'in_progress', 'created_at': now, 'in_progress_at': now,
+                 'metadata': body.get('metadata'), 'output_file_id': None, 'error_file_id': None,
+                 'request_counts': {'total': total, 'completed': 0, 'failed': 0}}
+        with self.lock:
+            self.batches[batch['id']] = batch
+            self.stats['batches'] += 1
+        return 200, batch
+
+    def handle_batch_list(self) -> Tuple[int, Dict]:
+        """GET /v1/batches (newest first, in a single page)"""
+        with self.lock:
+            batches = sorted(self.batches.values(), key=lambda batch: batch['created_at'], reverse=True)
+        return 200, {'object': 'list', 'data': batches, 'has_more': False}
+
+    def handle_batch_retrieve(self, batch_id: str) -> Tuple[int, Dict]:
+        """GET /v1/batches/{batch_id} (runs the batch once batch_seconds have passed)"""
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return 404, {'error': {'message': f'No such batch: {batch_id}'}}
+        with self.lock:
+            ready = batch['status'] == 'in_progress' and time.time() - batch['created_at'] >= self.batch_seconds
+            if ready:
+                batch['status'] = 'finalizing'
+        if ready:
+            self._run_batch(batch)
+        return 200, batch
+
+    def _run_batch(self, batch: Dict):
+        """Answer every line of a batch's input file and write its output and error files."""
+        outputs, errors = [], []
+        for line in self.files[batch['input_file_id']]['content'].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request['body']
+            if self.poison_text and self.poison_text in json.dumps(body, ensure_ascii=False):
+                self._count('errors')
+                errors.append({'id': f'batch_req_{uuid.uuid4().hex[:24]}', 'custom_id': request['custom_id'],
+                               'response': None,
+                               'error': {'code': 'invalid_request', 'message': 'Invalid input'}})
+                continue
+            status, payload = self.handle_chat_completions(body)
+            outputs.append({'id': f'batch_req_{uuid.uuid4().hex[:24]}', 'custom_id': request['custom_id'],
+                            'response': {'status_code': status, 'request_id': uuid.uuid4().hex,
+                                         'body': payload},
+                            'error': None})
+
+        def jsonl(rows):
+            return ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+
+        if outputs:
+            batch['output_file_id'] = self._store_file(f"{batch['id']}_output.jsonl", jsonl(outputs),
+                                                       'batch_output')['id']
+        if errors:
+            batch['error_file_id'] = self._store_file(f"{batch['id']}_error.jsonl", jsonl(errors),
+                                                      'batch_output')['id']
+        batch['request_counts'] = {'total': len(outputs) + len(errors), 'completed': len(outputs),
+                                   'failed': len(errors)}
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+
+    @staticmethod
+    def _parse_multipart(content_type: str, data: bytes) -> Dict:
+        """Form fields of a multipart body (file fields become (filename, bytes))."""
+        message = BytesParser(policy=HTTP).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + data
+        )
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True)
+            filename = part.get_filename()
+            fields[name] = (filename, payload) if filename else payload.decode('utf-8')
+        return fields
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            routes = {
+                '/v1/embeddings': server.handle_embeddings,
+                '/v1/chat/completions': server.handle_chat_completions,
+                '/v1/files': server.handle_file_upload,
+                '/v1/batches': server.handle_batch_create,
+            }
+            get_routes = [
+                (re.compile(r'^/v1/files/([\w-]+)/content$'), server.handle_file_content),
+                (re.compile(r'^/v1/batches$'), server.handle_batch_list),
+                (re.compile(r'^/v1/batches/([\w-]+)$'), server.handle_batch_retrieve),
+            ]
+
+            def do_GET(self):
+                with server.lock:
+                    server.stats['requests'] += 1
+                for pattern, route in self.get_routes:
+                    match = pattern.match(self.path.split('?')[0])
+                    if match:
+                        self._send(*route(*match.groups()))
+                        return
+                self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+            def do_POST(self):
+                with server.lock:
+                    server.stats['requests'] += 1
+                    request_number = server.stats['requests']
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if server.rate_limit_every and request_number % server.rate_limit_every == 0:
+                    server._count('rate_limited')
+                    self._send(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                               headers={'retry-after-ms': str(server.retry_after_ms)})
+                    return
+
+                route = self.routes.get(self.path)
+                if route is None:
+                    self._send(404, {'error': {'message': f'Unknown path {self.path}'}})
+                    return
+
+                length = int(self.headers.get('Content-Length', 0))
+                data = self.rfile.read(length)
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('multipart/form-data'):
+                    body = server._parse_multipart(content_type, data)
+                else:
+                    body = json.loads(data or b'{}')
+                status, payload = route(body)
+                self._send(status, payload)
+
+            def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+                # File contents are sent as-is, everything else as JSON
+                raw = isinstance(payload, bytes)
+                data = payload if raw else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/octet-stream' if raw else 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the OpenAI API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds per request')
+    parser.add_argument('--dimensions', type=int, default=1536)
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='Answer every Nth request with HTTP 429')
+    parser.add_argument('--batch-seconds', type=float, default=5.0,
+                        help='Seconds before a submitted batch completes')
+    args = parser.parse_args()
+
+    server = StandInServer(port=args.port, latency=args.latency, dimensions=args.dimensions,
+                           rate_limit_every=args.rate_limit_every, batch_seconds=args.batch_seconds)
+    print(f"Stand-in OpenAI API listening on {server.url}")
+    print("Point clients at it with OpenAI(base_url=..., api_key='standin')")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nRequests served: {server.stats['requests']}")
+
+
+if __name__ == "__main__":
+    main()
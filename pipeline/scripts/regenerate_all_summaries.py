@@ -7,31 +7,40 @@ Much more accurate than the original approach that fed entire PDFs to GPT-4o.
 import os
 import sys
 import json
-import struct
+import time
+import asyncio
 import sqlite3
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
-from openai import OpenAI
 from dotenv import load_dotenv
-import sqlite_vec
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.storage.database import Database
+from src.storage.ann_index import IVFIndex
+from src.storage.chunk_search import search_chunks
+from src.analysis.openai_client import AsyncRateLimitedClient, get_shared_client
+from src.analysis.response_cache import ResponseCache
+from src.analysis.embedding_cache import EmbeddingCache
+from src.analysis.batch_runner import BatchRunner
+from src.analysis.llm_analyzer import calculate_cost, cached_tokens
 
 # Load environment variables
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(env_path)
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared rate-limited OpenAI client (RPM/TPM buckets, retries on 429)
+openai_client = get_shared_client(os.getenv("OPENAI_API_KEY"))
 
 # Database path
 DB_PATH = Path(__file__).parent.parent.parent / "data" / "database.db"
 
+# llm_batches kind of summary regeneration jobs
+SUMMARY_BATCH_KIND = 'summary'
+
 
 # Category-specific search queries for better semantic search
 CATEGORY_QUERIES = {
@@ -51,68 +60,11 @@ CATEGORY_QUERIES = {
 }
 
 
-def generate_query_embedding(query: str) -> bytes:
-    """Generate embedding for a query."""
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=query,
-    )
-    embedding = response.data[0].embedding
-    return struct.pack(f'{len(embedding)}f', *embedding)
-
-
-def semantic_search(db: Database, query: str, party_id: int, limit: int = 15) -> List[Dict]:
-    """Perform semantic search for relevant content."""
-    query_embedding = generate_query_embedding(query)
-
-    sql = """
-        SELECT
-            dt.page_number,
-            de.chunk_text,
-            vec_distance_cosine(de.embedding, ?) as distance
-        FROM document_embeddings de
-        JOIN document_text dt ON de.document_text_id = dt.id
-        JOIN documents d ON dt.document_id = d.id
-        WHERE d.party_id = ?
-        ORDER BY distance ASC
-        LIMIT ?
-    """
-
-    with db.get_connection() as conn:
-        # Load sqlite-vec extension
-        conn.enable_load_extension(True)
-        sqlite_vec.load(conn)
-        conn.enable_load_extension(False)
-
-        cursor = conn.cursor()
-        cursor.execute(sql, (query_embedding, party_id, limit))
-
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                'page_number': row[0],
-                'chunk_text': row[1],
-                'distance': row[2],
-                'similarity': 1 - row[2]
-            })
-
-    return results
-
-
-def generate_summary(chunks: List[Dict], category_name: str, party_name: str) -> Dict:
-    """
-    Generate summary using GPT-4o with focused context from semantic search.
-    Returns structured summary with proposals, budget info, and ideology.
-    """
-    # Build context from chunks
-    context = f"Información relevante sobre {category_name} de la plataforma de {party_name}:\n\n"
-    for i, chunk in enumerate(chunks, 1):
-        context += f"[Página {chunk['page_number']}, relevancia: {chunk['similarity']:.2f}]\n"
-        context += f"{chunk['chunk_text']}\n\n"
-
-    prompt = f"""Analiza la siguiente información sobre {category_name} de la plataforma electoral de {party_name}.
+# Static instructions go first so every request starts with the same prefix
+# (cacheable by the API); the party and category come last
+SUMMARY_SYSTEM_PROMPT = """Eres un analista político experto en Costa Rica. Respondes únicamente con JSON válido.
 
-{context}
+Recibirás extractos de la plataforma electoral de un partido y, al final, el partido y el tema a analizar.
 
 Genera un análisis estructurado en formato JSON con los siguientes campos:
 
@@ -129,16 +81,61 @@ IMPORTANTE:
 - SIEMPRE incluye citas de página en el summary y key_proposals
 - Responde SOLO con el JSON, sin markdown ni texto adicional"""
 
-    response = openai_client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Eres un analista político experto en Costa Rica. Respondes únicamente con JSON válido."},
+
+def generate_query_embeddings(queries: List[str]) -> List[List[float]]:
+    """Generate embeddings for many queries in a single request."""
+    response = openai_client.embeddings.create(
+        model="text-embedding-3-small",
+        input=queries,
+    )
+    by_index = {item.index: item.embedding for item in response.data}
+    return [by_index[i] for i in range(len(queries))]
+
+
+def semantic_search_many(db: Database, queries: Dict[str, str], party_ids: List[int],
+                         limit: int = 15) -> Dict[Tuple[int, str], List[Dict]]:
+    """
+    Find relevant content for every (party, category) pair at once.
+
+    Args:
+        db: Database (searched through its ANN index when one is attached)
+        queries: Category name → search query
+        party_ids: Parties to search
+        limit: Chunks per (party, category)
+
+    Returns:
+        Dict mapping (party_id, category_name) to chunks, best match first
+    """
+    names = list(queries)
+    embeddings = generate_query_embeddings([queries[name] for name in names])
+    return search_chunks(db, dict(zip(names, embeddings)), party_ids, k=limit)
+
+
+def summary_request(chunks: List[Dict], category_name: str, party_name: str) -> Dict:
+    """Chat completion parameters summarizing a party's position on a category from its chunks."""
+    # Build context from chunks
+    context = "Extractos de la plataforma:\n\n"
+    for i, chunk in enumerate(chunks, 1):
+        context += f"[Página {chunk['page_number']}, relevancia: {chunk['similarity']:.2f}]\n"
+        context += f"{chunk['chunk_text']}\n\n"
+
+    prompt = f"""{context}
+Analiza la información anterior sobre **{category_name}** de la plataforma electoral de **{party_name}**."""
+
+    return {
+        'model': "gpt-4o",
+        'messages': [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
-        temperature=0.3,
-        response_format={"type": "json_object"}
-    )
+        'temperature': 0.3,
+        'response_format': {"type": "json_object"}
+    }
 
+
+def parse_summary(response, chunks_used: int, avg_similarity: float,
+                  context_pages: Optional[List[int]] = None) -> Dict:
+    """Structured summary from the response to a summary_request (context_pages: pages of its chunks)."""
     # Parse JSON response
     result = json.loads(response.choices[0].message.content)
 
@@ -147,27 +144,202 @@ IMPORTANTE:
         'key_proposals': result.get('key_proposals', []),
         'ideology_position': result.get('ideology_position'),
         'budget_mentioned': result.get('budget_mentioned'),
-        'chunks_used': len(chunks),
-        'avg_similarity': sum(c['similarity'] for c in chunks) / len(chunks) if chunks else 0
+        'chunks_used': chunks_used,
+        'avg_similarity': avg_similarity,
+        'context_pages': context_pages
     }
 
 
-def regenerate_all_summaries(dry_run: bool = False, skip_confirm: bool = False):
+def chunk_pages(chunks: List[Dict]) -> List[int]:
+    """Page numbers the chunks come from."""
+    return sorted({chunk['page_number'] for chunk in chunks})
+
+
+def generate_summary(chunks: List[Dict], category_name: str, party_name: str) -> Dict:
+    """
+    Generate summary using GPT-4o with focused context from semantic search.
+    Returns structured summary with proposals, budget info, and ideology.
+    """
+    response = openai_client.chat.completions.create(**summary_request(chunks, category_name, party_name))
+    avg_similarity = sum(c['similarity'] for c in chunks) / len(chunks) if chunks else 0
+    return parse_summary(response, len(chunks), avg_similarity, chunk_pages(chunks))
+
+
+async def generate_summary_async(client: AsyncRateLimitedClient, chunks: List[Dict], category_name: str,
+                                 party_name: str) -> Dict:
+    """asyncio version of generate_summary, through an AsyncRateLimitedClient."""
+    response = await client.chat.completions.create(**summary_request(chunks, category_name, party_name))
+    avg_similarity = sum(c['similarity'] for c in chunks) / len(chunks) if chunks else 0
+    return parse_summary(response, len(chunks), avg_similarity, chunk_pages(chunks))
+
+
+async def regenerate_summaries_async(db: Database, parties, categories,
+                                     search_results: Dict[Tuple[int, str], List[Dict]]) -> Tuple[int, int]:
+    """
+    Generate every (party, category) summary concurrently on one event loop.
+
+    Requests are bounded by the async client's chat semaphore and the
+    shared rate limits; database updates run in a worker thread, one at a
+    time.
+
+    Returns:
+        (summaries processed, errors)
+    """
+    total_summaries = len(parties) * len(categories)
+    save_lock = asyncio.Lock()
+    progress = {'processed': 0, 'errors': 0}
+
+    async def regenerate(client, party_id, party_name, party_abbr, category_id, category_name):
+        chunks = search_results[(party_id, category_name)]
+        if not chunks:
+            progress['processed'] += 1
+            print(f"  ⚠️  [{progress['processed']}/{total_summaries}] {party_abbr} / {category_name}: "
+                  f"No relevant chunks found, skipping")
+            return
+
+        try:
+            result = await generate_summary_async(client, chunks, category_name, party_name)
+            async with save_lock:
+                await asyncio.to_thread(save_summary, db, party_id, category_id, result)
+        except Exception as e:
+            progress['processed'] += 1
+            progress['errors'] += 1
+            print(f"  ❌ [{progress['processed']}/{total_summaries}] {party_abbr} / {category_name}: "
+                  f"ERROR - {str(e)}")
+            return
+
+        progress['processed'] += 1
+        print(f"  ✅ [{progress['processed']}/{total_summaries}] {party_abbr} / {category_name}: "
+              f"{result['chunks_used']} chunks, "
+              f"sim={result['avg_similarity']:.3f}, "
+              f"{len(result['key_proposals'])} proposals")
+
+    async with AsyncRateLimitedClient(openai_client) as client:
+        await asyncio.gather(*(
+            regenerate(client, party_id, party_name, party_abbr, category_id, category_name)
+            for party_id, party_name, party_abbr in parties
+            for category_id, category_name, _ in categories
+        ))
+    print(f"\n⚡ Peak requests in flight: {client.peak_in_flight['chat']}")
+
+    return progress['processed'], progress['errors']
+
+
+def save_summary(db: Database, party_id: int, category_id: int, result: Dict):
+    """Write a regenerated summary into the party's position for the category."""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE party_positions
+            SET
+                summary = ?,
+                key_proposals = ?,
+                ideology_position = ?,
+                budget_mentioned = ?,
+                context_pages = ?
+            WHERE party_id = ? AND category_id = ?
+        """, (
+            result['summary'],
+            json.dumps(result['key_proposals'], ensure_ascii=False),
+            result['ideology_position'],
+            result['budget_mentioned'],
+            json.dumps(result['context_pages']) if result.get('context_pages') is not None else None,
+            party_id,
+            category_id
+        ))
+
+
+def run_summary_batch(db: Database, runner: BatchRunner, batch: Dict) -> Tuple[int, int, float]:
+    """
+    Submit (if needed), wait for and ingest a batch of summary requests.
+
+    Each summary is written to party_positions together with its
+    processing_log row and ingested mark, so an interrupted ingest resumes
+    without duplicates.
+
+    Returns:
+        (summaries updated, errors, cost in USD)
+    """
+    runner.submit(batch)
+    runner.wait(batch)
+
+    updated, errors, total_cost = 0, 0, 0.0
+    for request, response, error in runner.results(batch):
+        label = request['metadata']['label']
+        try:
+            if error:
+                raise RuntimeError(error)
+            # Batches submitted before context pages were recorded don't carry them
+            result = parse_summary(response, request['metadata']['chunks_used'],
+                                   request['metadata']['avg_similarity'],
+                                   request['metadata'].get('context_pages'))
+            cost = calculate_cost(response.usage, batch=True)
+            with db.transaction():
+                save_summary(db, request['party_id'], request['category_id'], result)
+                db.log_processing(stage='summary_regeneration', status='completed',
+                                  category_id=request['category_id'],
+                                  tokens_used=response.usage.total_tokens,
+                                  prompt_tokens=response.usage.prompt_tokens,
+                                  cached_tokens=cached_tokens(response.usage), cost_usd=cost)
+                runner.mark(request, 'completed')
+        except Exception as e:
+            errors += 1
+            print(f"  ❌ {label}: ERROR - {e}")
+            with db.transaction():
+                db.log_processing(stage='summary_regeneration', status='failed',
+                                  category_id=request['category_id'], error_message=str(e))
+                runner.mark(request, 'failed')
+            continue
+
+        updated += 1
+        total_cost += cost
+        print(f"  ✅ {label}: {result['chunks_used']} chunks, {len(result['key_proposals'])} proposals")
+
+    runner.finish(batch)
+    return updated, errors, total_cost
+
+
+def regenerate_all_summaries(dry_run: bool = False, skip_confirm: bool = False, batch: bool = False,
+                             use_async: bool = False):
     """
     Regenerate all party position summaries using semantic search.
 
     Args:
         dry_run: If True, only count and estimate cost without making changes
         skip_confirm: If True, skip confirmation prompt
+        batch: Send all summary requests as one Batch API job (half price,
+            results within 24h). A job left running by an interrupted run
+            is resumed instead of submitting a new one.
+        use_async: Send all summary requests concurrently on one asyncio
+            event loop instead of one after another
     """
     print("🔄 Regenerating Party Position Summaries")
     print("=" * 80)
-    print(f"Mode: {'DRY RUN (no changes)' if dry_run else 'PRODUCTION (will update database)'}")
+    print(f"Mode: {'DRY RUN (no changes)' if dry_run else 'PRODUCTION (will update database)'}"
+          f"{' via Batch API' if batch else ''}")
     print(f"Database: {DB_PATH}")
     print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
     db = Database(str(DB_PATH))
 
+    if batch and not dry_run:
+        runner = BatchRunner(db, client=openai_client.client)
+        open_batches = runner.open_batches(SUMMARY_BATCH_KIND)
+        if open_batches:
+            for open_batch in open_batches:
+                print(f"↩️  Resuming batch #{open_batch['id']} ({open_batch['status']}, "
+                      f"{open_batch['request_count']} requests)")
+                updated, errors, cost = run_summary_batch(db, runner, open_batch)
+                print(f"🏁 Updated {updated} summaries, {errors} errors, ${cost:.2f}")
+            return
+
+    # Identical prompts from an earlier (e.g. interrupted) run are answered from the cache
+    response_cache = ResponseCache(db)
+    openai_client.cache = response_cache
+    # CATEGORY_QUERIES are embedded once, not once per party
+    embedding_cache = EmbeddingCache(db)
+    openai_client.embedding_cache = embedding_cache
+
     # Get all parties and categories
     with db.get_connection() as conn:
         cursor = conn.cursor()
@@ -182,16 +354,17 @@ def regenerate_all_summaries(dry_run: bool = False, skip_confirm: bool = False):
     print(f"📊 Found {len(parties)} parties and {len(categories)} categories")
     print(f"📝 Total summaries to regenerate: {total_summaries}")
 
+    # Estimate cost: ~2K tokens per summary × $5/1M tokens (half with the Batch API)
+    estimated_tokens = total_summaries * 2000
+    estimated_cost = (estimated_tokens / 1_000_000) * 5.0 * (0.5 if batch else 1.0)
+
     if dry_run:
-        # Estimate cost: ~2K tokens per summary × $5/1M tokens
-        estimated_tokens = total_summaries * 2000
-        estimated_cost = (estimated_tokens / 1_000_000) * 5.0
         print(f"\n💰 Estimated cost: {estimated_tokens:,} tokens ≈ ${estimated_cost:.2f}")
         print("\nRun without --dry-run to proceed with regeneration.")
         return
 
     if not skip_confirm:
-        print(f"\n⚠️  This will cost approximately ${(total_summaries * 2000 / 1_000_000) * 5:.2f}")
+        print(f"\n⚠️  This will cost approximately ${estimated_cost:.2f}")
         response = input("Continue? [y/N] ")
         if response.lower() != 'y':
             print("Aborted.")
@@ -206,59 +379,88 @@ def regenerate_all_summaries(dry_run: bool = False, skip_confirm: bool = False):
     print("Starting regeneration...")
     print("=" * 80 + "\n")
 
-    for party_id, party_name, party_abbr in parties:
-        print(f"\n{'=' * 80}")
-        print(f"🏛️  {party_name} ({party_abbr})")
+    # Retrieval: embed all category queries in one request and score every
+    # party's chunks at once (through the ANN index, if one has been built)
+    retrieval_start = time.perf_counter()
+    db.ann_index = IVFIndex.open(db)
+    queries = {
+        category_name: CATEGORY_QUERIES.get(category_name, f"{category_name} {category_description}")
+        for _, category_name, category_description in categories
+    }
+    search_results = semantic_search_many(db, queries, [party[0] for party in parties], limit=15)
+    print(f"📚 Retrieved chunks for {len(search_results)} party/category pairs "
+          f"({'ANN index' if db.ann_index is not None else 'exact search'}) "
+          f"in {time.perf_counter() - retrieval_start:.2f}s\n")
+
+    if batch:
+        requests = []
+        for party_id, party_name, party_abbr in parties:
+            for category_id, category_name, category_description in categories:
+                chunks = search_results[(party_id, category_name)]
+                if not chunks:
+                    print(f"  ⚠️  {party_abbr} / {category_name}: No relevant chunks found, skipping")
+                    continue
+                requests.append({
+                    'custom_id': f"party-{party_id}-cat-{category_id}",
+                    'body': summary_request(chunks, category_name, party_name),
+                    'party_id': party_id,
+                    'category_id': category_id,
+                    'metadata': {
+                        'label': f"{party_abbr} / {category_name}",
+                        'chunks_used': len(chunks),
+                        'avg_similarity': sum(c['similarity'] for c in chunks) / len(chunks),
+                        'context_pages': chunk_pages(chunks)
+                    }
+                })
+
+        runner = BatchRunner(db, client=openai_client.client)
+        updated, errors, cost = run_summary_batch(db, runner, runner.prepare(SUMMARY_BATCH_KIND, requests))
+        elapsed = (datetime.now() - start_time).total_seconds()
+        print("\n" + "=" * 80)
+        print("🏁 Regeneration Complete!")
         print("=" * 80)
+        print(f"Updated: {updated}/{len(requests)} summaries")
+        print(f"Errors: {errors}")
+        print(f"Cost: ${cost:.2f} (Batch API)")
+        print(f"Time elapsed: {elapsed:.1f}s ({elapsed/60:.1f} minutes)")
+        print(f"Finished: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        return
 
-        for category_id, category_name, category_description in categories:
-            processed += 1
-            progress = (processed / total_summaries) * 100
+    if use_async:
+        processed, errors = asyncio.run(regenerate_summaries_async(db, parties, categories, search_results))
+    else:
+        for party_id, party_name, party_abbr in parties:
+            print(f"\n{'=' * 80}")
+            print(f"🏛️  {party_name} ({party_abbr})")
+            print("=" * 80)
 
-            try:
-                # Generate search query
-                query = CATEGORY_QUERIES.get(category_name, f"{category_name} {category_description}")
+            for category_id, category_name, category_description in categories:
+                processed += 1
+                progress = (processed / total_summaries) * 100
 
-                # Perform semantic search
-                chunks = semantic_search(db, query, party_id, limit=15)
+                try:
+                    chunks = search_results[(party_id, category_name)]
 
-                if not chunks:
-                    print(f"  ⚠️  [{processed}/{total_summaries}] {category_name}: No relevant chunks found, skipping")
-                    continue
+                    if not chunks:
+                        print(f"  ⚠️  [{processed}/{total_summaries}] {category_name}: No relevant chunks found, skipping")
+                        continue
+
+                    # Generate new summary
+                    result = generate_summary(chunks, category_name, party_name)
+
+                    # Update database
+                    save_summary(db, party_id, category_id, result)
 
-                # Generate new summary
-                result = generate_summary(chunks, category_name, party_name)
-
-                # Update database
-                with db.get_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        UPDATE party_positions
-                        SET
-                            summary = ?,
-                            key_proposals = ?,
-                            ideology_position = ?,
-                            budget_mentioned = ?
-                        WHERE party_id = ? AND category_id = ?
-                    """, (
-                        result['summary'],
-                        json.dumps(result['key_proposals'], ensure_ascii=False),
-                        result['ideology_position'],
-                        result['budget_mentioned'],
-                        party_id,
-                        category_id
-                    ))
-
-                print(f"  ✅ [{processed}/{total_summaries}] {category_name}: "
-                      f"{result['chunks_used']} chunks, "
-                      f"sim={result['avg_similarity']:.3f}, "
-                      f"{len(result['key_proposals'])} proposals "
-                      f"({progress:.1f}%)")
-
-            except Exception as e:
-                errors += 1
-                print(f"  ❌ [{processed}/{total_summaries}] {category_name}: ERROR - {str(e)}")
-                continue
+                    print(f"  ✅ [{processed}/{total_summaries}] {category_name}: "
+                          f"{result['chunks_used']} chunks, "
+                          f"sim={result['avg_similarity']:.3f}, "
+                          f"{len(result['key_proposals'])} proposals "
+                          f"({progress:.1f}%)")
+
+                except Exception as e:
+                    errors += 1
+                    print(f"  ❌ [{processed}/{total_summaries}] {category_name}: ERROR - {str(e)}")
+                    continue
 
     # Final summary
     elapsed = (datetime.now() - start_time).total_seconds()
@@ -269,6 +471,11 @@ def regenerate_all_summaries(dry_run: bool = False, skip_confirm: bool = False):
     print(f"Errors: {errors}")
     print(f"Time elapsed: {elapsed:.1f}s ({elapsed/60:.1f} minutes)")
     print(f"Average: {elapsed/processed:.2f}s per summary")
+    print(f"Response cache: {response_cache.hits} hits, {response_cache.misses} misses")
+    print(f"Embedding cache: {embedding_cache.hits} hits, {embedding_cache.misses} misses")
+    print(f"Prompt cache: {openai_client.stats['cached_tokens']:,} of "
+          f"{openai_client.stats['prompt_tokens']:,} prompt tokens cached "
+          f"({openai_client.cached_token_ratio():.0%})")
     print(f"Finished: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
 
@@ -278,9 +485,15 @@ def main():
     parser = argparse.ArgumentParser(description="Regenerate party position summaries using semantic search")
     parser.add_argument('--dry-run', action='store_true', help='Estimate cost without making changes')
     parser.add_argument('--yes', '-y', action='store_true', help='Skip confirmation prompt')
+    parser.add_argument('--batch', action='store_true',
+                        help='Submit all requests as one Batch API job (half price, results within 24h; '
+                             're-run to resume an interrupted job)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Send all requests concurrently on one asyncio event loop')
     args = parser.parse_args()
 
-    regenerate_all_summaries(dry_run=args.dry_run, skip_confirm=args.yes)
+    regenerate_all_summaries(dry_run=args.dry_run, skip_confirm=args.yes, batch=args.batch,
+                             use_async=args.use_async)
 
 
 if __name__ == "__main__":
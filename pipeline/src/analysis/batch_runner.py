@@ -0,0 +1,231 @@
+# ABOUTME: Offline execution of chat completion requests through the OpenAI Batch API (half price, 24h window)
+# ABOUTME: Writes a JSONL request file, submits it, polls until done and yields results; every step resumes after interruption
+
+import os
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletion
+
+from .openai_client import get_shared_client
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+
+# Batch states after which the API does no more work on it
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+DEFAULT_POLL_SECONDS = 60
+
+
+class BatchRunner:
+    """
+    Runs chat completion requests as Batch API jobs.
+
+    Each step is recorded in the llm_batches and llm_batch_requests tables:
+    prepare() writes the JSONL request file, submit() uploads it and creates
+    the batch, wait() polls until the batch finishes and results() yields the
+    answers of requests not yet marked as ingested. After an interruption,
+    open_batches() returns the unfinished jobs and the same calls pick up
+    where they stopped: nothing is uploaded or submitted twice, and only
+    results the caller hasn't marked are yielded again.
+    """
+
+    def __init__(self, db, client=None, work_dir: Optional[Path] = None,
+                 poll_seconds: Optional[float] = None, cache=None):
+        """
+        Initialize batch runner.
+
+        Args:
+            db: Database instance
+            client: OpenAI SDK client (defaults to the one wrapped by the
+                shared rate-limited client; batch calls don't count toward
+                the per-minute limits)
+            work_dir: Directory for request and result files (defaults to
+                batches/ next to the database)
+            poll_seconds: Seconds between status checks (defaults to
+                LLM_BATCH_POLL_SECONDS env var, then 60)
+            cache: Optional ResponseCache that successful answers are stored
+                in, so later live runs of the same prompts are free
+        """
+        self.db = db
+        self.client = client or get_shared_client().client
+        self.work_dir = Path(work_dir) if work_dir else db.db_path.parent / "batches"
+        if poll_seconds is None:
+            poll_seconds = float(os.getenv("LLM_BATCH_POLL_SECONDS", DEFAULT_POLL_SECONDS))
+        self.poll_seconds = poll_seconds
+        self.cache = cache
+
+    def open_batches(self, kind: str) -> List[Dict]:
+        """Batches of a kind left unfinished (e.g. by an interrupted run), oldest first."""
+        return self.db.get_open_llm_batches(kind)
+
+    def prepare(self, kind: str, requests: List[Dict]) -> Dict:
+        """
+        Write requests to a JSONL batch file and record them.
+
+        Args:
+            kind: Job type, used to find the batch again when resuming
+            requests: Dicts with custom_id, body (chat.completions.create
+                keyword arguments) and optional document_id, party_id,
+                category_id and metadata stored with the request
+
+        Returns:
+            The llm_batches row
+        """
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        input_path = self.work_dir / f"{kind}-{datetime.now():%Y%m%d-%H%M%S-%f}.jsonl"
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for request in requests:
+                line = {'custom_id': request['custom_id'], 'method': 'POST', 'url': BATCH_ENDPOINT,
+                        'body': request['body']}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+        batch_row_id = self.db.create_llm_batch(kind, str(input_path), requests)
+        print(f"  📝 Wrote {len(requests)} requests to {input_path.name}")
+        return self.db.get_llm_batch(batch_row_id)
+
+    def submit(self, batch: Dict) -> Dict:
+        """
+        Upload the request file and create the batch (steps already done are skipped).
+
+        The batch is marked 'submitting' before it is created, so a run
+        interrupted between creating it and recording its id looks the
+        remote batch up by input file instead of paying for it twice.
+        """
+        if batch['batch_id']:
+            return batch
+
+        if not batch['input_file_id']:
+            with open(batch['input_path'], 'rb') as f:
+                uploaded = self.client.files.create(file=f, purpose='batch')
+            self._update(batch, input_file_id=uploaded.id, status='uploaded')
+
+        created = self._find_created(batch) if batch['status'] == 'submitting' else None
+        if created is None:
+            self._update(batch, status='submitting')
+            created = self.client.batches.create(
+                input_file_id=batch['input_file_id'],
+                endpoint=BATCH_ENDPOINT,
+                completion_window=COMPLETION_WINDOW,
+                metadata={'kind': batch['kind'], 'llm_batch': str(batch['id'])}
+            )
+            print(f"  📤 Submitted batch {created.id} ({batch['request_count']} requests)")
+        else:
+            print(f"  🔁 Found batch {created.id} created by an interrupted run")
+        self._update(batch, batch_id=created.id, status=created.status)
+        return batch
+
+    def _find_created(self, batch: Dict):
+        """The remote batch already created for this row's input file, if any."""
+        for remote in self.client.batches.list(limit=100):
+            if remote.input_file_id == batch['input_file_id']:
+                return remote
+        return None
+
+    def wait(self, batch: Dict) -> Dict:
+        """
+        Poll the batch until the API has finished with it.
+
+        Interrupting the wait is safe: the batch keeps running remotely and
+        the next run resumes polling it.
+        """
+        last_counts = None
+        try:
+            while True:
+                remote = self.client.batches.retrieve(batch['batch_id'])
+                if remote.status in FINAL_STATUSES:
+                    self._update(batch, status=remote.status, output_file_id=remote.output_file_id,
+                                 error_file_id=remote.error_file_id)
+                    print(f"  📥 Batch {remote.status}")
+                    return batch
+
+                if remote.status != batch['status']:
+                    self._update(batch, status=remote.status)
+                counts = remote.request_counts
+                counts = (counts.completed, counts.failed, counts.total) if counts else None
+                if counts != last_counts:
+                    done = f": {counts[0] + counts[1]}/{counts[2]} requests done" if counts else ""
+                    print(f"  ⏳ Batch {remote.status}{done}")
+                    last_counts = counts
+                time.sleep(self.poll_seconds)
+        except KeyboardInterrupt:
+            print(f"\n  ⏸️  Stopped waiting; batch {batch['batch_id']} keeps running. "
+                  f"Run the same command again to resume.")
+            raise
+
+    def results(self, batch: Dict) -> Iterator[Tuple[Dict, Optional[ChatCompletion], Optional[str]]]:
+        """
+        Answers of the batch's requests not yet marked as ingested.
+
+        Yields:
+            (request row, response, None) for answered requests and
+            (request row, None, error message) for failed or unanswered ones
+        """
+        answers = {}
+        for file_id in (batch['output_file_id'], batch['error_file_id']):
+            if not file_id:
+                continue
+            for line in self._download(batch, file_id).splitlines():
+                if line.strip():
+                    answer = json.loads(line)
+                    answers[answer['custom_id']] = answer
+
+        bodies = self._request_bodies(batch) if self.cache is not None else {}
+        for request in self.db.get_llm_batch_requests(batch['id']):
+            answer = answers.get(request['custom_id'])
+            if answer is None:
+                yield request, None, f"No result (batch {batch['status']})"
+                continue
+
+            response = answer.get('response') or {}
+            if answer.get('error'):
+                yield request, None, f"Batch request failed: {answer['error'].get('message')}"
+                continue
+            if response.get('status_code') != 200:
+                error = (response.get('body') or {}).get('error') or {}
+                yield request, None, f"Batch request failed (HTTP {response.get('status_code')}): {error.get('message')}"
+                continue
+
+            completion = ChatCompletion.model_validate(response['body'])
+            body = bodies.get(request['custom_id'])
+            if body is not None:
+                key = self.cache.make_key(body['model'], body['messages'], body.get('temperature'),
+                                          body.get('response_format'))
+                self.cache.put(key, body['model'], completion, body.get('response_format'))
+            yield request, completion, None
+
+    def mark(self, request: Dict, status: str):
+        """Record that a request's result was ingested ('completed' or 'failed')."""
+        self.db.update_llm_batch_request(request['batch_row_id'], request['custom_id'], status)
+
+    def finish(self, batch: Dict):
+        """Close a batch once all of its results were ingested."""
+        self._update(batch, status='ingested')
+
+    def _update(self, batch: Dict, **fields):
+        """Persist fields of a batch row and mirror them in the dict."""
+        self.db.update_llm_batch(batch['id'], **fields)
+        batch.update(fields)
+
+    def _download(self, batch: Dict, file_id: str) -> str:
+        """Content of a result file, kept next to the request file so a resumed ingest reuses it."""
+        path = Path(batch['input_path']).with_suffix(f".{file_id}.jsonl")
+        if not path.exists():
+            content = self.client.files.content(file_id).text
+            path.write_text(content, encoding='utf-8')
+        return path.read_text(encoding='utf-8')
+
+    @staticmethod
+    def _request_bodies(batch: Dict) -> Dict[str, Dict]:
+        """Request bodies of a batch by custom_id, read back from its JSONL file."""
+        bodies = {}
+        with open(batch['input_path'], encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    request = json.loads(line)
+                    bodies[request['custom_id']] = request['body']
+        return bodies
@@ -0,0 +1,80 @@
+# ABOUTME: Adaptive page chunking for embeddings: small pages stay whole, larger ones split at sentence boundaries
+# ABOUTME: Shared by scripts/generate_embeddings.py and the stage scheduler so both store identical chunks
+
+from typing import List, Tuple
+
+SMALL_PAGE_THRESHOLD = 1500   # Keep as-is if below this
+MEDIUM_PAGE_THRESHOLD = 3500  # Split into 2 if below this
+TARGET_CHUNK_SIZE = 1500      # Target size for split chunks
+CHUNK_OVERLAP = 100           # Overlap between chunks
+
+
+def chunk_page(
+    text: str,
+    small_page_threshold: int = SMALL_PAGE_THRESHOLD,
+    medium_page_threshold: int = MEDIUM_PAGE_THRESHOLD,
+    target_chunk_size: int = TARGET_CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP
+) -> List[Tuple[int, str]]:
+    """
+    Apply adaptive chunking strategy based on page size.
+
+    Returns:
+        List of (chunk_index, chunk_text) tuples
+    """
+    char_count = len(text)
+
+    # Small pages: keep as-is
+    if char_count < small_page_threshold:
+        return [(0, text)]
+
+    # Medium pages: split into 2 chunks with overlap
+    if char_count < medium_page_threshold:
+        midpoint = char_count // 2
+        # Find a good split point (sentence boundary)
+        split_point = find_split_point(text, midpoint)
+
+        chunk1 = text[:split_point + chunk_overlap]
+        chunk2 = text[split_point - chunk_overlap:]
+
+        return [(0, chunk1), (1, chunk2)]
+
+    # Large pages: split into multiple chunks
+    chunks = []
+    start = 0
+    chunk_index = 0
+
+    while start < char_count:
+        end = min(start + target_chunk_size, char_count)
+
+        # Find sentence boundary if not at end
+        if end < char_count:
+            end = find_split_point(text, end)
+
+        # Extract chunk with overlap from previous
+        chunk_start = max(0, start - chunk_overlap)
+        chunk_text = text[chunk_start:end + chunk_overlap]
+
+        chunks.append((chunk_index, chunk_text))
+
+        start = end
+        chunk_index += 1
+
+    return chunks
+
+
+def find_split_point(text: str, target: int) -> int:
+    """Find nearest sentence boundary to target position."""
+    # Look for sentence endings within 200 chars of target
+    search_start = max(0, target - 100)
+    search_end = min(len(text), target + 100)
+    search_region = text[search_start:search_end]
+
+    # Find last period, exclamation, or question mark
+    for delimiter in ['. ', '! ', '? ', '.\n', '!\n', '?\n']:
+        pos = search_region.rfind(delimiter)
+        if pos != -1:
+            return search_start + pos + len(delimiter)
+
+    # Fallback to target if no sentence boundary found
+    return target
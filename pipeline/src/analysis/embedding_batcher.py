@@ -0,0 +1,238 @@
+# ABOUTME: Packs many text chunks into token-budgeted multi-input embedding requests
+# ABOUTME: Maps results back to caller keys and isolates rejected inputs by bisecting batches
+
+import time
+import asyncio
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import tiktoken
+
+
+class EmbeddingBatcher:
+    """Embeds many texts with as few requests to the embeddings endpoint as possible."""
+
+    # Hard limits of the OpenAI embeddings endpoint
+    MAX_INPUTS_PER_REQUEST = 2048
+    MAX_TOKENS_PER_INPUT = 8191
+
+    # Request was rejected because of its inputs
+    NON_RETRYABLE_STATUS = (400, 413, 422)
+
+    def __init__(
+        self,
+        client,
+        model: str = "text-embedding-3-small",
+        max_batch_tokens: int = 100_000,
+        max_batch_inputs: int = MAX_INPUTS_PER_REQUEST,
+        max_retries: int = 3,
+        retry_delay: float = 2.0,
+        encoding=None
+    ):
+        """
+        Initialize embedding batcher.
+
+        Args:
+            client: OpenAI client (anything exposing embeddings.create; an
+                async client such as AsyncRateLimitedClient for embed_async)
+            model: Embedding model name
+            max_batch_tokens: Token budget per request
+            max_batch_inputs: Maximum number of inputs per request
+            max_retries: Attempts per batch before it is given up on
+            retry_delay: Base delay in seconds between attempts (doubles each time)
+            encoding: Tokenizer with encode/decode (defaults to tiktoken's
+                cl100k_base, which tiktoken downloads on first use)
+        """
+        self.client = client
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = min(max_batch_inputs, self.MAX_INPUTS_PER_REQUEST)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.encoding = encoding or tiktoken.get_encoding("cl100k_base")
+
+        # Statistics
+        self.requests_made = 0
+        self.tokens_embedded = 0
+        self.failures: Dict[Hashable, str] = {}
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in text."""
+        return len(self.encoding.encode(text))
+
+    def embed(self, items: Sequence[Tuple[Hashable, str]]) -> Dict[Hashable, Tuple[List[float], int]]:
+        """
+        Embed many texts using batched requests.
+
+        Args:
+            items: (key, text) pairs, e.g. ((document_text_id, chunk_index), chunk_text)
+
+        Returns:
+            Dict mapping each key to (embedding, token_count). Keys whose
+            embedding could not be generated are left out and recorded in
+            self.failures with the last error message. A batch the endpoint
+            rejects because of its inputs is split in half until the bad
+            inputs are isolated; a batch that still fails for any other
+            reason after max_retries (outage, sustained rate limiting) is
+            recorded as failed as a whole.
+        """
+        results: Dict[Hashable, Tuple[List[float], int]] = {}
+
+        for batch in self.make_batches(items):
+            self._embed_batch(batch, results)
+
+        return results
+
+    def embed_one(self, text: str) -> Tuple[List[float], int]:
+        """Embed a single text (e.g. a search query)."""
+        results = self.embed([(0, text)])
+        if 0 not in results:
+            raise RuntimeError(f"Embedding failed: {self.failures.get(0)}")
+        return results[0]
+
+    def make_batches(self, items: Sequence[Tuple[Hashable, str]]) -> List[List[Tuple[Hashable, str, int]]]:
+        """
+        Pack items into batches that respect the token and input limits.
+
+        Returns:
+            List of batches of (key, text, token_count)
+        """
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for key, text in items:
+            tokens = self.encoding.encode(text)
+            if len(tokens) > self.MAX_TOKENS_PER_INPUT:
+                # Endpoint rejects oversized inputs; keep the leading part
+                tokens = tokens[:self.MAX_TOKENS_PER_INPUT]
+                text = self.encoding.decode(tokens)
+            token_count = len(tokens)
+
+            if current and (current_tokens + token_count > self.max_batch_tokens
+                            or len(current) >= self.max_batch_inputs):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+
+            current.append((key, text, token_count))
+            current_tokens += token_count
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    def _embed_batch(self, batch: List[Tuple[Hashable, str, int]], results: Dict):
+        """Embed one batch, retrying transient errors and bisecting to isolate rejected inputs."""
+        last_error = None
+
+        for attempt in range(self.max_retries):
+            try:
+                response = self.client.embeddings.create(
+                    input=[text for _, text, _ in batch],
+                    model=self.model
+                )
+                self.requests_made += 1
+            except Exception as e:
+                last_error = e
+                if getattr(e, 'status_code', None) in self.NON_RETRYABLE_STATUS:
+                    break  # Retrying the same inputs won't help; bisect instead
+                if attempt < self.max_retries - 1:
+                    time.sleep(self.retry_delay * (2 ** attempt))
+                continue
+
+            # Retry anything the response left out (once progress stops, give up)
+            missing = self._collect(batch, response, results)
+            if missing:
+                self._embed_batch(missing, results)
+            return
+
+        if len(batch) > 1 and self._rejected_inputs(last_error):
+            # Split in half so one bad input doesn't sink the whole batch
+            middle = len(batch) // 2
+            self._embed_batch(batch[:middle], results)
+            self._embed_batch(batch[middle:], results)
+        else:
+            self._fail(batch, last_error)
+
+    async def embed_async(self, items: Sequence[Tuple[Hashable, str]]) -> Dict[Hashable, Tuple[List[float], int]]:
+        """
+        asyncio version of embed: all batches are requested concurrently.
+
+        self.client must be an async client (e.g. AsyncRateLimitedClient),
+        whose embeddings semaphore bounds how many requests are in flight.
+        Tokenizing the texts into batches runs in a worker thread.
+        """
+        results: Dict[Hashable, Tuple[List[float], int]] = {}
+        batches = await asyncio.to_thread(self.make_batches, items)
+        await asyncio.gather(*(self._embed_batch_async(batch, results) for batch in batches))
+        return results
+
+    async def _embed_batch_async(self, batch: List[Tuple[Hashable, str, int]], results: Dict):
+        """asyncio version of _embed_batch (same retries and bisecting)."""
+        last_error = None
+
+        for attempt in range(self.max_retries):
+            try:
+                response = await self.client.embeddings.create(
+                    input=[text for _, text, _ in batch],
+                    model=self.model
+                )
+                self.requests_made += 1
+            except Exception as e:
+                last_error = e
+                if getattr(e, 'status_code', None) in self.NON_RETRYABLE_STATUS:
+                    break
+                if attempt < self.max_retries - 1:
+                    await asyncio.sleep(self.retry_delay * (2 ** attempt))
+                continue
+
+            missing = self._collect(batch, response, results)
+            if missing:
+                await self._embed_batch_async(missing, results)
+            return
+
+        if len(batch) > 1 and self._rejected_inputs(last_error):
+            middle = len(batch) // 2
+            await asyncio.gather(self._embed_batch_async(batch[:middle], results),
+                                 self._embed_batch_async(batch[middle:], results))
+        else:
+            self._fail(batch, last_error)
+
+    def _rejected_inputs(self, error: Exception) -> bool:
+        """
+        Whether the request failed because of its inputs.
+
+        Only then can splitting the batch help; connection errors and rate
+        limits that outlasted the retries would just fail again, twice as often.
+        """
+        return getattr(error, 'status_code', None) in self.NON_RETRYABLE_STATUS
+
+    def _fail(self, batch: List[Tuple[Hashable, str, int]], error: Exception):
+        """Record every input of a batch as failed."""
+        for key, _, _ in batch:
+            self.failures[key] = str(error)
+
+    def _collect(self, batch: List[Tuple[Hashable, str, int]], response, results: Dict) -> List:
+        """
+        Map a response's embeddings back to the batch's keys.
+
+        Returns:
+            Inputs the response left out, worth retrying (empty once no
+            progress was made; those are recorded as failures instead)
+        """
+        missing = []
+        by_index = {item.index: item.embedding for item in response.data}
+        for position, (key, _, token_count) in enumerate(batch):
+            embedding = by_index.get(position)
+            if embedding is None:
+                missing.append(batch[position])
+                continue
+            results[key] = (embedding, token_count)
+            self.tokens_embedded += token_count
+
+        if missing and len(missing) == len(batch):
+            for key, _, _ in missing:
+                self.failures[key] = "No embedding returned for input"
+            return []
+        return missing
@@ -0,0 +1,109 @@
+# ABOUTME: Persistent content-addressed cache of embedding vectors keyed on (model, sha256(text))
+# ABOUTME: Adds an in-process LRU in front of the database for repeated query embeddings
+
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+
+class EmbeddingCache:
+    """
+    Shared store of embeddings for texts already sent to the API.
+
+    Vectors are kept in the embedding_cache table of the pipeline database as
+    float32 blobs (the same encoding as document_embeddings), so re-chunking,
+    re-ingesting a replaced PDF or re-running searches only pays for text
+    that actually changed. Single-text lookups (search queries) are also kept
+    in a small in-process LRU to avoid the database round trip.
+    """
+
+    def __init__(self, db, query_cache_size: int = 512):
+        """
+        Initialize embedding cache.
+
+        Args:
+            db: Database instance
+            query_cache_size: Number of query embeddings kept in memory
+        """
+        self.db = db
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[Tuple[str, str], Tuple[List[float], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Content hash of a text."""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str],
+                 remember: bool = False) -> Dict[int, Tuple[List[float], int]]:
+        """
+        Look up embeddings for texts.
+
+        Args:
+            model: Embedding model (plus dimensions, if not the default)
+            texts: Texts to look up
+            remember: Keep results in the in-process query LRU
+
+        Returns:
+            Dict mapping positions in `texts` to (embedding, token_count)
+        """
+        hashes = [self.text_hash(text) for text in texts]
+        found = {}
+
+        with self._lock:
+            for position, text_hash in enumerate(hashes):
+                key = (model, text_hash)
+                if key in self._queries:
+                    self._queries.move_to_end(key)
+                    found[position] = self._queries[key]
+
+        pending = list({hashes[i] for i in range(len(hashes)) if i not in found})
+        if pending:
+            stored = self.db.get_cached_embeddings(model, pending)
+            for position, text_hash in enumerate(hashes):
+                if position not in found and text_hash in stored:
+                    blob, token_count = stored[text_hash]
+                    embedding = list(struct.unpack(f'{len(blob) // 4}f', blob))
+                    found[position] = (embedding, token_count)
+                    if remember:
+                        self._remember(model, text_hash, found[position])
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+
+        return found
+
+    def put_many(self, model: str, entries: Sequence[Tuple[str, List[float], int]],
+                 remember: bool = False):
+        """
+        Store embeddings.
+
+        Args:
+            model: Embedding model (plus dimensions, if not the default)
+            entries: (text, embedding, token_count) tuples
+            remember: Also keep them in the in-process query LRU
+        """
+        rows = []
+        for text, embedding, token_count in entries:
+            text_hash = self.text_hash(text)
+            rows.append((text_hash, struct.pack(f'{len(embedding)}f', *embedding), token_count))
+            if remember:
+                self._remember(model, text_hash, (embedding, token_count))
+
+        if rows:
+            self.db.save_cached_embeddings(model, rows)
+
+    def _remember(self, model: str, text_hash: str, value: Tuple[List[float], int]):
+        with self._lock:
+            self._queries[(model, text_hash)] = value
+            self._queries.move_to_end((model, text_hash))
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
@@ -4,35 +4,221 @@
 import os
 import json
 from typing import Dict, List, Optional
-from openai import OpenAI
 import tiktoken
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+from .openai_client import AsyncRateLimitedClient, get_shared_client
+from .retrieval import DocumentIndex, category_query, format_passages
+
+# Default token budget for the plan passages sent with each category prompt
+DEFAULT_CONTEXT_TOKENS = 2500
+
+# Shared-context mode: one passage block, selected for all of a document's
+# categories, is sent with every category prompt (a cacheable prefix)
+DEFAULT_SHARED_CONTEXT_TOKENS = 8000
+
+# Multi-category requests: response tokens reserved per category, and the
+# model's output limit that bounds how many categories share one request
+OUTPUT_TOKENS_PER_CATEGORY = 1000
+MAX_OUTPUT_TOKENS = 16000
+
+# Batch API requests are billed at this fraction of the synchronous price
+BATCH_DISCOUNT = 0.5
+
+SYSTEM_PROMPT = """Eres un analista político experto especializado en análisis de programas de gobierno en Costa Rica.
+
+Tu tarea es analizar planes de gobierno de partidos políticos y extraer información estructurada sobre categorías específicas.
+
+Debes ser:
+- Objetivo y preciso en tu análisis
+- Exhaustivo en la identificación de propuestas
+- Claro en resumir posiciones complejas
+- Capaz de identificar la ideología subyacente (progresista, conservadora, centrista)
+- Atento a menciones de presupuesto o costos
+
+Responde siempre en español y en formato JSON válido."""
+
+# Category-independent instructions, sent before the document so every
+# request starts with the same prefix; the category comes last
+CATEGORY_INSTRUCTIONS = """**Instrucciones:**
+1. Lee cuidadosamente los extractos del plan buscando referencias a la categoría indicada al final.
+2. Extrae y resume las propuestas del partido en esa categoría.
+3. Identifica la posición ideológica del partido en ese tema.
+4. Nota cualquier mención de presupuesto, costos o financiamiento.
+
+**Formato de respuesta (JSON):**
+```json
+{
+  "summary": "Resumen detallado de 1-2 párrafos sobre la posición del partido en la categoría. Incluye las principales propuestas y el enfoque general.",
+  "key_proposals": [
+    "Propuesta específica 1",
+    "Propuesta específica 2",
+    "Propuesta específica 3"
+  ],
+  "ideology_position": "progresista|conservador|centrista",
+  "budget_mentioned": "Monto mencionado o 'No especificado'",
+  "confidence_score": 0.95,
+  "has_content": true
+}
+```
+
+**Notas importantes:**
+- Si el documento NO menciona la categoría, establece "has_content": false y proporciona un resumen breve indicando la ausencia de información.
+- El "summary" debe ser detallado (1-2 párrafos) si hay información disponible.
+- Las "key_proposals" deben ser específicas y accionables.
+- "confidence_score" debe reflejar qué tan explícita es la información en el documento (0.0 a 1.0).
+- Cuando sea posible, indica la página de cada propuesta como [Página N].
+
+Responde ÚNICAMENTE con el JSON, sin texto adicional."""
+
+# Same for multi-category requests; the categories and their keys come last
+GROUP_INSTRUCTIONS = """**Instrucciones:**
+1. Para cada categoría indicada al final, busca en los extractos del plan las referencias indicadas.
+2. Extrae y resume las propuestas del partido en cada categoría.
+3. Identifica la posición ideológica del partido en cada tema.
+4. Nota cualquier mención de presupuesto, costos o financiamiento.
+
+**Formato de respuesta:** un objeto JSON con una entrada por clave de categoría. Cada entrada tiene:
+- "summary": resumen detallado de 1-2 párrafos sobre la posición del partido (principales propuestas y enfoque general)
+- "key_proposals": lista de propuestas específicas y accionables
+- "ideology_position": "progresista", "conservador" o "centrista"
+- "budget_mentioned": monto mencionado o "No especificado"
+- "confidence_score": qué tan explícita es la información en el documento (0.0 a 1.0)
+- "has_content": false si el documento NO menciona la categoría (con un resumen breve indicando la ausencia de información)
+
+Cuando sea posible, indica la página de cada propuesta como [Página N]."""
+
+# Fields of one category's analysis (strict structured-output schema)
+CATEGORY_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "key_proposals": {"type": "array", "items": {"type": "string"}},
+        "ideology_position": {"type": "string", "enum": ["progresista", "conservador", "centrista"]},
+        "budget_mentioned": {"type": "string"},
+        "confidence_score": {"type": "number"},
+        "has_content": {"type": "boolean"}
+    },
+    "required": ["summary", "key_proposals", "ideology_position", "budget_mentioned",
+                 "confidence_score", "has_content"],
+    "additionalProperties": False
+}
+
+
+def cached_tokens(usage) -> int:
+    """Prompt tokens the API served from its prompt cache."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return (getattr(details, 'cached_tokens', None) or 0) if details else 0
+
+
+def calculate_cost(usage, batch: bool = False) -> float:
+    """
+    Calculate cost in USD of a GPT-4o request based on token usage.
+
+    GPT-4o pricing (as of 2025):
+    - Input: $5 per million tokens (half price when served from the prompt cache)
+    - Output: $15 per million tokens
+    - Batch API: half of the above
+    """
+    cached = cached_tokens(usage)
+    input_cost = ((usage.prompt_tokens - cached) / 1_000_000) * 5.0 + (cached / 1_000_000) * 2.5
+    output_cost = (usage.completion_tokens / 1_000_000) * 15.0
+    return (input_cost + output_cost) * (BATCH_DISCOUNT if batch else 1.0)
 
 
 class LLMAnalyzer:
     """Analyzes political documents using GPT-4o."""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o"):
+    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o", cache=None,
+                 context_tokens: Optional[int] = None, shared_context: Optional[bool] = None):
         """
         Initialize LLM analyzer.
 
         Args:
             api_key: OpenAI API key (defaults to OPENAI_API_KEY env var)
             model: Model to use (default: gpt-4o)
+            cache: Optional ResponseCache for replaying identical requests
+            context_tokens: Token budget for document passages per category
+                (defaults to LLM_CONTEXT_TOKENS env var, then 2500)
+            shared_context: Send every category of a document the same passage
+                block (see select_shared_context) so requests share a cacheable
+                prefix (defaults to LLM_SHARED_CONTEXT env var)
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key not provided")
 
-        self.client = OpenAI(api_key=self.api_key)
+        # Shared, rate-limited client (handles 429s and transient errors)
+        self.client = get_shared_client(self.api_key, cache=cache)
+        # asyncio counterpart drawing from the same rate limits (see analyze_document_for_category_async)
+        self.async_client = None
         self.model = model
         self.encoding = tiktoken.encoding_for_model(model)
+        self.context_tokens = context_tokens or int(os.getenv("LLM_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS))
+        if shared_context is None:
+            shared_context = os.getenv("LLM_SHARED_CONTEXT", "").lower() in ('1', 'true', 'yes')
+        self.shared_context = shared_context
+        self.shared_context_tokens = int(os.getenv("LLM_SHARED_CONTEXT_TOKENS", DEFAULT_SHARED_CONTEXT_TOKENS))
 
     def count_tokens(self, text: str) -> int:
         """Count tokens in text."""
         return len(self.encoding.encode(text))
 
+    def select_context(self, document_index: DocumentIndex, category: Dict) -> Dict:
+        """
+        Pick the passages of a document most relevant to a category.
+
+        Args:
+            document_index: BM25 index over the document's passages
+            category: Category dict with name, description, prompt_context
+
+        Returns:
+            Dict with text (passages headed by [Página N]), pages cited and
+            tokens used
+        """
+        passages = document_index.pack(category_query(category), self.context_tokens, self.count_tokens)
+        return {
+            'text': format_passages(passages),
+            'pages': sorted({p['page_number'] for p in passages if p['page_number'] is not None}),
+            'tokens': sum(p['tokens'] for p in passages)
+        }
+
+    def select_shared_context(self, document_index: DocumentIndex, categories: List[Dict]) -> Dict:
+        """
+        Pick one passage block serving all of a document's categories.
+
+        Sent unchanged with each category's prompt, it makes the system
+        prompt, instructions and document a prefix shared by all of the
+        document's requests, which the API bills as cached input after the
+        first one.
+
+        Args:
+            document_index: BM25 index over the document's passages
+            categories: Categories that will be analyzed
+
+        Returns:
+            Dict with text, pages and tokens, like select_context
+        """
+        passages = document_index.pack_many([category_query(category) for category in categories],
+                                            self.shared_context_tokens, self.count_tokens)
+        return {
+            'text': format_passages(passages),
+            'pages': sorted({p['page_number'] for p in passages if p['page_number'] is not None}),
+            'tokens': sum(p['tokens'] for p in passages)
+        }
+
+    @staticmethod
+    def _document_message(party_name: str, context: Dict) -> Dict:
+        """User message with the plan excerpts; identical for all categories sharing a context."""
+        return {"role": "user", "content": f"""Plan de gobierno del partido **{party_name}**.
+
+**Extractos del documento:**
+```
+{context['text'] or 'No se encontraron secciones relacionadas.'}
+```"""}
+
     @retry(
+        retry=retry_if_exception_type(ValueError),  # Malformed JSON; rate limits are handled by the client
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10)
     )
@@ -41,121 +227,354 @@ class LLMAnalyzer:
         document_text: str,
         category: Dict,
         party_name: str,
-        max_tokens: int = 4000
+        max_tokens: int = 4000,
+        document_index: Optional[DocumentIndex] = None,
+        context: Optional[Dict] = None
     ) -> Dict:
         """
         Analyze a document for a specific political category.
 
+        Only the passages ranked most relevant to the category, up to
+        context_tokens, are sent (see select_context). The prompt puts the
+        static instructions first, then the document, then the category,
+        so requests share as long a prefix as possible.
+
         Args:
             document_text: Full text of the document
             category: Category dict with name, description, key_topics
             party_name: Name of the political party
             max_tokens: Maximum tokens for response
+            document_index: Index over the document's pages (built from
+                document_text when omitted; pass one to reuse it across
+                categories and get page citations)
+            context: Passages to send instead of selecting them (e.g. from
+                select_shared_context)
 
         Returns:
-            Dict with analysis results
+            Dict with analysis results, including context_pages and
+            context_tokens of the passages sent, and cached_tokens of the
+            prompt
         """
-        system_prompt = """Eres un analista político experto especializado en análisis de programas de gobierno en Costa Rica.
+        if context is None:
+            if document_index is None:
+                document_index = DocumentIndex.from_text(document_text)
+            context = self.select_context(document_index, category)
 
-Tu tarea es analizar planes de gobierno de partidos políticos y extraer información estructurada sobre categorías específicas.
+        request = self.category_request(category, party_name, context, max_tokens)
+        try:
+            response = self.client.chat.completions.create(**request)
+        except Exception as e:
+            raise RuntimeError(f"LLM analysis failed: {e}")
+        return self.parse_category_response(response, context)
 
-Debes ser:
-- Objetivo y preciso en tu análisis
-- Exhaustivo en la identificación de propuestas
-- Claro en resumir posiciones complejas
-- Capaz de identificar la ideología subyacente (progresista, conservadora, centrista)
-- Atento a menciones de presupuesto o costos
+    @retry(
+        retry=retry_if_exception_type(ValueError),  # Malformed JSON; rate limits are handled by the client
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10)
+    )
+    async def analyze_document_for_category_async(
+        self,
+        document_text: str,
+        category: Dict,
+        party_name: str,
+        max_tokens: int = 4000,
+        document_index: Optional[DocumentIndex] = None,
+        context: Optional[Dict] = None
+    ) -> Dict:
+        """
+        asyncio version of analyze_document_for_category.
 
-Responde siempre en español y en formato JSON válido."""
+        Sends the same request through self.async_client (an
+        AsyncRateLimitedClient around self.client, created on first use;
+        callers running several event loops should set and close their own).
 
-        user_prompt = f"""Analiza el siguiente plan de gobierno del partido **{party_name}** y extrae información sobre la categoría: **{category['name']}**
+        Returns:
+            Same dict as analyze_document_for_category
+        """
+        if context is None:
+            if document_index is None:
+                document_index = DocumentIndex.from_text(document_text)
+            context = self.select_context(document_index, category)
+
+        if self.async_client is None:
+            self.async_client = AsyncRateLimitedClient(self.client)
+
+        request = self.category_request(category, party_name, context, max_tokens)
+        try:
+            response = await self.async_client.chat.completions.create(**request)
+        except Exception as e:
+            raise RuntimeError(f"LLM analysis failed: {e}")
+        return self.parse_category_response(response, context)
+
+    def category_request(self, category: Dict, party_name: str, context: Dict,
+                         max_tokens: int = 4000) -> Dict:
+        """
+        Chat completion parameters analyzing one category of a document.
+
+        Args:
+            category: Category dict with name, description, key_topics
+            party_name: Name of the political party
+            context: Passages to send (from select_context or select_shared_context)
+            max_tokens: Maximum tokens for response
+
+        Returns:
+            Keyword arguments for chat.completions.create (also the body of a
+            Batch API request)
+        """
+        category_prompt = f"""**Categoría a analizar:** {category['name']}
 
 **Descripción de la categoría:** {category['description']}
 
 **Temas clave a buscar:**
 {', '.join(category.get('key_topics', []))}
 
-**Documento:**
-```
-{document_text[:20000]}  # Limit to ~20K chars to avoid token limits
-```
+**Buscar referencias a:** {category['prompt_context']}"""
+
+        return {
+            'model': self.model,
+            'messages': [
+                {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{CATEGORY_INSTRUCTIONS}"},
+                self._document_message(party_name, context),
+                {"role": "user", "content": category_prompt}
+            ],
+            'temperature': 0.3,  # Lower temperature for more consistent results
+            'max_tokens': max_tokens,
+            'response_format': {"type": "json_object"}
+        }
+
+    def parse_category_response(self, response, context: Dict, batch: bool = False) -> Dict:
+        """
+        Turn the response to a category_request into an analysis dict.
 
-**Instrucciones:**
-1. Lee cuidadosamente el documento buscando referencias a {category['prompt_context']}.
-2. Extrae y resume las propuestas del partido en esta categoría.
-3. Identifica la posición ideológica del partido en este tema.
-4. Nota cualquier mención de presupuesto, costos o financiamiento.
+        Args:
+            response: ChatCompletion answering the request
+            context: Passages that were sent (for context_pages/context_tokens)
+            batch: The request ran through the Batch API (billed at half price)
 
-**Formato de respuesta (JSON):**
-```json
-{{
-  "summary": "Resumen detallado de 1-2 párrafos sobre la posición del partido en {category['name']}. Incluye las principales propuestas y el enfoque general.",
-  "key_proposals": [
-    "Propuesta específica 1",
-    "Propuesta específica 2",
-    "Propuesta específica 3"
-  ],
-  "ideology_position": "progresista|conservador|centrista",
-  "budget_mentioned": "Monto mencionado o 'No especificado'",
-  "confidence_score": 0.95,
-  "has_content": true
-}}
-```
+        Returns:
+            Dict with analysis results and token, cost and context metadata
 
-**Notas importantes:**
-- Si el documento NO menciona esta categoría, establece "has_content": false y proporciona un resumen breve indicando la ausencia de información.
-- El "summary" debe ser detallado (1-2 párrafos) si hay información disponible.
-- Las "key_proposals" deben ser específicas y accionables.
-- "confidence_score" debe reflejar qué tan explícita es la información en el documento (0.0 a 1.0).
+        Raises:
+            ValueError: If the answer isn't valid JSON
+        """
+        content = response.choices[0].message.content
+        try:
+            result = json.loads(content)
+        except (TypeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Failed to parse LLM JSON response: {e}")
 
-Responde ÚNICAMENTE con el JSON, sin texto adicional."""
+        # Add metadata
+        result['tokens_used'] = response.usage.total_tokens
+        result['prompt_tokens'] = response.usage.prompt_tokens
+        result['completion_tokens'] = response.usage.completion_tokens
+        result['cached_tokens'] = self._cached_tokens(response.usage)
+        result['cost_usd'] = self._calculate_cost(response.usage, batch=batch)
+        result['model'] = self.model
+        result['context_pages'] = context['pages']
+        result['context_tokens'] = context['tokens']
+        result['raw_response'] = content
+
+        return result
+
+    def _calculate_cost(self, usage, batch: bool = False) -> float:
+        """Calculate cost in USD based on token usage (see calculate_cost)."""
+        return calculate_cost(usage, batch=batch)
+
+    @staticmethod
+    def _cached_tokens(usage) -> int:
+        """Prompt tokens the API served from its prompt cache."""
+        return cached_tokens(usage)
+
+    def analyze_document_for_categories(
+        self,
+        document_text: str,
+        categories: List[Dict],
+        party_name: str,
+        document_index: Optional[DocumentIndex] = None,
+        tokens_per_category: int = OUTPUT_TOKENS_PER_CATEGORY,
+        errors: Optional[Dict[str, Exception]] = None
+    ) -> Dict[str, Dict]:
+        """
+        Analyze a document for several categories with one request per group.
+
+        Categories are grouped so each group's answers fit the model's
+        output limit (tokens_per_category each). A group that still
+        overflows (cut-off or unparseable answer) is split in half and
+        retried; a single category falls back to analyze_document_for_category.
+        A failing request only fails the categories it was asked for: the
+        analyses of the other groups are still returned.
+
+        Args:
+            document_text: Full text of the document
+            categories: Category dicts (with category_key)
+            party_name: Name of the political party
+            document_index: Index over the document's pages (built from
+                document_text when omitted)
+            tokens_per_category: Response tokens reserved per category
+            errors: Filled with category_key → exception for the categories
+                that failed (they are left out of the result)
+
+        Returns:
+            Dict mapping category_key to the same analysis dict
+            analyze_document_for_category returns, with the group request's
+            tokens and cost shared evenly among its categories
+        """
+        if document_index is None:
+            document_index = DocumentIndex.from_text(document_text)
+        if errors is None:
+            errors = {}
+
+        group_size = max(1, MAX_OUTPUT_TOKENS // tokens_per_category)
+        results = {}
+        for start in range(0, len(categories), group_size):
+            group = categories[start:start + group_size]
+            results.update(self._analyze_group(document_index, group, party_name, tokens_per_category, errors))
+        return results
+
+    def _analyze_group(self, document_index: DocumentIndex, categories: List[Dict], party_name: str,
+                       tokens_per_category: int, errors: Dict[str, Exception]) -> Dict[str, Dict]:
+        """Analyze a group in one request, splitting it when the answer doesn't fit."""
+        if len(categories) == 1:
+            category = categories[0]
+            try:
+                return {category['category_key']: self.analyze_document_for_category(
+                    document_text='', category=category, party_name=party_name,
+                    document_index=document_index
+                )}
+            except Exception as e:
+                errors[category['category_key']] = e
+                return {}
+
+        try:
+            results = self._request_group(document_index, categories, party_name, tokens_per_category)
+        except Exception as e:
+            for category in categories:
+                errors[category['category_key']] = e
+            return {}
+        missing = [category for category in categories if category['category_key'] not in results]
+        if not missing:
+            return results
+
+        if len(missing) == len(categories):
+            half = len(categories) // 2
+            print(f"    ↔️  Answer for {len(categories)} categories didn't fit; splitting {half} + {len(categories) - half}")
+            retry_groups = [categories[:half], categories[half:]]
+        else:
+            retry_groups = [missing]
+        for group in retry_groups:
+            results.update(self._analyze_group(document_index, group, party_name, tokens_per_category, errors))
+        return results
+
+    def _request_group(self, document_index: DocumentIndex, categories: List[Dict], party_name: str,
+                       tokens_per_category: int) -> Dict[str, Dict]:
+        """
+        One structured-output request for a group of categories.
+
+        Returns:
+            Analyses of the categories answered completely (none when the
+            answer was cut off or didn't parse)
+        """
+        contexts = {}
+        passages = {}
+        for category in categories:
+            selected = document_index.pack(category_query(category), self.context_tokens, self.count_tokens)
+            passages.update((passage['index'], passage) for passage in selected)
+            contexts[category['category_key']] = {
+                'pages': sorted({p['page_number'] for p in selected if p['page_number'] is not None}),
+                'tokens': sum(p['tokens'] for p in selected)
+            }
+        # Passages relevant to several categories are sent once
+        context_text = format_passages([passages[index] for index in sorted(passages)])
+
+        category_sections = "\n\n".join(
+            f"""### `{category['category_key']}`: {category['name']}
+- **Descripción:** {category['description']}
+- **Temas clave:** {', '.join(category.get('key_topics', []))}
+- **Buscar referencias a:** {category['prompt_context']}"""
+            for category in categories
+        )
+
+        categories_prompt = f"""**Categorías a analizar** (claves: {', '.join(c['category_key'] for c in categories)}):
+
+{category_sections}"""
+
+        keys = [category['category_key'] for category in categories]
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "category_analyses",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {key: CATEGORY_ANALYSIS_SCHEMA for key in keys},
+                    "required": keys,
+                    "additionalProperties": False
+                }
+            }
+        }
 
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
+                    {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{GROUP_INSTRUCTIONS}"},
+                    self._document_message(party_name, {'text': context_text}),
+                    {"role": "user", "content": categories_prompt}
                 ],
-                temperature=0.3,  # Lower temperature for more consistent results
-                max_tokens=max_tokens,
-                response_format={"type": "json_object"}
+                temperature=0.3,
+                max_tokens=min(MAX_OUTPUT_TOKENS, tokens_per_category * len(categories)),
+                response_format=response_format
             )
-
-            # Extract and parse JSON
-            content = response.choices[0].message.content
-            result = json.loads(content)
-
-            # Add metadata
-            result['tokens_used'] = response.usage.total_tokens
-            result['cost_usd'] = self._calculate_cost(response.usage)
-            result['model'] = self.model
-            result['raw_response'] = content
-
-            return result
-
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Failed to parse LLM JSON response: {e}")
         except Exception as e:
             raise RuntimeError(f"LLM analysis failed: {e}")
 
-    def _calculate_cost(self, usage) -> float:
-        """
-        Calculate cost in USD based on token usage.
+        choice = response.choices[0]
+        if choice.finish_reason == 'length':
+            return {}
+        try:
+            answers = json.loads(choice.message.content)
+        except (TypeError, json.JSONDecodeError):
+            return {}
+
+        answered = [key for key in keys if isinstance(answers.get(key), dict) and 'summary' in answers[key]]
+        if not answered:
+            return {}
+
+        # The request is shared by the categories it answered
+        usage = response.usage
+        shares = {
+            'tokens_used': self._split_evenly(usage.total_tokens, len(answered)),
+            'prompt_tokens': self._split_evenly(usage.prompt_tokens, len(answered)),
+            'completion_tokens': self._split_evenly(usage.completion_tokens, len(answered)),
+            'cached_tokens': self._split_evenly(self._cached_tokens(usage), len(answered))
+        }
+        cost = self._calculate_cost(usage)
+
+        results = {}
+        for i, key in enumerate(answered):
+            result = dict(answers[key])
+            result.update({name: values[i] for name, values in shares.items()})
+            result['cost_usd'] = cost / len(answered)
+            result['model'] = self.model
+            result['raw_response'] = json.dumps(answers[key], ensure_ascii=False)
+            result['context_pages'] = contexts[key]['pages']
+            result['context_tokens'] = contexts[key]['tokens']
+            result['group_size'] = len(categories)
+            results[key] = result
+        return results
 
-        GPT-4o pricing (as of 2025):
-        - Input: $5 per million tokens
-        - Output: $15 per million tokens
-        """
-        input_cost = (usage.prompt_tokens / 1_000_000) * 5.0
-        output_cost = (usage.completion_tokens / 1_000_000) * 15.0
-        return input_cost + output_cost
+    @staticmethod
+    def _split_evenly(total: int, parts: int) -> List[int]:
+        """Integer shares of total that add up to it."""
+        share, remainder = divmod(total, parts)
+        return [share + (1 if i < remainder else 0) for i in range(parts)]
 
     def analyze_multiple_categories(
         self,
         document_text: str,
         categories: List[Dict],
-        party_name: str
+        party_name: str,
+        grouped: bool = False
     ) -> List[Dict]:
         """
         Analyze a document for multiple categories.
@@ -164,11 +583,35 @@ Responde ÚNICAMENTE con el JSON, sin texto adicional."""
             document_text: Full document text
             categories: List of category dicts
             party_name: Party name
+            grouped: Analyze the categories in shared requests
+                (see analyze_document_for_categories) instead of one each
 
         Returns:
             List of analysis results for each category
         """
         results = []
+        document_index = DocumentIndex.from_text(document_text)
+
+        if grouped:
+            print(f"  Analyzing {len(categories)} categories together...", end=' ')
+            errors = {}
+            analyses = self.analyze_document_for_categories(
+                document_text=document_text,
+                categories=categories,
+                party_name=party_name,
+                document_index=document_index,
+                errors=errors
+            )
+
+            print(f"✓ {len(analyses)}/{len(categories)} (${sum(a['cost_usd'] for a in analyses.values()):.4f})")
+            for category in categories:
+                key = category['category_key']
+                if key in analyses:
+                    results.append({'category': category, 'analysis': analyses[key], 'success': True})
+                else:
+                    print(f"    ✗ {category['name']}: Error - {errors[key]}")
+                    results.append({'category': category, 'error': str(errors[key]), 'success': False})
+            return results
 
         for category in categories:
             print(f"  Analyzing category: {category['name']}...", end=' ')
@@ -177,7 +620,8 @@ Responde ÚNICAMENTE con el JSON, sin texto adicional."""
                 result = self.analyze_document_for_category(
                     document_text=document_text,
                     category=category,
-                    party_name=party_name
+                    party_name=party_name,
+                    document_index=document_index
                 )
                 results.append({
                     'category': category,
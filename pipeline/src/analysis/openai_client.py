@@ -0,0 +1,626 @@
+# ABOUTME: Shared OpenAI client wrapper with per-model RPM/TPM token buckets and adaptive concurrency
+# ABOUTME: Pre-counts tokens with tiktoken, honours retry-after headers and backs off on 429s (sync and asyncio)
+
+import os
+import time
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
+
+import tiktoken
+from openai import (
+    OpenAI,
+    AsyncOpenAI,
+    RateLimitError,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+)
+from openai.types import CreateEmbeddingResponse, Embedding
+
+# Errors worth retrying besides 429s
+TRANSIENT_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `per_minute` units."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0  # units per second
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take `amount` units and return how many seconds to wait before using them.
+
+        The bucket may go negative; later callers then queue up behind this
+        reservation, which keeps waiting times fair under contention.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        """Give back over-reserved units (e.g. when actual usage was lower)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def pause(self, seconds: float):
+        """Empty the bucket so nothing is granted for roughly `seconds`."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight requests.
+
+    The limit halves on every rate-limit response and grows by one after
+    `increase_after` consecutive successes, converging on the highest
+    concurrency the account can sustain.
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64,
+                 increase_after: int = 10):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    def on_rate_limited(self):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._successes = 0
+
+
+class AsyncAdaptiveConcurrency:
+    """
+    asyncio gate on in-flight requests whose limit follows an AdaptiveConcurrency.
+
+    The additive-increase / multiplicative-decrease state is the shared
+    object's: a 429 seen by a coroutine halves the limit for threads as
+    well, and vice versa. `maximum` caps this gate on top of it (e.g. per
+    endpoint). Waiters are woken when a request finishes here; a gate with
+    nothing in flight always admits one request.
+    """
+
+    def __init__(self, shared: AdaptiveConcurrency, maximum: int):
+        self.shared = shared
+        self.maximum = maximum
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(1, min(self.shared.limit, self.maximum))
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self.shared.on_success()
+
+    def on_rate_limited(self):
+        self.shared.on_rate_limited()
+
+
+class RateLimitedClient:
+    """
+    Drop-in replacement for the parts of OpenAI() the pipeline uses.
+
+    Exposes chat.completions.create(...) and embeddings.create(...) with the
+    same signatures, but every call first reserves capacity in the model's
+    requests-per-minute and tokens-per-minute buckets and passes through an
+    adaptive concurrency limit shared by all threads of the process.
+    """
+
+    # (requests per minute, tokens per minute) — OpenAI usage tier 1 defaults.
+    # Override with OPENAI_RATE_LIMITS="gpt-4o=5000:800000,text-embedding-3-small=5000:5000000"
+    DEFAULT_LIMITS = {
+        'gpt-4o': (500, 30_000),
+        'gpt-4o-mini': (500, 200_000),
+        'text-embedding-3-small': (3_000, 1_000_000),
+    }
+    FALLBACK_LIMITS = (500, 30_000)
+
+    # Output tokens assumed for chat requests that don't set max_tokens
+    DEFAULT_COMPLETION_TOKENS = 1_000
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        client: Optional[OpenAI] = None,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        max_retries: int = 6,
+        initial_concurrency: int = 8,
+        max_concurrency: int = 64,
+        cache=None,
+        embedding_cache=None
+    ):
+        """
+        Initialize rate-limited client.
+
+        Args:
+            api_key: OpenAI API key (defaults to OPENAI_API_KEY env var)
+            client: Pre-built OpenAI client (its own retries should be disabled)
+            limits: Per-model (rpm, tpm) overrides
+            max_retries: Retries per call on 429 and transient errors
+            initial_concurrency: Starting in-flight request limit
+            max_concurrency: Upper bound for the adaptive limit
+            cache: Optional ResponseCache consulted before chat completion calls
+            embedding_cache: Optional EmbeddingCache consulted before embedding calls
+        """
+        # Retries are handled here, with knowledge of the shared buckets
+        self.client = client or OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.limits = dict(self.DEFAULT_LIMITS)
+        self.limits.update(self._limits_from_env())
+        self.limits.update(limits or {})
+        self.max_retries = max_retries
+        self.concurrency = AdaptiveConcurrency(initial=initial_concurrency, maximum=max_concurrency)
+        self.cache = cache
+        self.embedding_cache = embedding_cache
+
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._encodings: Dict[str, tiktoken.Encoding] = {}
+        self._lock = threading.Lock()
+
+        # prompt_tokens/cached_tokens count chat requests answered by the API
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'tokens': 0,
+                      'prompt_tokens': 0, 'cached_tokens': 0}
+
+        # Same attribute paths as the OpenAI SDK
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    def cached_token_ratio(self) -> float:
+        """Share of chat prompt tokens the API served from its prompt cache so far."""
+        if not self.stats['prompt_tokens']:
+            return 0.0
+        return self.stats['cached_tokens'] / self.stats['prompt_tokens']
+
+    @staticmethod
+    def _limits_from_env() -> Dict[str, Tuple[int, int]]:
+        """Parse OPENAI_RATE_LIMITS ("model=rpm:tpm,...")."""
+        limits = {}
+        for entry in os.getenv("OPENAI_RATE_LIMITS", "").split(','):
+            if '=' not in entry:
+                continue
+            model, values = entry.split('=', 1)
+            rpm, tpm = values.split(':')
+            limits[model.strip()] = (int(rpm), int(tpm))
+        return limits
+
+    def _get_buckets(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        with self._lock:
+            if model not in self._buckets:
+                rpm, tpm = self.limits.get(model, self.FALLBACK_LIMITS)
+                self._buckets[model] = (TokenBucket(rpm), TokenBucket(tpm))
+            return self._buckets[model]
+
+    def _get_encoding(self, model: str) -> tiktoken.Encoding:
+        with self._lock:
+            if model not in self._encodings:
+                try:
+                    self._encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    self._encodings[model] = tiktoken.get_encoding("cl100k_base")
+            return self._encodings[model]
+
+    def count_chat_tokens(self, model: str, messages, max_tokens: Optional[int]) -> int:
+        """Estimate tokens a chat request counts against TPM (prompt + max output)."""
+        encoding = self._get_encoding(model)
+        prompt_tokens = sum(len(encoding.encode(m.get('content') or '')) + 4 for m in messages) + 3
+        return prompt_tokens + (max_tokens or self.DEFAULT_COMPLETION_TOKENS)
+
+    def count_embedding_tokens(self, model: str, inputs) -> int:
+        """Count tokens of embedding inputs."""
+        encoding = self._get_encoding(model)
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return sum(len(encoding.encode(text)) for text in inputs)
+
+    def _create_chat_completion(self, **kwargs):
+        model = kwargs['model']
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(model, kwargs['messages'], kwargs.get('temperature'),
+                                            kwargs.get('response_format'))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        estimated = self.count_chat_tokens(model, kwargs['messages'], kwargs.get('max_tokens'))
+        response = self._call(model, estimated, lambda: self.client.chat.completions.create(**kwargs))
+        self._record_prompt_usage(response)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, model, response, kwargs.get('response_format'))
+        return response
+
+    def _count(self, key: str, amount: int = 1):
+        """Add to a stats counter (calls come from many threads)."""
+        with self._lock:
+            self.stats[key] += amount
+
+    def _record_prompt_usage(self, response):
+        """Add a chat response's prompt and cached tokens to the stats."""
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            with self._lock:
+                self.stats['prompt_tokens'] += usage.prompt_tokens
+                self.stats['cached_tokens'] += getattr(details, 'cached_tokens', None) or 0
+
+    def _create_embedding(self, **kwargs):
+        model = kwargs['model']
+        if self.embedding_cache is not None:
+            return self._create_embedding_cached(**kwargs)
+        estimated = self.count_embedding_tokens(model, kwargs['input'])
+        return self._call(model, estimated, lambda: self.client.embeddings.create(**kwargs))
+
+    def _create_embedding_cached(self, **kwargs):
+        """Embed only the inputs missing from the embedding cache and merge the results."""
+        plan = self._plan_cached_embedding(kwargs)
+        response = None
+        if plan['missing']:
+            request = dict(kwargs, input=plan['missing_texts'])
+            response = self._call(kwargs['model'], sum(plan['token_counts']),
+                                  lambda: self.client.embeddings.create(**request))
+        return self._finish_cached_embedding(plan, response)
+
+    def _plan_cached_embedding(self, kwargs) -> Dict:
+        """Look up an embeddings request's inputs in the cache; returns what is left to embed."""
+        model = kwargs['model']
+        single = isinstance(kwargs['input'], str)
+        texts = [kwargs['input']] if single else list(kwargs['input'])
+        # Vectors of different sizes must not share cache entries
+        cache_model = f"{model}:{kwargs['dimensions']}" if kwargs.get('dimensions') else model
+
+        found = self.embedding_cache.get_many(cache_model, texts, remember=single)
+        missing = [position for position in range(len(texts)) if position not in found]
+        encoding = self._get_encoding(model)
+        return {
+            'model': model,
+            'cache_model': cache_model,
+            'single': single,
+            'texts': texts,
+            'vectors': {position: embedding for position, (embedding, _) in found.items()},
+            'missing': missing,
+            'missing_texts': [texts[position] for position in missing],
+            'token_counts': [len(encoding.encode(texts[position])) for position in missing]
+        }
+
+    def _finish_cached_embedding(self, plan: Dict, response) -> CreateEmbeddingResponse:
+        """Cache the newly embedded inputs and merge them with the cached ones."""
+        vectors = plan['vectors']
+        prompt_tokens = 0
+        if response is not None:
+            new_entries = []
+            for item in response.data:
+                position = plan['missing'][item.index]
+                vectors[position] = item.embedding
+                new_entries.append((plan['texts'][position], item.embedding, plan['token_counts'][item.index]))
+            self.embedding_cache.put_many(plan['cache_model'], new_entries, remember=plan['single'])
+            prompt_tokens = response.usage.prompt_tokens
+
+        # Same shape as an API response; usage only counts tokens actually billed
+        return CreateEmbeddingResponse(
+            object='list',
+            model=plan['model'],
+            data=[Embedding(object='embedding', index=position, embedding=vectors[position])
+                  for position in sorted(vectors)],
+            usage={'prompt_tokens': prompt_tokens, 'total_tokens': prompt_tokens}
+        )
+
+    def _call(self, model: str, estimated_tokens: int, request):
+        """Run `request` within the model's rate limits, retrying 429s and transient errors."""
+        request_bucket, token_bucket = self._get_buckets(model)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            wait = max(request_bucket.reserve(1), token_bucket.reserve(estimated_tokens))
+            if wait > 0:
+                time.sleep(wait)
+
+            self.concurrency.acquire()
+            try:
+                self._count('requests')
+                response = request()
+            except RateLimitError as e:
+                last_error = e
+                self._count('rate_limited')
+                self.concurrency.on_rate_limited()
+                # The rejected attempt used no capacity; the retry reserves its own
+                self._refund(request_bucket, token_bucket, estimated_tokens)
+                pause = self._retry_after(e) or self._backoff(attempt)
+                # Hold back every thread using this model, not just this one;
+                # the next reserve() call does the waiting
+                request_bucket.pause(pause)
+                token_bucket.pause(pause)
+                delay = 0.0
+            except TRANSIENT_ERRORS as e:
+                last_error = e
+                self._refund(request_bucket, token_bucket, estimated_tokens)
+                delay = self._backoff(attempt)
+            else:
+                self.concurrency.on_success()
+                usage = getattr(response, 'usage', None)
+                actual = getattr(usage, 'total_tokens', None) if usage else None
+                if actual is not None:
+                    self._count('tokens', actual)
+                    if actual < estimated_tokens:
+                        token_bucket.refund(estimated_tokens - actual)
+                return response
+            finally:
+                self.concurrency.release()
+
+            self._count('retries')
+            if delay > 0:
+                time.sleep(delay)
+
+        raise last_error
+
+    @staticmethod
+    def _refund(request_bucket: TokenBucket, token_bucket: TokenBucket, estimated_tokens: int):
+        """Give back a failed attempt's reservation."""
+        request_bucket.refund(1)
+        token_bucket.refund(estimated_tokens)
+
+    @staticmethod
+    def _retry_after(error) -> Optional[float]:
+        """Seconds the server asked us to wait, if it said so."""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None) or {}
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000.0
+            if headers.get('retry-after'):
+                return float(headers['retry-after'])
+        except ValueError:
+            pass
+        return None
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with jitter, capped at 60 seconds."""
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+class AsyncRateLimitedClient:
+    """
+    asyncio counterpart of RateLimitedClient, built on AsyncOpenAI.
+
+    Exposes the same chat.completions.create(...) and embeddings.create(...)
+    as coroutines. Calls draw from the RPM/TPM buckets of the wrapped
+    RateLimitedClient, so sync and async callers in one process share the
+    account's limits, and wait on them with asyncio.sleep. In-flight
+    requests are bounded per endpoint by an AsyncAdaptiveConcurrency gate
+    that follows the wrapped client's adaptive limit, so 429s shrink it
+    and successes grow it, up to the endpoint's configured maximum. The
+    response and embedding caches (SQLite) are consulted in worker threads
+    so they don't block the event loop.
+
+    AsyncOpenAI's connection pool belongs to the event loop it was first
+    used on: create one client per asyncio.run() and close it when done
+    (or use it as an async context manager).
+    """
+
+    # Most requests in flight per endpoint (the adaptive limit starts lower and grows towards it)
+    # Override with OPENAI_ASYNC_CONCURRENCY="chat=64,embeddings=16"
+    DEFAULT_CONCURRENCY = {'chat': 32, 'embeddings': 8}
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimitedClient] = None,
+        client: Optional[AsyncOpenAI] = None,
+        concurrency: Optional[Dict[str, int]] = None
+    ):
+        """
+        Initialize async rate-limited client.
+
+        Args:
+            limiter: RateLimitedClient whose buckets, caches, retry settings
+                and stats are shared (defaults to the process-wide one)
+            client: Pre-built AsyncOpenAI client (defaults to one with the
+                limiter's API key and base URL; its own retries should be disabled)
+            concurrency: Per-endpoint ('chat', 'embeddings') in-flight maximum overrides
+        """
+        self.limiter = limiter or get_shared_client()
+        self.client = client or AsyncOpenAI(api_key=self.limiter.client.api_key,
+                                            base_url=self.limiter.client.base_url, max_retries=0)
+        self.concurrency = dict(self.DEFAULT_CONCURRENCY)
+        self.concurrency.update(self._concurrency_from_env())
+        self.concurrency.update(concurrency or {})
+        self._gates = {endpoint: AsyncAdaptiveConcurrency(self.limiter.concurrency, maximum)
+                       for endpoint, maximum in self.concurrency.items()}
+
+        # Most requests seen in flight at once per endpoint
+        self.peak_in_flight = {endpoint: 0 for endpoint in self.concurrency}
+
+        # Same attribute paths as the OpenAI SDK
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_chat_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Counters shared with the wrapped RateLimitedClient."""
+        return self.limiter.stats
+
+    async def close(self):
+        """Close the underlying HTTP connection pool."""
+        await self.client.close()
+
+    async def __aenter__(self) -> "AsyncRateLimitedClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @staticmethod
+    def _concurrency_from_env() -> Dict[str, int]:
+        """Parse OPENAI_ASYNC_CONCURRENCY (endpoint=limit,...)."""
+        concurrency = {}
+        for entry in filter(None, os.getenv("OPENAI_ASYNC_CONCURRENCY", "").split(',')):
+            endpoint, _, limit = entry.partition('=')
+            concurrency[endpoint.strip()] = int(limit)
+        return concurrency
+
+    async def _create_chat_completion(self, **kwargs):
+        model = kwargs['model']
+        cache = self.limiter.cache
+
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model, kwargs['messages'], kwargs.get('temperature'),
+                                       kwargs.get('response_format'))
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        estimated = self.limiter.count_chat_tokens(model, kwargs['messages'], kwargs.get('max_tokens'))
+        response = await self._call('chat', model, estimated,
+                                    lambda: self.client.chat.completions.create(**kwargs))
+        self.limiter._record_prompt_usage(response)
+
+        if cache_key is not None:
+            await asyncio.to_thread(cache.put, cache_key, model, response, kwargs.get('response_format'))
+        return response
+
+    async def _create_embedding(self, **kwargs):
+        model = kwargs['model']
+        if self.limiter.embedding_cache is not None:
+            plan = await asyncio.to_thread(self.limiter._plan_cached_embedding, kwargs)
+            response = None
+            if plan['missing']:
+                request = dict(kwargs, input=plan['missing_texts'])
+                response = await self._call('embeddings', model, sum(plan['token_counts']),
+                                            lambda: self.client.embeddings.create(**request))
+            return await asyncio.to_thread(self.limiter._finish_cached_embedding, plan, response)
+
+        estimated = self.limiter.count_embedding_tokens(model, kwargs['input'])
+        return await self._call('embeddings', model, estimated,
+                                lambda: self.client.embeddings.create(**kwargs))
+
+    async def _call(self, endpoint: str, model: str, estimated_tokens: int, request):
+        """Await `request()` within the model's rate limits and the endpoint's adaptive limit, with retries."""
+        limiter = self.limiter
+        request_bucket, token_bucket = limiter._get_buckets(model)
+        gate = self._gates[endpoint]
+        last_error = None
+
+        for attempt in range(limiter.max_retries + 1):
+            wait = max(request_bucket.reserve(1), token_bucket.reserve(estimated_tokens))
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            await gate.acquire()
+            self.peak_in_flight[endpoint] = max(self.peak_in_flight[endpoint], gate.in_flight)
+            try:
+                limiter._count('requests')
+                response = await request()
+            except RateLimitError as e:
+                last_error = e
+                limiter._count('rate_limited')
+                gate.on_rate_limited()
+                limiter._refund(request_bucket, token_bucket, estimated_tokens)
+                pause = limiter._retry_after(e) or limiter._backoff(attempt)
+                # Hold back every caller using this model; the next reserve() does the waiting
+                request_bucket.pause(pause)
+                token_bucket.pause(pause)
+                delay = 0.0
+            except TRANSIENT_ERRORS as e:
+                last_error = e
+                limiter._refund(request_bucket, token_bucket, estimated_tokens)
+                delay = limiter._backoff(attempt)
+            else:
+                gate.on_success()
+                usage = getattr(response, 'usage', None)
+                actual = getattr(usage, 'total_tokens', None) if usage else None
+                if actual is not None:
+                    limiter._count('tokens', actual)
+                    if actual < estimated_tokens:
+                        token_bucket.refund(estimated_tokens - actual)
+                return response
+            finally:
+                await gate.release()
+
+            limiter._count('retries')
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        raise last_error
+
+
+_shared_clients: Dict[str, RateLimitedClient] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_client(api_key: Optional[str] = None, cache=None,
+                      embedding_cache=None) -> RateLimitedClient:
+    """
+    Get the process-wide RateLimitedClient for an API key.
+
+    All LLM and embedding call sites share it so their requests draw from
+    the same rate-limit buckets.
+
+    Args:
+        api_key: OpenAI API key (defaults to OPENAI_API_KEY env var)
+        cache: ResponseCache to attach; chat completions from every call
+            site sharing the client then go through it
+        embedding_cache: EmbeddingCache to attach, likewise for embeddings
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    with _shared_lock:
+        if api_key not in _shared_clients:
+            _shared_clients[api_key] = RateLimitedClient(api_key=api_key)
+        client = _shared_clients[api_key]
+        if cache is not None:
+            client.cache = cache
+        if embedding_cache is not None:
+            client.embedding_cache = embedding_cache
+        return client
@@ -0,0 +1,155 @@
+# ABOUTME: Persistent content-addressed cache for chat completion responses
+# ABOUTME: Keys on (model, messages, temperature, response_format) so identical prompts are never paid twice
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from openai.types.chat import ChatCompletion
+
+
+class CacheMissError(LookupError):
+    """Raised in offline mode when a request has no recorded response."""
+
+
+class ResponseCache:
+    """
+    SQLite-backed store of chat completion responses.
+
+    Entries live in the llm_response_cache table of the pipeline database and
+    are evicted least-recently-used once their total size exceeds
+    max_size_bytes. In offline mode a cache miss raises CacheMissError instead
+    of calling the API, so runs can be replayed without network access.
+
+    Lookups never write: hit/miss counts and the LRU timestamps of hit
+    entries are buffered in memory and flushed in one transaction every
+    FLUSH_EVERY lookups, before each eviction pass and when the database
+    is closed.
+    """
+
+    DEFAULT_MAX_SIZE_BYTES = 256 * 1024 * 1024
+
+    # How many new entries to store between eviction passes
+    PRUNE_EVERY = 50
+
+    # How many lookups to buffer before writing their usage to the database
+    FLUSH_EVERY = 200
+
+    def __init__(self, db, max_size_bytes: Optional[int] = None, offline: Optional[bool] = None):
+        """
+        Initialize response cache.
+
+        Args:
+            db: Database instance
+            max_size_bytes: Size limit before LRU eviction (defaults to
+                LLM_CACHE_MAX_MB env var, or 256 MB)
+            offline: Fail on cache misses instead of calling the API
+                (defaults to LLM_CACHE_OFFLINE=1 env var)
+        """
+        self.db = db
+        if max_size_bytes is None:
+            max_mb = os.getenv("LLM_CACHE_MAX_MB")
+            max_size_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else self.DEFAULT_MAX_SIZE_BYTES
+        self.max_size_bytes = max_size_bytes
+        if offline is None:
+            offline = os.getenv("LLM_CACHE_OFFLINE", "") == "1"
+        self.offline = offline
+
+        # Statistics for this process (persistent totals live in the database)
+        self.hits = 0
+        self.misses = 0
+        self._stores = 0
+        self._lock = threading.Lock()
+
+        # Usage not yet written: cache_key → [hits, last used], and counter increments
+        self._pending_touches: Dict[str, list] = {}
+        self._pending_counts = {'hits': 0, 'misses': 0}
+        db.on_close(self.flush)
+
+    @staticmethod
+    def make_key(model: str, messages, temperature=None, response_format=None) -> str:
+        """Hash the parts of a request that determine its response."""
+        payload = json.dumps({
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'response_format': response_format
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        """
+        Look up a cached response.
+
+        Raises:
+            CacheMissError: If offline and the response isn't cached
+        """
+        response_json = self.db.get_cached_llm_response(key)
+        stat = 'hits' if response_json is not None else 'misses'
+
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+            self._pending_counts[stat] += 1
+            if response_json is not None:
+                touch = self._pending_touches.setdefault(key, [0, None])
+                touch[0] += 1
+                touch[1] = datetime.now()
+            flush = sum(self._pending_counts.values()) >= self.FLUSH_EVERY
+        if flush:
+            self.flush()
+
+        if response_json is None:
+            if self.offline:
+                raise CacheMissError(f"No cached response for request {key[:12]} (offline mode)")
+            return None
+
+        return ChatCompletion.model_validate_json(response_json)
+
+    def put(self, key: str, model: str, response: ChatCompletion, response_format=None):
+        """
+        Store a response and evict old entries when over the size limit.
+
+        Responses that were cut off or, for JSON modes, don't parse are not
+        stored, so a retry of the same request reaches the API again.
+        """
+        choice = response.choices[0] if response.choices else None
+        if choice is None or choice.finish_reason not in (None, 'stop'):
+            return
+        if (response_format or {}).get('type') in ('json_object', 'json_schema'):
+            try:
+                json.loads(choice.message.content or '')
+            except ValueError:
+                return
+
+        self.db.save_cached_llm_response(key, model, response.model_dump_json())
+
+        with self._lock:
+            self._stores += 1
+            prune = self._stores % self.PRUNE_EVERY == 1
+        if prune:
+            # Eviction orders by last_used_at, so write buffered hits first
+            self.flush()
+            self.db.prune_llm_cache(self.max_size_bytes)
+
+    def flush(self):
+        """Write buffered hit/miss counts and LRU timestamps to the database."""
+        with self._lock:
+            touches = {key: tuple(touch) for key, touch in self._pending_touches.items()}
+            counts = dict(self._pending_counts)
+            self._pending_touches.clear()
+            self._pending_counts = {'hits': 0, 'misses': 0}
+
+        if touches or any(counts.values()):
+            self.db.record_llm_cache_usage(touches, counts)
+
+    def get_stats(self) -> Dict:
+        """Hit/miss counts for this process."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
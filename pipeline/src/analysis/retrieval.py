@@ -0,0 +1,200 @@
+# ABOUTME: BM25 retrieval over a plan's pages so each category prompt carries only relevant passages
+# ABOUTME: Splits pages into paragraph passages, ranks them per category and packs them into a token budget
+
+import re
+import math
+import unicodedata
+from collections import Counter
+from typing import Callable, Dict, Iterable, List
+
+# Paragraph passages are merged up to this size before indexing
+PASSAGE_CHARS = 600
+
+# Tokens are cut to a prefix: a cheap stemmer for Spanish inflection
+# (económico/economía → "econo", impuesto/impuestos → "impue")
+STEM_CHARS = 5
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+    a al algo ante antes como con contra cual cuales cuando de del desde donde
+    durante e el ella ellas ellos en entre era es esa esas ese eso esos esta
+    estas este esto estos fue fueron ha han hasta hay la las le les lo los mas
+    me mi mis mucho muy ni no nos nuestra nuestras nuestro nuestros o otra
+    otras otro otros para pero por porque que se sea ser si sin sobre son su
+    sus tambien tanto te todo todos tu un una uno unos y ya
+""".split())
+
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, accent-stripped, stemmed terms of a text (stopwords dropped)."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return [
+        word[:STEM_CHARS] for word in WORD_RE.findall(text)
+        if len(word) > 2 and word not in STOPWORDS and not word.isdigit()
+    ]
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_CHARS) -> List[str]:
+    """Split text into paragraph passages of up to max_chars (longer paragraphs stay whole)."""
+    passages, current = [], ''
+    for paragraph in PARAGRAPH_RE.split(text or ''):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            passages.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+def category_query(category: Dict) -> str:
+    """Search query for a category: its name, description, key topics and prompt context."""
+    parts = [category.get('name'), category.get('description'), category.get('prompt_context')]
+    parts.extend(category.get('key_topics') or [])
+    return ' '.join(part for part in parts if part)
+
+
+class DocumentIndex:
+    """BM25 index over the passages of one document."""
+
+    def __init__(self, pages: Iterable[Dict], max_chars: int = PASSAGE_CHARS):
+        """
+        Build the index.
+
+        Args:
+            pages: Page dicts with page_number and raw_text (as stored in
+                document_text) or text (as returned by the extractors)
+            max_chars: Maximum passage size in characters
+        """
+        self.passages = []
+        for page in pages:
+            text = page.get('raw_text', page.get('text'))
+            for passage in split_passages(text, max_chars):
+                self.passages.append({
+                    'index': len(self.passages),
+                    'page_number': page.get('page_number'),
+                    'text': passage
+                })
+
+        self._term_freqs = [Counter(tokenize(passage['text'])) for passage in self.passages]
+        self._lengths = [sum(freqs.values()) for freqs in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+        document_freqs = Counter()
+        for freqs in self._term_freqs:
+            document_freqs.update(freqs.keys())
+        total = len(self.passages)
+        self._idf = {
+            term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for term, count in document_freqs.items()
+        }
+
+    @classmethod
+    def from_text(cls, text: str, max_chars: int = PASSAGE_CHARS) -> "DocumentIndex":
+        """Index plain text without page numbers."""
+        return cls([{'page_number': None, 'text': text}], max_chars=max_chars)
+
+    @property
+    def page_count(self) -> int:
+        """Number of distinct pages with indexed passages."""
+        return len({passage['page_number'] for passage in self.passages})
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        Rank passages against a query.
+
+        Returns:
+            Passages with a positive BM25 score, best first, each with 'score'
+        """
+        terms = set(tokenize(query))
+        results = []
+        for passage, freqs, length in zip(self.passages, self._term_freqs, self._lengths):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self._avg_length) if self._avg_length else BM25_K1
+            for term in terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            if score > 0:
+                results.append({**passage, 'score': score})
+        results.sort(key=lambda passage: (-passage['score'], passage['index']))
+        return results
+
+    def pack(self, query: str, budget_tokens: int, count_tokens: Callable[[str], int]) -> List[Dict]:
+        """
+        Best passages for a query that fit in a token budget.
+
+        Passages are taken best first, skipping any that would overflow the
+        budget, and returned in document order so the model reads them as
+        they appear in the plan.
+
+        Args:
+            query: Search query
+            budget_tokens: Maximum tokens of passage text
+            count_tokens: Token counter of the target model
+
+        Returns:
+            Selected passages (with 'score' and 'tokens'), in document order
+        """
+        selected, used = [], 0
+        for passage in self.search(query):
+            tokens = count_tokens(passage['text'])
+            if used + tokens > budget_tokens:
+                continue
+            selected.append({**passage, 'tokens': tokens})
+            used += tokens
+            if budget_tokens - used < 50:
+                break
+        selected.sort(key=lambda passage: passage['index'])
+        return selected
+
+    def pack_many(self, queries: List[str], budget_tokens: int,
+                  count_tokens: Callable[[str], int]) -> List[Dict]:
+        """
+        Passages for several queries that together fit in a token budget.
+
+        Queries take turns adding their next best passage, so each gets a
+        fair share; passages selected by several queries are counted once.
+
+        Returns:
+            Selected passages (with 'tokens'), in document order
+        """
+        rankings = [iter(self.search(query)) for query in queries]
+        selected, used = {}, 0
+        while rankings and budget_tokens - used >= 50:
+            for ranking in list(rankings):
+                for passage in ranking:
+                    if passage['index'] in selected:
+                        continue
+                    tokens = count_tokens(passage['text'])
+                    if used + tokens > budget_tokens:
+                        continue
+                    selected[passage['index']] = {**passage, 'tokens': tokens}
+                    used += tokens
+                    break
+                else:
+                    rankings.remove(ranking)
+        return [selected[index] for index in sorted(selected)]
+
+
+def format_passages(passages: List[Dict]) -> str:
+    """Join passages into prompt context, headed by [Página N] where the page is known."""
+    blocks, last_page = [], None
+    for passage in passages:
+        page = passage['page_number']
+        if page is not None and page != last_page:
+            blocks.append(f"[Página {page}]\n{passage['text']}")
+        else:
+            blocks.append(passage['text'])
+        last_page = page
+    return '\n\n'.join(blocks)
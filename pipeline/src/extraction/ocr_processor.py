@@ -1,95 +1,366 @@
 # ABOUTME: OCR processing module for scanned PDF documents
 # ABOUTME: Uses EasyOCR with Spanish language support for text extraction
 
+import os
+import time
+import threading
+import numpy as np
 import pymupdf  # For converting PDF pages to images
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
-import tempfile
-from PIL import Image
-import io
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+# Resolution of the preview used to find a page's non-blank area
+PREVIEW_DPI = 36
+# Grey level below which a preview pixel counts as ink
+INK_THRESHOLD = 245
+
+
+def pixmap_to_array(pix) -> np.ndarray:
+    """Raw pixmap samples as a (height, width, channels) uint8 array, ready for EasyOCR."""
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def content_clip(page, padding: float = 12) -> Optional[pymupdf.Rect]:
+    """
+    Area of a page that has ink on it, from a low-resolution greyscale preview.
+
+    Args:
+        page: PyMuPDF page
+        padding: Margin kept around the ink, in points
+
+    Returns:
+        Clip rectangle in page coordinates, or None if the page is blank
+    """
+    preview = page.get_pixmap(dpi=PREVIEW_DPI, colorspace=pymupdf.csGRAY)
+    ink = pixmap_to_array(preview)[:, :, 0] < INK_THRESHOLD
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if not len(rows):
+        return None
+
+    scale = 72 / PREVIEW_DPI
+    clip = pymupdf.Rect(
+        cols[0] * scale - padding, rows[0] * scale - padding,
+        (cols[-1] + 1) * scale + padding, (rows[-1] + 1) * scale + padding
+    )
+    return (clip + (page.rect.x0, page.rect.y0, page.rect.x0, page.rect.y0)) & page.rect
+
+
+def render_pixels(rect, dpi: int) -> int:
+    """Pixels in a rectangle (in points) rendered at a DPI."""
+    zoom = dpi / 72
+    return round(rect.width * zoom) * round(rect.height * zoom)
+
+
+# Process-wide EasyOCR readers keyed on (languages, gpu): models load once per process
+_readers: Dict[Tuple[Tuple[str, ...], bool], object] = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader(languages: List[str], gpu: bool = True):
+    """
+    Shared EasyOCR reader for a language set, loaded on first use.
+
+    Every OCRProcessor in a process (and every extract_with_ocr call) reuses
+    it instead of loading the detection and recognition models again.
+
+    Args:
+        languages: Language codes
+        gpu: Try the GPU before falling back to CPU
+
+    Returns:
+        easyocr.Reader
+    """
+    key = (tuple(languages), gpu)
+    with _readers_lock:
+        if key not in _readers:
+            _readers[key] = _load_reader(list(languages), gpu)
+        return _readers[key]
+
+
+def _load_reader(languages: List[str], gpu: bool):
+    """Build an EasyOCR reader (heavy initialization)."""
+    try:
+        import easyocr
+        print(f"Initializing EasyOCR with languages: {languages}")
+        start = time.perf_counter()
+        reader = easyocr.Reader(languages, gpu=gpu)
+        print(f"✓ EasyOCR initialized ({time.perf_counter() - start:.1f}s)")
+        return reader
+    except ImportError:
+        raise ImportError(
+            "EasyOCR not installed. Install with: pip install easyocr"
+        )
+    except Exception as e:
+        # Try without GPU
+        print(f"GPU initialization failed, falling back to CPU: {e}")
+        import easyocr
+        return easyocr.Reader(languages, gpu=False)
+
+
+# Per-process processor of OCR pool workers (each builds its own reader on first use)
+_worker_processor = None
+
+
+def _init_ocr_worker(languages: List[str], torch_threads: int, options: Dict):
+    """Pool initializer: CPU-only processor, threads split evenly between workers."""
+    global _worker_processor
+    _worker_processor = OCRProcessor(languages=languages, gpu=False, **options)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+
+def ocr_page(pdf_path: str, page_num: int, dpi: int) -> Dict:
+    """OCR one (0-based) page of a PDF in a pool worker."""
+    doc = pymupdf.open(pdf_path)
+    try:
+        return _worker_processor.ocr_page(doc[page_num], dpi=dpi)
+    finally:
+        doc.close()
 
 
 class OCRProcessor:
     """Processes scanned PDFs using OCR (Optical Character Recognition)."""
 
-    def __init__(self, languages: List[str] = ['es', 'en']):
+    def __init__(self, languages: List[str] = ['es', 'en'], workers: Optional[int] = None,
+                 gpu: bool = True, adaptive: Optional[bool] = None, low_dpi: int = 150,
+                 min_confidence: float = 0.6, crop_margins: Optional[bool] = None):
         """
         Initialize OCR processor.
 
         Args:
             languages: List of language codes to support (default: Spanish and English)
+            workers: Pages OCRed concurrently by CPU worker processes (defaults to
+                OCR_WORKERS env var, or 1 = in this process, GPU if available).
+                Each worker loads its own reader, so budget memory accordingly.
+            gpu: Try the GPU before falling back to CPU
+            adaptive: OCR each page at low_dpi first and re-render at the full
+                DPI only when confidence is below min_confidence (defaults to
+                OCR_ADAPTIVE env var, or off)
+            low_dpi: DPI of the first pass in adaptive mode
+            min_confidence: Mean EasyOCR confidence a low-DPI pass must reach
+            crop_margins: Render only the non-blank area of each page and skip
+                blank pages (default: same as adaptive)
         """
         self.languages = languages
+        self.workers = workers or int(os.getenv("OCR_WORKERS", 1))
+        self.gpu = gpu
+        if adaptive is None:
+            adaptive = os.getenv("OCR_ADAPTIVE", "0") == "1"
+        self.adaptive = adaptive
+        self.low_dpi = low_dpi
+        self.min_confidence = min_confidence
+        self.crop_margins = adaptive if crop_margins is None else crop_margins
         self._reader = None  # Lazy loading
+        self._pool = None
+
+        # Throughput and rendering totals of the last iter_pages() run
+        self.pages_per_minute = None
+        self.last_run_stats = {}
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
     @property
     def reader(self):
-        """Lazy load EasyOCR reader (heavy initialization)."""
+        """Lazy load EasyOCR reader (shared by every processor in this process)."""
         if self._reader is None:
-            try:
-                import easyocr
-                print(f"Initializing EasyOCR with languages: {self.languages}")
-                self._reader = easyocr.Reader(self.languages, gpu=True)
-                print("✓ EasyOCR initialized")
-            except ImportError:
-                raise ImportError(
-                    "EasyOCR not installed. Install with: pip install easyocr"
-                )
-            except Exception as e:
-                # Try without GPU
-                print(f"GPU initialization failed, falling back to CPU: {e}")
-                import easyocr
-                self._reader = easyocr.Reader(self.languages, gpu=False)
+            self._reader = get_reader(self.languages, self.gpu)
 
         return self._reader
 
-    def process_pdf(self, pdf_path: Path, dpi: int = 300) -> Dict:
+    def read_image(self, img) -> Tuple[str, Optional[float]]:
         """
-        Process a scanned PDF using OCR.
-
-        Args:
-            pdf_path: Path to PDF file
-            dpi: DPI for image rendering (higher = better quality but slower)
+        OCR one page image.
 
         Returns:
-            Dict containing extracted text and metadata
+            (text grouped into paragraphs, mean recognition confidence or None
+            if nothing was recognized)
         """
-        doc = pymupdf.open(pdf_path)
+        from easyocr.utils import get_paragraph
+
+        # Line-level results carry a confidence (paragraph=True drops it);
+        # grouping them afterwards gives the same text as paragraph=True
+        lines = self.reader.readtext(img)
+        if not lines:
+            return "", None
+
+        confidence = sum(prob for _, _, prob in lines) / len(lines)
+        paragraphs = get_paragraph(lines)
+        return "\n\n".join(text for _, text in paragraphs), confidence
 
-        pages_text = []
-        total_text = []
+    def ocr_page(self, page, dpi: int = 300) -> Dict:
+        """
+        Render and OCR one PyMuPDF page.
 
-        print(f"Processing {len(doc)} pages with OCR...")
+        The pixmap's samples go to the recognizer as an array, with no
+        PNG encode/decode in between. In adaptive mode the page is read at
+        low_dpi first and only re-rendered at `dpi` when the result's
+        confidence is below min_confidence.
 
-        for page_num in range(len(doc)):
-            page = doc[page_num]
+        Returns:
+            Page dict with page_number, text, char_count, processing_time_ms,
+            ocr_confidence, ocr_dpi (DPI of the kept result, None for a blank
+            page), ocr_passes, pixels (rendered for OCR) and full_pixels
+            (what a full page at `dpi` would have been)
+        """
+        start = time.perf_counter()
+        clip = None
+        if self.crop_margins and page.rotation == 0:
+            clip = content_clip(page)
+            if clip is None or clip.is_empty:
+                # Blank page: nothing to read
+                return self._page_result(page, "", None, None, 0, dpi, start, 0)
+
+        passes = [self.low_dpi, dpi] if self.adaptive and self.low_dpi < dpi else [dpi]
+        pixels = 0
+        best = None
+        for attempt, pass_dpi in enumerate(passes, 1):
+            pix = page.get_pixmap(dpi=pass_dpi, clip=clip)
+            pixels += pix.width * pix.height
+            text, confidence = self.read_image(pixmap_to_array(pix))
+            if best is None or (confidence or 0) > (best[1] or 0):
+                best = (text, confidence, pass_dpi)
+            if confidence is not None and confidence >= self.min_confidence:
+                break
+
+        text, confidence, used_dpi = best
+        return self._page_result(page, text, confidence, used_dpi, pixels, dpi, start, attempt)
+
+    @staticmethod
+    def _page_result(page, text: str, confidence: Optional[float], used_dpi: Optional[int],
+                     pixels: int, dpi: int, start: float, passes: int) -> Dict:
+        return {
+            'page_number': page.number + 1,
+            'text': text,
+            'char_count': len(text),
+            'processing_time_ms': (time.perf_counter() - start) * 1000,
+            'ocr_confidence': confidence,
+            'ocr_dpi': used_dpi,
+            'ocr_passes': passes,
+            'pixels': pixels,
+            'full_pixels': render_pixels(page.rect, dpi)
+        }
 
-            print(f"  OCR processing page {page_num + 1}/{len(doc)}...", end=' ')
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_ocr_worker,
+                initargs=(self.languages, torch_threads, {
+                    'adaptive': self.adaptive,
+                    'low_dpi': self.low_dpi,
+                    'min_confidence': self.min_confidence,
+                    'crop_margins': self.crop_margins
+                })
+            )
+        return self._pool
+
+    def iter_pages(self, pdf_path: Path, dpi: int = 300,
+                   skip_pages: Optional[Set[int]] = None,
+                   pages: Optional[Iterable[int]] = None) -> Iterator[Dict]:
+        """
+        OCR a scanned PDF page by page.
 
-            # Convert page to image
-            pix = page.get_pixmap(dpi=dpi)
-            img_data = pix.pil_tobytes(format="PNG")
-            img = Image.open(io.BytesIO(img_data))
+        With workers > 1, pages are OCRed concurrently by the process pool
+        and still yielded in document order.
 
-            # Perform OCR
-            result = self.reader.readtext(img, paragraph=True)
+        Args:
+            pdf_path: Path to PDF file
+            dpi: DPI for image rendering (higher = better quality but slower)
+            skip_pages: Page numbers (1-based) not to process, e.g. pages
+                already saved by an interrupted run
+            pages: Page numbers (1-based) to process, e.g. the image-only
+                pages of a mixed document (default: every page)
 
-            # Extract text from OCR result
-            page_text = "\n\n".join([text for (bbox, text, prob) in result])
+        Yields:
+            Page dicts as returned by ocr_page()
+        """
+        doc = pymupdf.open(pdf_path)
+        page_count = len(doc)
+        skip_pages = skip_pages or set()
+        selected = range(page_count) if pages is None else sorted(page - 1 for page in pages)
+        pending = [page_num for page_num in selected if page_num + 1 not in skip_pages]
+
+        start = time.perf_counter()
+        try:
+            if self.workers > 1 and len(pending) > 1:
+                print(f"Processing {len(pending)} pages with OCR ({self.workers} CPU workers)...")
+                results = self._get_pool().map(
+                    ocr_page, [str(pdf_path)] * len(pending), pending, [dpi] * len(pending)
+                )
+            else:
+                print(f"Processing {len(pending)} pages with OCR...")
+                results = (self.ocr_page(doc[page_num], dpi=dpi) for page_num in pending)
+
+            stats = {'pages': 0, 'pixels': 0, 'full_pixels': 0, 'retries': 0, 'blank': 0,
+                     'ocr_ms': 0.0, 'full_ms_estimate': 0.0}
+            for page in results:
+                confidence = page['ocr_confidence']
+                confidence_info = f", conf {confidence:.2f}" if confidence is not None else ""
+                dpi_info = f", {page['ocr_dpi']} dpi" if page['ocr_dpi'] else ", blank"
+                print(f"  OCR page {page['page_number']}/{page_count} ✓ "
+                      f"({page['char_count']} chars{confidence_info}{dpi_info}, "
+                      f"{page['processing_time_ms'] / 1000:.1f}s)")
+
+                stats['pages'] += 1
+                stats['pixels'] += page['pixels']
+                stats['full_pixels'] += page['full_pixels']
+                stats['retries'] += int(page['ocr_passes'] > 1)
+                stats['blank'] += int(page['ocr_dpi'] is None)
+                # OCR time grows roughly with pixel count; blank pages aren't extrapolated
+                if page['pixels']:
+                    stats['ocr_ms'] += page['processing_time_ms']
+                    stats['full_ms_estimate'] += page['processing_time_ms'] * page['full_pixels'] / page['pixels']
+                yield page
+
+            elapsed = time.perf_counter() - start
+            self.last_run_stats = stats
+            if stats['pages'] and elapsed > 0:
+                self.pages_per_minute = stats['pages'] / elapsed * 60
+                print(f"⏱️  OCR: {stats['pages']} pages in {elapsed:.1f}s ({self.pages_per_minute:.1f} pages/min)")
+                if self.adaptive or self.crop_margins:
+                    self._print_savings(stats, dpi)
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _print_savings(stats: Dict, dpi: int):
+        """Pixels and (estimated) time saved against rendering every full page at `dpi`."""
+        if not stats['full_pixels']:
+            return
+        pixel_saving = 1 - stats['pixels'] / stats['full_pixels']
+        print(f"🖼️  Rendered {stats['pixels'] / 1e6:.1f} MP vs {stats['full_pixels'] / 1e6:.1f} MP "
+              f"at {dpi} dpi ({pixel_saving:.0%} fewer pixels; "
+              f"{stats['retries']} pages retried, {stats['blank']} blank)")
+        if stats['full_ms_estimate']:
+            saved = (stats['full_ms_estimate'] - stats['ocr_ms']) / 1000
+            print(f"   ≈{saved:.1f}s of OCR time saved (estimate, assuming time ∝ pixels)")
 
-            pages_text.append({
-                'page_number': page_num + 1,
-                'text': page_text,
-                'char_count': len(page_text)
-            })
-            total_text.append(page_text)
+    def process_pdf(self, pdf_path: Path, dpi: int = 300) -> Dict:
+        """
+        Process a scanned PDF using OCR.
 
-            print(f"✓ ({len(page_text)} chars)")
+        Args:
+            pdf_path: Path to PDF file
+            dpi: DPI for image rendering (higher = better quality but slower)
 
-        doc.close()
+        Returns:
+            Dict containing extracted text and metadata
+        """
+        pages_text = list(self.iter_pages(pdf_path, dpi=dpi))
 
         # Join all text
-        full_text = "\n\n".join(total_text)
+        full_text = "\n\n".join(page['text'] for page in pages_text)
         word_count = len(full_text.split())
 
         return {
@@ -97,6 +368,8 @@ class OCRProcessor:
             'pages': pages_text,
             'page_count': len(pages_text),
             'word_count': word_count,
+            'pages_per_minute': self.pages_per_minute,
+            'ocr_stats': self.last_run_stats,
             'extraction_method': 'easyocr'
         }
 
@@ -109,16 +382,8 @@ class OCRProcessor:
 
         page = doc[page_num]
 
-        # Convert to image
-        pix = page.get_pixmap(dpi=dpi)
-        img_data = pix.pil_tobytes(format="PNG")
-        img = Image.open(io.BytesIO(img_data))
-
-        # Perform OCR
-        result = self.reader.readtext(img, paragraph=True)
-
-        # Extract text
-        text = "\n\n".join([text for (bbox, text, prob) in result])
+        # Render and OCR
+        text = self.ocr_page(page, dpi=dpi)['text']
 
         doc.close()
 
@@ -137,7 +402,10 @@ def extract_with_ocr(pdf_path: Path, languages: List[str] = ['es', 'en']) -> Dic
         Dict with extracted text and metadata
     """
     processor = OCRProcessor(languages=languages)
-    return processor.process_pdf(pdf_path)
+    try:
+        return processor.process_pdf(pdf_path)
+    finally:
+        processor.close()
 
 
 if __name__ == "__main__":
@@ -159,6 +427,7 @@ if __name__ == "__main__":
 
     processor = OCRProcessor(languages=['es', 'en'])
     result = processor.process_pdf(pdf_path)
+    processor.close()
 
     print(f"\n{'=' * 70}")
     print("OCR Results:")
@@ -166,6 +435,7 @@ if __name__ == "__main__":
     print(f"  Pages: {result['page_count']}")
     print(f"  Words: {result['word_count']:,}")
     print(f"  Characters: {len(result['text']):,}")
+    print(f"  Pages/min: {result['pages_per_minute'] or 0:.1f}")
     print(f"\nFirst 500 characters:")
     print("-" * 50)
     print(result['text'][:500])
@@ -0,0 +1,285 @@
+# ABOUTME: Long-lived OCR worker that keeps EasyOCR models loaded between pipeline runs
+# ABOUTME: Clients submit PDF pages over a local multiprocessing connection and stream results back
+
+import os
+import secrets
+import ipaddress
+import threading
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .ocr_processor import OCRProcessor
+
+DEFAULT_ADDRESS = ('127.0.0.1', 6010)
+
+# PDFs the server may open, and where the generated authkey is kept (next to database.db)
+DATA_DIR = Path(__file__).resolve().parents[3] / "data"
+AUTHKEY_FILE = ".ocr_server_key"
+
+
+def is_loopback(host: str) -> bool:
+    """Whether host only accepts connections from this machine."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def server_address() -> Tuple[str, int]:
+    """
+    Address of the OCR server (OCR_SERVER env var as host:port, default 127.0.0.1:6010).
+
+    Raises:
+        ValueError: If OCR_SERVER names a non-loopback host (requests are
+            pickles, so the server must not be reachable from the network)
+    """
+    value = os.getenv("OCR_SERVER")
+    if not value:
+        return DEFAULT_ADDRESS
+    host, _, port = value.rpartition(':')
+    host = host or DEFAULT_ADDRESS[0]
+    if not is_loopback(host):
+        raise ValueError(f"OCR_SERVER must be a loopback address, got {host}")
+    return (host, int(port))
+
+
+def server_authkey(data_dir: Optional[Path] = None, create: bool = False) -> Optional[bytes]:
+    """
+    Shared secret clients must present before anything is unpickled.
+
+    Taken from the OCR_SERVER_AUTHKEY env var, otherwise from a random key
+    in data/.ocr_server_key (readable by the owner only) that the server
+    generates on first start.
+
+    Args:
+        data_dir: Directory holding the key file (default: DATA_DIR)
+        create: Generate the key file if it doesn't exist (server side)
+
+    Returns:
+        The key, or None if there is none yet (no server has started)
+    """
+    value = os.getenv("OCR_SERVER_AUTHKEY")
+    if value:
+        return value.encode('utf-8')
+
+    key_path = Path(data_dir or DATA_DIR) / AUTHKEY_FILE
+    if create and not key_path.exists():
+        key_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # Another server generated it first
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    try:
+        return key_path.read_text().strip().encode('utf-8')
+    except FileNotFoundError:
+        return None
+
+
+class OCRServer:
+    """
+    Serves OCR requests from one warm OCRProcessor.
+
+    The EasyOCR models are loaded once at start-up, so `main.py process`
+    and `add_party.py` runs that find the server skip model loading. Each
+    connection gets a thread; documents are OCRed one at a time.
+
+    Requests arrive as pickles, so the server only binds loopback
+    addresses, authenticates clients with a secret key before reading
+    anything, and only opens PDFs inside the data directory.
+    """
+
+    def __init__(self, languages: List[str] = ['es', 'en'],
+                 address: Optional[Tuple[str, int]] = None,
+                 processor: Optional[OCRProcessor] = None,
+                 data_dir: Optional[Path] = None):
+        """
+        Initialize server.
+
+        Args:
+            languages: Language codes of the reader
+            address: (host, port) to listen on (default: server_address())
+            processor: Processor to serve (default: OCRProcessor(languages))
+            data_dir: Only PDFs under this directory are OCRed; also holds
+                the generated authkey (default: DATA_DIR)
+
+        Raises:
+            ValueError: If address is not a loopback address
+        """
+        self.address = address or server_address()
+        if not is_loopback(self.address[0]):
+            raise ValueError(f"OCR server must listen on a loopback address, got {self.address[0]}")
+        self.data_dir = Path(data_dir or DATA_DIR).resolve()
+        self.processor = processor or OCRProcessor(languages=languages)
+        self._ocr_lock = threading.Lock()
+
+    def serve_forever(self):
+        """Load the models, then accept connections until interrupted."""
+        _ = self.processor.reader
+
+        with Listener(self.address, authkey=server_authkey(self.data_dir, create=True)) as listener:
+            host, port = self.address
+            print(f"🟢 OCR server listening on {host}:{port} "
+                  f"(languages: {', '.join(self.processor.languages)})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    print("⚠️  Rejected connection with wrong authkey")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        with conn:
+            try:
+                self._handle(conn, conn.recv())
+            except (EOFError, OSError):
+                print("⚠️  Client disconnected")
+
+    def _handle(self, conn, request: Dict):
+        op = request.get('op')
+        if op == 'ping':
+            conn.send({'ok': True, 'languages': list(self.processor.languages)})
+            return
+        if op != 'ocr':
+            conn.send({'error': f"Unknown operation: {op}"})
+            return
+
+        pdf_path = Path(request['pdf_path']).resolve()
+        if not pdf_path.is_relative_to(self.data_dir):
+            print(f"⚠️  Refused OCR request outside {self.data_dir}: {pdf_path}")
+            conn.send({'error': f"PDF must be inside the data directory: {pdf_path}"})
+            return
+        print(f"📄 OCR request: {pdf_path.name}")
+        with self._ocr_lock:
+            try:
+                for page in self.processor.iter_pages(
+                    pdf_path,
+                    dpi=request.get('dpi', 300),
+                    skip_pages=set(request.get('skip_pages') or ()),
+                    pages=request.get('pages')
+                ):
+                    conn.send({'page': page})
+            except (EOFError, OSError):
+                raise
+            except Exception as e:
+                conn.send({'error': f"{type(e).__name__}: {e}"})
+                return
+
+        conn.send({
+            'done': True,
+            'pages_per_minute': self.processor.pages_per_minute,
+            'stats': self.processor.last_run_stats
+        })
+
+
+class OCRClient:
+    """
+    Submits pages to a running OCRServer.
+
+    Has the iter_pages()/close() interface of OCRProcessor, so callers can
+    use either.
+    """
+
+    def __init__(self, address: Optional[Tuple[str, int]] = None,
+                 languages: List[str] = ['es', 'en']):
+        """
+        Initialize client.
+
+        Args:
+            address: (host, port) of the server (default: server_address())
+            languages: Language codes the caller expects the server to read
+        """
+        self.address = address or server_address()
+        self.languages = languages
+
+        # Throughput and rendering totals of the last iter_pages() run
+        self.pages_per_minute = None
+        self.last_run_stats = {}
+
+    def _connect(self):
+        authkey = server_authkey()
+        if authkey is None:
+            raise ConnectionRefusedError("No OCR server authkey (server never started)")
+        return Client(self.address, authkey=authkey)
+
+    def ping(self) -> Dict:
+        """Check the server is up; returns its languages."""
+        with self._connect() as conn:
+            conn.send({'op': 'ping'})
+            return conn.recv()
+
+    def iter_pages(self, pdf_path: Path, dpi: int = 300,
+                   skip_pages: Optional[Set[int]] = None,
+                   pages: Optional[Iterable[int]] = None) -> Iterator[Dict]:
+        """
+        OCR pages on the server (see OCRProcessor.iter_pages).
+
+        Raises:
+            RuntimeError: If the server fails to process the document
+        """
+        with self._connect() as conn:
+            conn.send({
+                'op': 'ocr',
+                # The server shares this machine's filesystem
+                'pdf_path': str(Path(pdf_path).resolve()),
+                'dpi': dpi,
+                'skip_pages': sorted(skip_pages or ()),
+                'pages': None if pages is None else list(pages)
+            })
+
+            while True:
+                message = conn.recv()
+                if 'error' in message:
+                    raise RuntimeError(f"OCR server error: {message['error']}")
+                if message.get('done'):
+                    self.pages_per_minute = message['pages_per_minute']
+                    self.last_run_stats = message['stats']
+                    break
+
+                page = message['page']
+                confidence = page['ocr_confidence']
+                confidence_info = f", conf {confidence:.2f}" if confidence is not None else ""
+                print(f"  OCR page {page['page_number']} ✓ "
+                      f"({page['char_count']} chars{confidence_info}, via server)")
+                yield page
+
+        if self.pages_per_minute:
+            print(f"⏱️  OCR server: {self.pages_per_minute:.1f} pages/min")
+
+    def close(self):
+        """Nothing to release: each document uses its own connection."""
+
+
+def get_ocr_processor(languages: List[str] = ['es', 'en']):
+    """
+    OCR backend for a pipeline run.
+
+    Args:
+        languages: Language codes
+
+    Returns:
+        OCRClient if an OCR server with the same languages is running,
+        otherwise an in-process OCRProcessor
+    """
+    try:
+        client = OCRClient(languages=languages)
+        info = client.ping()
+    except ValueError as e:
+        print(f"⚠️  {e}; OCR runs in-process")
+        return OCRProcessor(languages=languages)
+    except (OSError, EOFError, AuthenticationError):
+        return OCRProcessor(languages=languages)
+
+    if list(info.get('languages', [])) != list(languages):
+        print(f"⚠️  OCR server reads {info.get('languages')}, not {languages}; OCR runs in-process")
+        return OCRProcessor(languages=languages)
+
+    host, port = client.address
+    print(f"🔌 Using OCR server at {host}:{port}")
+    return client
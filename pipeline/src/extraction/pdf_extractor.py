@@ -1,17 +1,343 @@
 # ABOUTME: PDF text extraction module using PyMuPDF
 # ABOUTME: Handles text-based PDFs and detects if OCR is needed for scanned documents
 
+import os
+import mmap
+import time
+import hashlib
+import threading
+import importlib.util
 import pymupdf  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
 import re
 
+# Cleanup patterns, compiled once per process
+BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n+')
+PAGE_NUMBER_RE = re.compile(r'^\s*\d+\s*$', re.MULTILINE)
+MULTIPLE_SPACES_RE = re.compile(r' +')
+
+# A page with less text than this whose area is mostly images is a scan
+OCR_MAX_TEXT_CHARS = 50
+OCR_MIN_IMAGE_COVERAGE = 0.5
+
+# Logo candidates: images on the first pages, big enough not to be icons or rules
+LOGO_PAGES = 3
+LOGO_MIN_BYTES = 5000
+MAX_LOGOS = 5
+
+
+def clean_page_text(text: str) -> str:
+    """Clean extracted page text."""
+    # Remove excessive whitespace
+    text = BLANK_LINES_RE.sub('\n\n', text)
+
+    # Remove page numbers (common pattern: just a number on a line)
+    text = PAGE_NUMBER_RE.sub('', text)
+
+    # Remove excessive spaces
+    text = MULTIPLE_SPACES_RE.sub(' ', text)
+
+    return text.strip()
+
+
+def image_coverage(page) -> float:
+    """Fraction of the page area covered by images (0.0 - 1.0)."""
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if not page_area:
+        return 0.0
+
+    covered = 0.0
+    for image in page.get_image_info():
+        bbox = pymupdf.Rect(image['bbox']) & page_rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    # Overlapping images can add up to more than the page
+    return min(1.0, covered / page_area)
+
+
+def page_needs_ocr(text: str, coverage: float, min_text_chars: int = OCR_MAX_TEXT_CHARS) -> bool:
+    """
+    Classify a page as image-only.
+
+    Pages with a real text layer are extracted directly. Pages with almost no
+    text are only sent to OCR when images cover most of them, so blank and
+    divider pages don't pay for it.
+    """
+    return len(text.strip()) < min_text_chars and coverage >= OCR_MIN_IMAGE_COVERAGE
+
+
+def text_content_hash(text: str) -> str:
+    """Fingerprint of a text page (its cleaned text)."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def read_page(page, min_text_chars: int = OCR_MAX_TEXT_CHARS) -> Dict:
+    """Extract and classify one PyMuPDF page."""
+    start = time.perf_counter()
+    text = clean_page_text(page.get_text())
+    coverage = image_coverage(page)
+    needs_ocr = page_needs_ocr(text, coverage, min_text_chars)
+
+    # Fingerprint of what the stored text is derived from: the text layer,
+    # or for scans the images that OCR will read
+    if needs_ocr:
+        digests = [image['digest'].hex() for image in page.get_image_info(hashes=True)]
+        content_hash = hashlib.sha256(('images:' + ','.join(digests)).encode('utf-8')).hexdigest()
+    else:
+        content_hash = text_content_hash(text)
+
+    return {
+        'page_number': page.number + 1,
+        'text': text,
+        'char_count': len(text),
+        'image_coverage': coverage,
+        'needs_ocr': needs_ocr,
+        'content_hash': content_hash,
+        'processing_time_ms': (time.perf_counter() - start) * 1000
+    }
+
+
+def extract_pages(pdf_path: str, page_indices: Sequence[int],
+                  min_text_chars: int = OCR_MAX_TEXT_CHARS) -> List[Dict]:
+    """
+    Extract the given (0-based) pages of a PDF.
+
+    Runs in worker processes, so it opens its own document handle.
+    """
+    doc = pymupdf.open(pdf_path)
+    try:
+        return [read_page(doc[page_num], min_text_chars) for page_num in page_indices]
+    finally:
+        doc.close()
+
+
+def _logo_candidates(doc, page, limit: int) -> List[Dict]:
+    """Up to `limit` embedded images of a page that are large enough to be a logo."""
+    candidates = []
+    for img_index, img in enumerate(page.get_images()):
+        if len(candidates) >= limit:
+            break
+
+        xref = img[0]
+        try:
+            base_image = doc.extract_image(xref)
+        except Exception as e:
+            print(f"  ✗ Error extracting image {img_index}: {e}")
+            continue
+
+        # Skip very small images (likely not logos)
+        if len(base_image["image"]) < LOGO_MIN_BYTES:
+            continue
+
+        candidates.append({
+            'page_number': page.number + 1,
+            'xref': xref,
+            'ext': base_image["ext"],
+            'image': base_image["image"],
+            'size': len(base_image["image"])
+        })
+    return candidates
+
+
+def ingest_pdf(pdf_path: Path, pages: bool = True, logos: bool = True, markdown: bool = False,
+               min_text_chars: int = OCR_MAX_TEXT_CHARS, extractor: Optional["PDFExtractor"] = None) -> Dict:
+    """
+    Read everything the pipeline needs from a PDF in a single pass.
+
+    The file is memory-mapped once: the SHA-256 is computed over the
+    mapping and PyMuPDF parses the same buffer, so the bytes are read from
+    disk a single time and the document is opened once.
+
+    With an extractor, documents large enough for its process pool get
+    their pages from the pool instead (each worker opens its own handle);
+    hash, metadata and logos still come from this pass.
+
+    Args:
+        pdf_path: Path to PDF file
+        pages: Extract and classify the text of every page
+        logos: Collect logo candidates from the first LOGO_PAGES pages
+        markdown: Also convert the document to markdown (needs pymupdf4llm)
+        min_text_chars: Minimum characters for a page to count as text-based
+        extractor: PDFExtractor whose process pool may extract the pages
+
+    Returns:
+        Dict containing:
+            - path, sha256, file_size, page_count
+            - metadata: title, author, subject, creator
+            - pages: Page dicts as yielded by PDFExtractor.iter_pages (if pages)
+            - ocr_pages: Page numbers (1-based) of image-only pages (if pages)
+            - logos: Dicts with page_number, xref, ext, image bytes and size,
+              at most MAX_LOGOS (if logos)
+            - markdown: Markdown text, or None if not requested/available
+    """
+    with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        buffer = memoryview(mapped)
+        try:
+            sha256 = hashlib.sha256(buffer).hexdigest()
+            doc = pymupdf.open(stream=buffer, filetype='pdf')
+            try:
+                result = {
+                    'path': Path(pdf_path),
+                    'sha256': sha256,
+                    'file_size': len(mapped),
+                    'page_count': len(doc),
+                    'metadata': {
+                        'title': doc.metadata.get('title', ''),
+                        'author': doc.metadata.get('author', ''),
+                        'subject': doc.metadata.get('subject', ''),
+                        'creator': doc.metadata.get('creator', ''),
+                    },
+                    'pages': [],
+                    'ocr_pages': [],
+                    'logos': [],
+                    'markdown': None
+                }
+
+                # Large documents are left to the extractor's process pool
+                parallel = pages and extractor is not None and extractor._worker_count(len(doc)) > 1
+                serial_pages = pages and not parallel
+
+                # Only pages that are needed are loaded
+                if serial_pages:
+                    last_page = len(doc)
+                elif logos:
+                    last_page = min(LOGO_PAGES, len(doc))
+                else:
+                    last_page = 0
+
+                for page_num in range(last_page):
+                    page = doc[page_num]
+                    if serial_pages:
+                        result['pages'].append(read_page(page, min_text_chars))
+                    if logos and page_num < LOGO_PAGES:
+                        result['logos'].extend(
+                            _logo_candidates(doc, page, MAX_LOGOS - len(result['logos']))
+                        )
+
+                if markdown:
+                    try:
+                        import pymupdf4llm
+                        result['markdown'] = pymupdf4llm.to_markdown(doc)
+                    except ImportError:
+                        pass
+            finally:
+                doc.close()
+        finally:
+            buffer.release()
+
+    if parallel:
+        result['pages'] = list(extractor._pool_pages(pdf_path, list(range(result['page_count']))))
+    result['ocr_pages'] = [page['page_number'] for page in result['pages'] if page['needs_ocr']]
+    return result
+
 
 class PDFExtractor:
     """Extracts text from PDF documents using PyMuPDF."""
 
-    def __init__(self):
-        self.min_text_threshold = 100  # Minimum characters to consider PDF as text-based
+    # Below this many pages per worker, process start-up costs more than it saves
+    MIN_PAGES_PER_WORKER = 16
+
+    # Pages extracted per unit of work (bounds how much text is held at once)
+    MAX_PAGES_PER_SHARD = 32
+
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Initialize extractor.
+
+        Args:
+            workers: Processes used to extract large PDFs (None = one per CPU,
+                1 = always extract in this process)
+        """
+        self.min_text_threshold = OCR_MAX_TEXT_CHARS  # Minimum characters for a page to count as text-based
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        # Several threads may extract documents with one extractor
+        self._pool_lock = threading.Lock()
+
+    def close(self):
+        """Shut down the worker processes, if any were started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """The shared worker pool, started on first use."""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def _worker_count(self, page_count: int) -> int:
+        """Workers to use for a document: enough pages each to pay for the process hop."""
+        return max(1, min(self.workers, page_count // self.MIN_PAGES_PER_WORKER))
+
+    def open_pages(self, pdf_path: Path, skip_pages: Optional[Set[int]] = None) -> Tuple[int, Iterator[Dict]]:
+        """
+        Open a PDF once for its page count and its pages.
+
+        Small documents are read page by page from this handle; large ones
+        are handed to the process pool (see iter_pages).
+
+        Args:
+            pdf_path: Path to PDF file
+            skip_pages: Page numbers (1-based) not to extract
+
+        Returns:
+            (page_count, iterator of page dicts as yielded by iter_pages)
+        """
+        doc = pymupdf.open(pdf_path)
+        page_count = len(doc)
+        skip_pages = skip_pages or set()
+        pending = [i for i in range(page_count) if i + 1 not in skip_pages]
+
+        if self._worker_count(len(pending)) == 1:
+            return page_count, self._read_pages(doc, pending)
+        doc.close()
+        return page_count, self._pool_pages(pdf_path, pending)
+
+    def iter_pages(self, pdf_path: Path, skip_pages: Optional[Set[int]] = None) -> Iterator[Dict]:
+        """
+        Extract a PDF page by page.
+
+        Large PDFs are extracted in parallel by a process pool, in shards of
+        at most MAX_PAGES_PER_SHARD pages; small ones in this process. Pages
+        are yielded in document order, so callers can persist them as they
+        arrive instead of holding the whole document.
+
+        Args:
+            pdf_path: Path to PDF file
+            skip_pages: Page numbers (1-based) not to extract, e.g. pages
+                already saved by an interrupted run
+
+        Yields:
+            Page dicts with page_number, text, char_count, image_coverage,
+            needs_ocr (the page is a scan and its text must come from OCR)
+            and content_hash (changes when the page's source content does)
+        """
+        return self.open_pages(pdf_path, skip_pages)[1]
+
+    def _read_pages(self, doc, page_indices: Sequence[int]) -> Iterator[Dict]:
+        """Read (0-based) pages from an open document, closing it when done."""
+        try:
+            for page_num in page_indices:
+                yield read_page(doc[page_num], self.min_text_threshold)
+        finally:
+            doc.close()
+
+    def _pool_pages(self, pdf_path: Path, page_indices: Sequence[int]) -> Iterator[Dict]:
+        """Extract (0-based) pages in the process pool, in order."""
+        workers = self._worker_count(len(page_indices))
+        pool = self._get_pool()
+        shard_size = min(-(-len(page_indices) // workers), self.MAX_PAGES_PER_SHARD)  # ceiling division
+        shards = [page_indices[start:start + shard_size] for start in range(0, len(page_indices), shard_size)]
+
+        for shard in pool.map(extract_pages, [str(pdf_path)] * len(shards), shards,
+                              [self.min_text_threshold] * len(shards)):
+            yield from shard
 
     def extract_text(self, pdf_path: Path) -> Dict:
         """
@@ -23,41 +349,24 @@ class PDFExtractor:
                 - pages: List of page texts
                 - page_count: Number of pages
                 - word_count: Approximate word count
-                - needs_ocr: Boolean indicating if OCR is needed
+                - needs_ocr: Boolean indicating if any page needs OCR
+                - ocr_pages: Page numbers (1-based) of image-only pages
                 - extraction_method: 'pymupdf' or 'needs_ocr'
+                - sha256, file_size, metadata and logos from ingest_pdf()
         """
-        doc = pymupdf.open(pdf_path)
-
-        pages_text = []
-        total_text = []
-
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            text = page.get_text()
-
-            # Clean up text
-            text = self._clean_text(text)
-
-            pages_text.append({
-                'page_number': page_num + 1,
-                'text': text,
-                'char_count': len(text)
-            })
-            total_text.append(text)
-
-        doc.close()
+        # Large PDFs are extracted by the process pool
+        ingest = ingest_pdf(pdf_path, min_text_chars=self.min_text_threshold, extractor=self)
 
         # Join all text
-        full_text = "\n\n".join(total_text)
+        full_text = "\n\n".join(page['text'] for page in ingest['pages'])
         word_count = len(full_text.split())
 
-        # Detect if OCR is needed
-        needs_ocr = len(full_text.strip()) < self.min_text_threshold
+        # Detect if any page needs OCR
+        needs_ocr = bool(ingest['ocr_pages'])
 
         return {
+            **ingest,
             'text': full_text,
-            'pages': pages_text,
-            'page_count': len(pages_text),
             'word_count': word_count,
             'needs_ocr': needs_ocr,
             'extraction_method': 'needs_ocr' if needs_ocr else 'pymupdf'
@@ -69,58 +378,46 @@ class PDFExtractor:
 
         This is useful for documents with headings, lists, etc.
         """
-        try:
-            import pymupdf4llm
-            md_text = pymupdf4llm.to_markdown(str(pdf_path))
-            return md_text
-        except ImportError:
-            # Fallback to regular extraction
-            result = self.extract_text(pdf_path)
-            return result['text']
+        has_markdown = importlib.util.find_spec('pymupdf4llm') is not None
+        ingest = ingest_pdf(pdf_path, pages=not has_markdown, logos=False, markdown=has_markdown,
+                            min_text_chars=self.min_text_threshold)
+        if has_markdown:
+            return ingest['markdown']
+
+        # Fallback to regular extraction
+        return "\n\n".join(page['text'] for page in ingest['pages'])
 
     def _clean_text(self, text: str) -> str:
         """Clean extracted text."""
-        # Remove excessive whitespace
-        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
-
-        # Remove page numbers (common pattern: just a number on a line)
-        text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
-
-        # Remove excessive spaces
-        text = re.sub(r' +', ' ', text)
-
-        return text.strip()
+        return clean_page_text(text)
 
     def get_pdf_info(self, pdf_path: Path) -> Dict:
-        """Get basic PDF metadata."""
-        doc = pymupdf.open(pdf_path)
-
-        metadata = {
-            'page_count': len(doc),
-            'title': doc.metadata.get('title', ''),
-            'author': doc.metadata.get('author', ''),
-            'subject': doc.metadata.get('subject', ''),
-            'creator': doc.metadata.get('creator', ''),
+        """Get basic PDF metadata (plus its sha256)."""
+        ingest = ingest_pdf(pdf_path, pages=False, logos=False)
+        return {
+            'page_count': ingest['page_count'],
+            'sha256': ingest['sha256'],
+            **ingest['metadata']
         }
 
-        doc.close()
-        return metadata
-
 
-def detect_scanned_pdf(pdf_path: Path, threshold: int = 100) -> bool:
+def detect_scanned_pdf(pdf_path: Path, threshold: int = OCR_MAX_TEXT_CHARS) -> bool:
     """
     Quick detection if a PDF is scanned (needs OCR).
 
     Args:
         pdf_path: Path to PDF file
-        threshold: Minimum character count to consider as text-based
+        threshold: Minimum character count for a page to count as text-based
 
     Returns:
-        True if PDF appears to be scanned (needs OCR), False otherwise
+        True if any page appears to be scanned (needs OCR), False otherwise
     """
     extractor = PDFExtractor()
     extractor.min_text_threshold = threshold
-    result = extractor.extract_text(pdf_path)
+    try:
+        result = extractor.extract_text(pdf_path)
+    finally:
+        extractor.close()
     return result['needs_ocr']
 
 
@@ -142,12 +439,13 @@ if __name__ == "__main__":
 
     extractor = PDFExtractor()
     result = extractor.extract_text(pdf_path)
+    extractor.close()
 
     print(f"\nResults:")
     print(f"  Pages: {result['page_count']}")
     print(f"  Words: {result['word_count']:,}")
     print(f"  Characters: {len(result['text']):,}")
-    print(f"  Needs OCR: {result['needs_ocr']}")
+    print(f"  Needs OCR: {result['needs_ocr']} ({len(result['ocr_pages'])} image-only pages)")
     print(f"\nFirst 500 characters:")
     print("-" * 50)
     print(result['text'][:500])
@@ -1,36 +1,80 @@
 # ABOUTME: Main pipeline orchestrator coordinating PDF extraction, OCR, and LLM analysis
 # ABOUTME: Supports flexible category processing and retroactive analysis for new categories
 
+import os
 import sys
 import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Callable, Dict, Iterable, List, Optional
 from datetime import datetime
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from extraction.pdf_extractor import PDFExtractor
-from extraction.ocr_processor import OCRProcessor
+from extraction.pdf_extractor import PDFExtractor, ingest_pdf
+from extraction.ocr_server import get_ocr_processor
 from analysis.llm_analyzer import LLMAnalyzer
+from analysis.retrieval import DocumentIndex
+from analysis.openai_client import AsyncRateLimitedClient
+from analysis.response_cache import ResponseCache
+from analysis.batch_runner import BatchRunner
 from storage.database import Database
+from .sync import diff_pages, stored_page_key, affected_pages, sync_positions
 
 
 class DocumentPipeline:
     """Orchestrates the complete document processing pipeline."""
 
-    def __init__(self, db_path: str, openai_api_key: Optional[str] = None):
+    # Extracted pages written to the database per batch
+    PAGE_SAVE_BATCH = 8
+
+    # llm_batches kind of category analysis jobs
+    ANALYSIS_BATCH_KIND = 'category_analysis'
+
+    def __init__(self, db_path: str, openai_api_key: Optional[str] = None, concurrency: int = 1,
+                 multi_category: Optional[bool] = None):
         """
         Initialize pipeline.
 
         Args:
             db_path: Path to SQLite database
             openai_api_key: OpenAI API key (optional, can use env var)
+            concurrency: Maximum number of LLM analyses in flight (1 = serial)
+            multi_category: Analyze a document's categories in shared requests
+                instead of one request each (defaults to LLM_MULTI_CATEGORY env var)
         """
-        self.db = Database(db_path)
+        self.concurrency = max(1, concurrency)
+        if multi_category is None:
+            multi_category = os.getenv("LLM_MULTI_CATEGORY", "").lower() in ('1', 'true', 'yes')
+        self.multi_category = multi_category
+        # Worker threads each get their own long-lived connection
+        self.db = Database(db_path, persistent=self.concurrency > 1)
         self.pdf_extractor = PDFExtractor()
         self.ocr_processor = None  # Lazy load (heavy)
-        self.llm_analyzer = LLMAnalyzer(api_key=openai_api_key)
+        self.response_cache = ResponseCache(self.db)
+        self.llm_analyzer = LLMAnalyzer(api_key=openai_api_key, cache=self.response_cache)
+
+        # Shared pool bounding LLM calls across all documents being processed
+        self._analysis_pool = (
+            ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='analysis')
+            if self.concurrency > 1 else None
+        )
+        # Serializes status/position/log writes so each category's rows change together
+        self._write_lock = threading.Lock()
+        self._ocr_lock = threading.Lock()
+
+    def close(self):
+        """Shut down worker threads and processes and database connections."""
+        if self._analysis_pool is not None:
+            self._analysis_pool.shutdown(wait=True)
+            self._analysis_pool = None
+        self.pdf_extractor.close()
+        if self.ocr_processor is not None:
+            self.ocr_processor.close()
+        self.db.close()
 
     def process_document(
         self,
@@ -61,24 +105,72 @@ class DocumentPipeline:
         print(f"{'=' * 70}")
 
         start_time = time.time()
-        total_cost = 0.0
 
         # Stage 1: Text Extraction (cached if already done)
+        document_text, document_index = self._load_document(document_id, pdf_path, force_reextract)
+
+        # Stage 2: Category Analysis
+        if categories is None:
+            categories = self.db.get_all_categories()
+        pending = self._pending_categories(document_id, categories)
+
+        analysis_start = time.time()
+        if self.multi_category and len(pending) > 1:
+            analyses = self._analyze_categories_together(
+                document_id, party_id, party_name, document_text, pending, document_index
+            )
+        else:
+            # One passage block for all categories: their requests then share a cached prefix
+            context = self._shared_context(document_index, pending)
+
+            if self._analysis_pool is not None:
+                futures = [
+                    self._analysis_pool.submit(
+                        self._analyze_category, document_id, party_id, party_name,
+                        document_text, category, document_index, context
+                    )
+                    for category in pending
+                ]
+                analyses = [future.result() for future in futures]
+            else:
+                analyses = [
+                    self._analyze_category(document_id, party_id, party_name, document_text, category,
+                                           document_index, context)
+                    for category in pending
+                ]
+        analysis_seconds = time.time() - analysis_start
+
+        return self._processing_result(document_id, party_name, len(categories), analyses,
+                                       start_time, analysis_seconds)
+
+    def _load_document(self, document_id: int, pdf_path: Path, force_reextract: bool = False):
+        """
+        Stage 1: the document's text (extracted and cached on first use) and its passage index.
+
+        Returns:
+            (document_text, document_index)
+        """
         if not force_reextract and self.db.is_text_extracted(document_id):
             print("\n[Stage 1] Text Extraction: Using cached text")
             document_text = self.db.get_extracted_text(document_id)
         else:
             print("\n[Stage 1] Text Extraction: Extracting from PDF...")
+            if force_reextract:
+                self.db.delete_extracted_text(document_id)
             document_text = self._extract_text(document_id, pdf_path)
 
         print(f"  ✓ Extracted {len(document_text):,} characters")
 
-        # Stage 2: Category Analysis
-        if categories is None:
-            categories = self.db.get_all_categories()
+        # Built once; each category prompt gets its own best passages from it
+        document_index = DocumentIndex(self.db.get_document_pages(document_id))
+        print(f"  ✓ Indexed {len(document_index.passages):,} passages from {document_index.page_count} pages")
+        return document_text, document_index
 
+    def _pending_categories(self, document_id: int, categories: List[Dict]) -> List[Dict]:
+        """Categories not yet completed for a document."""
         print(f"\n[Stage 2] LLM Analysis: Processing {len(categories)} categories")
 
+        pending = []
         for category in categories:
             # Check if already processed
             unprocessed = self.db.get_unprocessed_documents_for_category(category['id'])
@@ -88,93 +180,214 @@ class DocumentPipeline:
                 print(f"  - {category['name']}: Already processed (skipping)")
                 continue
 
-            # Mark as started
-            self.db.update_processing_status(
-                document_id=document_id,
-                category_id=category['id'],
-                status='started'
-            )
+            pending.append(category)
+        return pending
+
+    def _shared_context(self, document_index: DocumentIndex, pending: List[Dict]) -> Optional[Dict]:
+        """The passage block shared by all categories in shared-context mode (None otherwise)."""
+        if not (self.llm_analyzer.shared_context and pending):
+            return None
+        context = self.llm_analyzer.select_shared_context(document_index, pending)
+        print(f"  ✓ Shared context: {context['tokens']:,} tokens from {len(context['pages'])} pages")
+        return context
+
+    def _processing_result(self, document_id: int, party_name: str, categories_processed: int,
+                           analyses: List[Optional[Dict]], start_time: float, analysis_seconds: float) -> Dict:
+        """Print a document's processing summary and return its result dict."""
+        analyses = [analysis for analysis in analyses if analysis is not None]
+        total_cost = sum(analysis.get('cost_usd', 0.0) for analysis in analyses)
+        prompt_tokens = sum(analysis.get('prompt_tokens') or 0 for analysis in analyses)
+        completion_tokens = sum(analysis.get('completion_tokens') or 0 for analysis in analyses)
+        cached_tokens = sum(analysis.get('cached_tokens') or 0 for analysis in analyses)
 
-            try:
-                # Analyze with LLM
-                analysis = self.llm_analyzer.analyze_document_for_category(
-                    document_text=document_text,
-                    category=category,
-                    party_name=party_name
-                )
+        duration = time.time() - start_time
 
-                # Save to database
-                self.db.save_party_position(
-                    party_id=party_id,
-                    document_id=document_id,
-                    category_id=category['id'],
-                    summary=analysis['summary'],
-                    key_proposals=analysis.get('key_proposals', []),
-                    ideology_position=analysis.get('ideology_position'),
-                    budget_mentioned=analysis.get('budget_mentioned'),
-                    confidence_score=analysis.get('confidence_score'),
-                    raw_llm_response=analysis.get('raw_response'),
-                    tokens_used=analysis.get('tokens_used'),
-                    cost_usd=analysis.get('cost_usd')
-                )
+        print(f"\n{'=' * 70}")
+        print(f"✓ Processing complete!")
+        print(f"  Duration: {duration:.2f} seconds (LLM analysis: {analysis_seconds:.2f}s)")
+        print(f"  Tokens: {prompt_tokens:,} prompt + {completion_tokens:,} completion"
+              f"{' (multi-category requests)' if self.multi_category else ''}")
+        if prompt_tokens:
+            print(f"  Prompt cache: {cached_tokens:,} of {prompt_tokens:,} prompt tokens cached "
+                  f"({cached_tokens / prompt_tokens:.0%})")
+        print(f"  Total cost: ${total_cost:.4f}")
+        print(f"{'=' * 70}\n")
 
-                # Mark as completed
-                self.db.update_processing_status(
-                    document_id=document_id,
-                    category_id=category['id'],
-                    status='completed'
-                )
+        return {
+            'document_id': document_id,
+            'party_name': party_name,
+            'categories_processed': categories_processed,
+            'total_cost': total_cost,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+            'analysis_seconds': analysis_seconds,
+            'duration_seconds': duration
+        }
 
-                # Log processing
-                self.db.log_processing(
-                    stage='category_analysis',
-                    status='completed',
-                    document_id=document_id,
-                    category_id=category['id'],
-                    tokens_used=analysis.get('tokens_used'),
-                    cost_usd=analysis.get('cost_usd')
-                )
+    def _analyze_category(
+        self,
+        document_id: int,
+        party_id: int,
+        party_name: str,
+        document_text: str,
+        category: Dict,
+        document_index: Optional[DocumentIndex] = None,
+        context: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        Analyze one category of a document and persist the outcome.
+
+        Safe to run from worker threads: the LLM call runs unlocked, while
+        the status, position and log writes for the category are committed
+        together in one transaction.
+
+        Returns:
+            The analysis (None on failure)
+        """
+        self._mark_started(document_id, [category])
+
+        try:
+            # Analyze with LLM
+            analysis = self.llm_analyzer.analyze_document_for_category(
+                document_text=document_text,
+                category=category,
+                party_name=party_name,
+                document_index=document_index,
+                context=context
+            )
+            self._save_analysis(document_id, party_id, party_name, category, analysis)
+            return analysis
+
+        except Exception as e:
+            self._save_failure(document_id, party_name, category, e)
+            return None
+
+    def _analyze_categories_together(
+        self,
+        document_id: int,
+        party_id: int,
+        party_name: str,
+        document_text: str,
+        categories: List[Dict],
+        document_index: Optional[DocumentIndex] = None
+    ) -> List[Optional[Dict]]:
+        """
+        Analyze several categories of a document in shared LLM requests.
 
-                cost = analysis.get('cost_usd', 0.0)
-                total_cost += cost
+        Each category still gets its own position, status and log rows, so
+        a failing group only fails its own categories.
 
-                print(f"  ✓ {category['name']}: ${cost:.4f}")
+        Returns:
+            The analyses, in category order (None for failed categories)
+        """
+        self._mark_started(document_id, categories)
+
+        errors = {}
+        try:
+            analyses = self.llm_analyzer.analyze_document_for_categories(
+                document_text=document_text,
+                categories=categories,
+                party_name=party_name,
+                document_index=document_index,
+                errors=errors
+            )
+        except Exception as e:
+            for category in categories:
+                self._save_failure(document_id, party_name, category, e)
+            return [None] * len(categories)
 
+        results = []
+        for category in categories:
+            key = category['category_key']
+            if key not in analyses:
+                self._save_failure(document_id, party_name, category,
+                                   errors.get(key, RuntimeError("No analysis returned")))
+                results.append(None)
+                continue
+            analysis = analyses[key]
+            try:
+                self._save_analysis(document_id, party_id, party_name, category, analysis)
+                results.append(analysis)
             except Exception as e:
-                print(f"  ✗ {category['name']}: Error - {e}")
+                self._save_failure(document_id, party_name, category, e)
+                results.append(None)
+        return results
 
-                # Mark as failed
+    def _mark_started(self, document_id: int, categories: List[Dict]):
+        """Mark categories of a document as being analyzed."""
+        with self._write_lock, self.db.transaction():
+            for category in categories:
                 self.db.update_processing_status(
                     document_id=document_id,
                     category_id=category['id'],
-                    status='failed',
-                    error_message=str(e)
+                    status='started'
                 )
 
-                # Log error
-                self.db.log_processing(
-                    stage='category_analysis',
-                    status='failed',
-                    document_id=document_id,
-                    category_id=category['id'],
-                    error_message=str(e)
-                )
+    def _save_analysis(self, document_id: int, party_id: int, party_name: str, category: Dict,
+                       analysis: Dict):
+        """Save a category's position, completed status and log row together."""
+        with self._write_lock, self.db.transaction():
+            # Save to database
+            self.db.save_party_position(
+                party_id=party_id,
+                document_id=document_id,
+                category_id=category['id'],
+                summary=analysis['summary'],
+                key_proposals=analysis.get('key_proposals', []),
+                ideology_position=analysis.get('ideology_position'),
+                budget_mentioned=analysis.get('budget_mentioned'),
+                confidence_score=analysis.get('confidence_score'),
+                raw_llm_response=analysis.get('raw_response'),
+                tokens_used=analysis.get('tokens_used'),
+                cost_usd=analysis.get('cost_usd'),
+                context_pages=analysis.get('context_pages')
+            )
 
-        duration = time.time() - start_time
+            # Mark as completed
+            self.db.update_processing_status(
+                document_id=document_id,
+                category_id=category['id'],
+                status='completed'
+            )
 
-        print(f"\n{'=' * 70}")
-        print(f"✓ Processing complete!")
-        print(f"  Duration: {duration:.2f} seconds")
-        print(f"  Total cost: ${total_cost:.4f}")
-        print(f"{'=' * 70}\n")
+            # Log processing
+            self.db.log_processing(
+                stage='category_analysis',
+                status='completed',
+                document_id=document_id,
+                category_id=category['id'],
+                tokens_used=analysis.get('tokens_used'),
+                prompt_tokens=analysis.get('prompt_tokens'),
+                cached_tokens=analysis.get('cached_tokens'),
+                cost_usd=analysis.get('cost_usd')
+            )
 
-        return {
-            'document_id': document_id,
-            'party_name': party_name,
-            'categories_processed': len(categories),
-            'total_cost': total_cost,
-            'duration_seconds': duration
-        }
+        cost = analysis.get('cost_usd', 0.0)
+        print(f"  ✓ {party_name} / {category['name']}: ${cost:.4f} "
+              f"({analysis['context_tokens']:,} context tokens from {len(analysis['context_pages'])} pages)")
+
+    def _save_failure(self, document_id: int, party_name: str, category: Dict, error: Exception):
+        """Mark a category as failed and log the error."""
+        print(f"  ✗ {party_name} / {category['name']}: Error - {error}")
+
+        with self._write_lock, self.db.transaction():
+            # Mark as failed
+            self.db.update_processing_status(
+                document_id=document_id,
+                category_id=category['id'],
+                status='failed',
+                error_message=str(error)
+            )
+
+            # Log error
+            self.db.log_processing(
+                stage='category_analysis',
+                status='failed',
+                document_id=document_id,
+                category_id=category['id'],
+                error_message=str(error)
+            )
 
     def process_multiple_documents(
         self,
@@ -191,36 +404,205 @@ class DocumentPipeline:
         Returns:
             List of processing results
         """
-        results = []
+        if self.concurrency > 1 and len(document_ids) > 1:
+            # Documents run side by side; their category analyses share the
+            # bounded analysis pool, so at most `concurrency` LLM calls are in flight
+            with ThreadPoolExecutor(max_workers=self.concurrency,
+                                    thread_name_prefix='document') as pool:
+                futures = [
+                    pool.submit(self._process_document_safe, doc_id, categories)
+                    for doc_id in document_ids
+                ]
+                return [future.result() for future in futures]
+
+        return [self._process_document_safe(doc_id, categories) for doc_id in document_ids]
+
+    def _process_document_safe(self, document_id: int, categories: Optional[List[Dict]]) -> Dict:
+        """Process one document by ID, converting errors into a failed result."""
+        doc_info = self._get_document_info(document_id)
+
+        try:
+            return self.process_document(
+                document_id=document_id,
+                party_id=doc_info['party_id'],
+                pdf_path=Path(doc_info['file_path']),
+                categories=categories
+            )
 
-        for doc_id in document_ids:
-            doc_info = self._get_document_info(doc_id)
+        except Exception as e:
+            print(f"\n✗ Failed to process document {document_id}: {e}\n")
+            return {
+                'document_id': document_id,
+                'error': str(e),
+                'failed': True
+            }
 
+    async def process_multiple_documents_async(
+        self,
+        document_ids: List[int],
+        categories: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """
+        asyncio version of process_multiple_documents.
+
+        All documents and their category analyses run on one event loop:
+        LLM calls go through an AsyncRateLimitedClient (bounded per endpoint
+        by its semaphores and the shared rate limits, not by thread count),
+        while text extraction, OCR and database writes run in worker threads
+        so they never block the loop. At most `concurrency` documents are
+        extracted at the same time.
+
+        Args:
+            document_ids: List of document IDs to process
+            categories: Categories to process (None = all)
+
+        Returns:
+            List of processing results
+        """
+        extraction_slots = asyncio.Semaphore(self.concurrency)
+
+        async with AsyncRateLimitedClient(self.llm_analyzer.client) as client:
+            self.llm_analyzer.async_client = client
             try:
-                result = self.process_document(
-                    document_id=doc_id,
-                    party_id=doc_info['party_id'],
-                    pdf_path=Path(doc_info['file_path']),
-                    categories=categories
-                )
-                results.append(result)
+                results = await asyncio.gather(*(
+                    self._process_document_safe_async(doc_id, categories, extraction_slots)
+                    for doc_id in document_ids
+                ))
+            finally:
+                self.llm_analyzer.async_client = None
+
+        print(f"  Peak requests in flight: "
+              f"{', '.join(f'{endpoint} {peak}' for endpoint, peak in client.peak_in_flight.items())}")
+        return list(results)
+
+    async def _process_document_safe_async(self, document_id: int, categories: Optional[List[Dict]],
+                                           extraction_slots: asyncio.Semaphore) -> Dict:
+        """Process one document by ID on the event loop, converting errors into a failed result."""
+        try:
+            doc_info = await asyncio.to_thread(self._get_document_info, document_id)
+            return await self.process_document_async(
+                document_id=document_id,
+                party_id=doc_info['party_id'],
+                pdf_path=Path(doc_info['file_path']),
+                categories=categories,
+                extraction_slots=extraction_slots
+            )
 
-            except Exception as e:
-                print(f"\n✗ Failed to process document {doc_id}: {e}\n")
-                results.append({
-                    'document_id': doc_id,
-                    'error': str(e),
-                    'failed': True
-                })
+        except Exception as e:
+            print(f"\n✗ Failed to process document {document_id}: {e}\n")
+            return {
+                'document_id': document_id,
+                'error': str(e),
+                'failed': True
+            }
 
-        return results
+    async def process_document_async(
+        self,
+        document_id: int,
+        party_id: int,
+        pdf_path: Path,
+        categories: Optional[List[Dict]] = None,
+        force_reextract: bool = False,
+        extraction_slots: Optional[asyncio.Semaphore] = None
+    ) -> Dict:
+        """
+        asyncio version of process_document.
 
-    def backfill_category(self, category_key: str) -> Dict:
+        Extraction and database work run in worker threads; the category
+        analyses of the document are requested concurrently. In
+        multi-category mode the shared requests run in a worker thread
+        through the synchronous client.
+
+        Args:
+            document_id: Database ID of document
+            party_id: Database ID of party
+            pdf_path: Path to PDF file
+            categories: Categories to analyze (None = all)
+            force_reextract: Force text re-extraction even if cached
+            extraction_slots: Semaphore bounding concurrent extractions
+
+        Returns:
+            Processing results dict
+        """
+        party_name = await asyncio.to_thread(self._get_party_name, party_id)
+
+        print(f"\n{'=' * 70}")
+        print(f"Processing: {party_name}")
+        print(f"PDF: {pdf_path.name}")
+        print(f"{'=' * 70}")
+
+        start_time = time.time()
+
+        # Stage 1: Text Extraction (cached if already done)
+        async with (extraction_slots or asyncio.Semaphore(1)):
+            document_text, document_index = await asyncio.to_thread(
+                self._load_document, document_id, pdf_path, force_reextract
+            )
+
+        # Stage 2: Category Analysis
+        if categories is None:
+            categories = await asyncio.to_thread(self.db.get_all_categories)
+        pending = await asyncio.to_thread(self._pending_categories, document_id, categories)
+
+        analysis_start = time.time()
+        if self.multi_category and len(pending) > 1:
+            analyses = await asyncio.to_thread(
+                self._analyze_categories_together,
+                document_id, party_id, party_name, document_text, pending, document_index
+            )
+        else:
+            context = self._shared_context(document_index, pending)
+            analyses = await asyncio.gather(*(
+                self._analyze_category_async(document_id, party_id, party_name, document_text, category,
+                                             document_index, context)
+                for category in pending
+            ))
+        analysis_seconds = time.time() - analysis_start
+
+        return self._processing_result(document_id, party_name, len(categories), analyses,
+                                       start_time, analysis_seconds)
+
+    async def _analyze_category_async(
+        self,
+        document_id: int,
+        party_id: int,
+        party_name: str,
+        document_text: str,
+        category: Dict,
+        document_index: Optional[DocumentIndex] = None,
+        context: Optional[Dict] = None
+    ) -> Optional[Dict]:
+        """
+        asyncio version of _analyze_category (database writes run in worker threads).
+
+        Returns:
+            The analysis (None on failure)
+        """
+        await asyncio.to_thread(self._mark_started, document_id, [category])
+
+        try:
+            analysis = await self.llm_analyzer.analyze_document_for_category_async(
+                document_text=document_text,
+                category=category,
+                party_name=party_name,
+                document_index=document_index,
+                context=context
+            )
+            await asyncio.to_thread(self._save_analysis, document_id, party_id, party_name, category, analysis)
+            return analysis
+
+        except Exception as e:
+            await asyncio.to_thread(self._save_failure, document_id, party_name, category, e)
+            return None
+
+    def backfill_category(self, category_key: str, batch: bool = False) -> Dict:
         """
         Process all documents for a newly added category.
 
         Args:
             category_key: Category key (e.g., 'economia', 'impuestos')
+            batch: Run the analyses as one Batch API job (see
+                analyze_in_batch) instead of live requests
 
         Returns:
             Dict with backfill results
@@ -231,7 +613,7 @@ class DocumentPipeline:
             raise ValueError(f"Category not found: {category_key}")
 
         print(f"\n{'=' * 70}")
-        print(f"Backfilling category: {category['name']}")
+        print(f"Backfilling category: {category['name']}{' (Batch API)' if batch else ''}")
         print(f"{'=' * 70}\n")
 
         # Get all documents that need processing for this category
@@ -239,10 +621,15 @@ class DocumentPipeline:
 
         print(f"Found {len(unprocessed)} documents to process\n")
 
-        results = self.process_multiple_documents(
-            document_ids=[doc['id'] for doc in unprocessed],
-            categories=[category]
-        )
+        if batch:
+            outcome = self.analyze_in_batch(document_ids=[doc['id'] for doc in unprocessed],
+                                            categories=[category])
+            results = outcome['results']
+        else:
+            results = self.process_multiple_documents(
+                document_ids=[doc['id'] for doc in unprocessed],
+                categories=[category]
+            )
 
         total_cost = sum(r.get('total_cost', 0) for r in results if not r.get('failed'))
         successful = len([r for r in results if not r.get('failed')])
@@ -261,42 +648,302 @@ class DocumentPipeline:
             'results': results
         }
 
-    def _extract_text(self, document_id: int, pdf_path: Path) -> str:
-        """Extract text from PDF and cache it."""
-        # Try regular extraction first
-        extraction_result = self.pdf_extractor.extract_text(pdf_path)
+    def analyze_in_batch(self, document_ids: List[int], categories: List[Dict],
+                         batch_runner: Optional[BatchRunner] = None) -> Dict:
+        """
+        Analyze categories of documents through the Batch API.
+
+        Batches left open by an interrupted run are finished first. Every
+        (document, category) pair still unprocessed then becomes one request
+        of a new batch, which is submitted, polled until done and ingested
+        like live analyses: position, status and processing_log rows per
+        category, at the Batch API price. Each result is saved together
+        with its ingested mark, so an interrupted ingest resumes without
+        duplicates.
+
+        Args:
+            document_ids: Documents to analyze
+            categories: Categories to analyze
+            batch_runner: Runner to use (defaults to one on the pipeline's
+                database and response cache)
+
+        Returns:
+            Dict with one result per document (like process_document's,
+            'failed' when any category failed) and completed/failed counts
+        """
+        runner = batch_runner or BatchRunner(self.db, cache=self.response_cache)
+        outcomes = {}
+
+        # Pairs answered by a resumed batch aren't requested again in this run, even if they failed
+        resumed = set()
+        for batch in runner.open_batches(self.ANALYSIS_BATCH_KIND):
+            print(f"↩️  Resuming batch #{batch['id']} ({batch['status']}, {batch['request_count']} requests)")
+            resumed.update(self._run_analysis_batch(runner, batch, outcomes))
+
+        requests = []
+        started = {}
+        unprocessed = {
+            category['id']: {doc['id'] for doc in self.db.get_unprocessed_documents_for_category(category['id'])}
+            for category in categories
+        }
+        for document_id in document_ids:
+            pending = [category for category in categories
+                       if document_id in unprocessed[category['id']] and (document_id, category['id']) not in resumed]
+            if not pending:
+                continue
 
-        if extraction_result['needs_ocr']:
-            print("  Document appears to be scanned, using OCR...")
+            doc_info = self._get_document_info(document_id)
+            party_name = self._get_party_name(doc_info['party_id'])
+            if not self.db.is_text_extracted(document_id):
+                print(f"  Extracting text: {party_name}")
+                self._extract_text(document_id, Path(doc_info['file_path']))
+            document_index = DocumentIndex(self.db.get_document_pages(document_id))
+
+            shared = None
+            if self.llm_analyzer.shared_context:
+                shared = self.llm_analyzer.select_shared_context(document_index, pending)
+            for category in pending:
+                context = shared or self.llm_analyzer.select_context(document_index, category)
+                requests.append({
+                    'custom_id': f"doc-{document_id}-cat-{category['id']}",
+                    'body': self.llm_analyzer.category_request(category, party_name, context),
+                    'document_id': document_id,
+                    'party_id': doc_info['party_id'],
+                    'category_id': category['id'],
+                    'metadata': {'context_pages': context['pages'], 'context_tokens': context['tokens']}
+                })
+            started[document_id] = pending
 
-            # Lazy load OCR processor
-            if self.ocr_processor is None:
-                self.ocr_processor = OCRProcessor(languages=['es', 'en'])
+        if requests:
+            print(f"\n📦 Batch of {len(requests)} category analyses for {len(started)} documents")
+            batch = runner.prepare(self.ANALYSIS_BATCH_KIND, requests)
+            for document_id, pending in started.items():
+                self._mark_started(document_id, pending)
+            self._run_analysis_batch(runner, batch, outcomes)
 
-            ocr_result = self.ocr_processor.process_pdf(pdf_path)
+        results = []
+        for document_id, outcome in outcomes.items():
+            result = {'document_id': document_id, 'party_name': outcome['party_name'],
+                      'categories_processed': outcome['completed'], 'total_cost': outcome['cost']}
+            if outcome['failed']:
+                result.update(failed=True, error=f"{outcome['failed']} categories failed")
+            results.append(result)
 
-            # Cache OCR text
-            for page in ocr_result['pages']:
-                self.db.save_extracted_text(
-                    document_id=document_id,
-                    page_number=page['page_number'],
-                    raw_text=page['text'],
-                    extraction_method='easyocr'
-                )
+        return {
+            'results': results,
+            'completed': sum(outcome['completed'] for outcome in outcomes.values()),
+            'failed': sum(outcome['failed'] for outcome in outcomes.values())
+        }
 
-            return ocr_result['text']
+    def _run_analysis_batch(self, runner: BatchRunner, batch: Dict, outcomes: Dict[int, Dict]) -> set:
+        """
+        Submit (if needed), wait for and ingest one analysis batch, tallying outcomes per document.
 
-        else:
-            # Cache extracted text
-            for page in extraction_result['pages']:
-                self.db.save_extracted_text(
-                    document_id=document_id,
-                    page_number=page['page_number'],
-                    raw_text=page['text'],
-                    extraction_method='pymupdf'
+        Returns:
+            (document_id, category_id) pairs ingested
+        """
+        start = time.time()
+        ingested = set()
+        runner.submit(batch)
+        runner.wait(batch)
+
+        categories = {category['id']: category for category in self.db.get_all_categories()}
+        party_names = {}
+        usage = {'tokens_used': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'cost_usd': 0.0}
+        for request, response, error in runner.results(batch):
+            document_id = request['document_id']
+            category = categories.get(request['category_id'], {'id': request['category_id'],
+                                                                'name': f"category {request['category_id']}"})
+            if request['party_id'] not in party_names:
+                party_names[request['party_id']] = self._get_party_name(request['party_id'])
+            party_name = party_names[request['party_id']]
+            outcome = outcomes.setdefault(document_id, {'party_name': party_name, 'completed': 0,
+                                                        'failed': 0, 'cost': 0.0})
+            ingested.add((document_id, request['category_id']))
+
+            try:
+                if error:
+                    raise RuntimeError(error)
+                context = {'pages': request['metadata']['context_pages'],
+                           'tokens': request['metadata']['context_tokens']}
+                analysis = self.llm_analyzer.parse_category_response(response, context, batch=True)
+                with self.db.transaction():
+                    self._save_analysis(document_id, request['party_id'], party_name, category, analysis)
+                    runner.mark(request, 'completed')
+            except Exception as e:
+                with self.db.transaction():
+                    self._save_failure(document_id, party_name, category, e)
+                    runner.mark(request, 'failed')
+                outcome['failed'] += 1
+                continue
+
+            outcome['completed'] += 1
+            outcome['cost'] += analysis['cost_usd']
+            for key in usage:
+                usage[key] += analysis.get(key) or 0
+
+        # One row for the job as a whole; the per-category rows carry its share
+        with self.db.transaction():
+            self.db.log_processing(stage='llm_batch', status=batch['status'],
+                                   duration_seconds=time.time() - start, **usage)
+            runner.finish(batch)
+        return ingested
+
+    def _extract_text(self, document_id: int, pdf_path: Path,
+                      on_pages: Optional[Callable[[int, List[int]], None]] = None) -> str:
+        """
+        Extract text from PDF page by page and cache it.
+
+        Pages with a text layer are read directly; only image-only pages
+        (scans, e.g. annexes of an otherwise digital plan) go through OCR.
+        Pages are saved in small batches as they are produced, so a crash
+        keeps completed pages and the next run resumes after them.
+
+        Args:
+            document_id: Database document ID
+            pdf_path: Path to PDF file
+            on_pages: Called with (document_id, page numbers) after each
+                saved batch, so later stages can start on those pages
+        """
+        saved_pages = self.db.get_extracted_pages(document_id)
+        # One open gives the page count and the pages (no hashing: the file is known)
+        page_count, pages = self.pdf_extractor.open_pages(pdf_path, skip_pages=set(saved_pages))
+        self.db.update_document_page_count(document_id, page_count)
+
+        if saved_pages:
+            print(f"  Resuming: {len(saved_pages)}/{page_count} pages already extracted")
+
+        # page_number → content_hash of image-only pages
+        ocr_pages = {}
+
+        def text_pages():
+            for page in pages:
+                if page['needs_ocr']:
+                    ocr_pages[page['page_number']] = page['content_hash']
+                else:
+                    yield page
+
+        self._save_pages(document_id, text_pages(), 'pymupdf', on_pages=on_pages)
+
+        if ocr_pages:
+            print(f"  {len(ocr_pages)}/{page_count} pages are scanned images, using OCR...")
+
+            # Lazy load OCR processor (one shared reader; OCR runs one document at a time)
+            with self._ocr_lock:
+                if self.ocr_processor is None:
+                    # A running OCR server already has the models loaded
+                    self.ocr_processor = get_ocr_processor(languages=['es', 'en'])
+
+                ocr_results = (
+                    {**page, 'content_hash': ocr_pages[page['page_number']]}
+                    for page in self.ocr_processor.iter_pages(pdf_path, pages=list(ocr_pages))
                 )
+                # OCR is expensive: checkpoint every page as soon as it's done
+                self._save_pages(document_id, ocr_results, 'easyocr', batch_size=1, on_pages=on_pages)
+
+        return self.db.get_extracted_text(document_id)
 
-            return extraction_result['text']
+    def sync_document(self, document_id: int, pdf_path: Path, dry_run: bool = False) -> Dict:
+        """
+        Bring a document's stored text and analysis up to date with its PDF.
+
+        Nothing happens while the PDF's hash matches documents.file_hash.
+        When the PDF was replaced, its pages are diffed against document_text:
+        unchanged pages keep their text and embeddings (renumbered if pages
+        were inserted or removed before them), changed and removed pages are
+        deleted with their embeddings, and new pages are extracted.
+
+        Positions are deleted, so the next `process` run re-analyzes those
+        categories, when the pages they were based on (the context pages
+        recorded with them) include an edited or removed page, or a page
+        next to where new pages were inserted (see affected_pages). Older
+        positions without recorded context pages go by the pages they cite
+        ([Página N]) and are deleted when they cite none. Citations and
+        context pages of the other positions are renumbered.
+
+        Args:
+            document_id: Database document ID
+            pdf_path: Path to the document's PDF
+            dry_run: Only report what would change
+
+        Returns:
+            Dict with status ('unchanged' or 'changed') and counts of pages
+            kept/renumbered/removed/added, embeddings deleted and positions
+            invalidated/renumbered
+        """
+        doc_info = self._get_document_info(document_id)
+        ingest = ingest_pdf(pdf_path, logos=False, min_text_chars=self.pdf_extractor.min_text_threshold)
+        if ingest['sha256'] == doc_info['file_hash']:
+            return {'status': 'unchanged'}
+
+        old_pages = self.db.get_document_pages(document_id)
+        new_pages = ingest['pages']
+        diff = diff_pages([stored_page_key(page) for page in old_pages],
+                          [page['content_hash'] for page in new_pages])
+
+        removed_ids = [old_pages[i]['id'] for i in diff['removed']]
+        kept_pages = {
+            old_pages[old]['id']: (new_pages[new]['page_number'], new_pages[new]['content_hash'])
+            for old, new in diff['kept'].items()
+        }
+        page_map = {old_pages[old]['page_number']: new_pages[new]['page_number']
+                    for old, new in diff['kept'].items()}
+        affected = affected_pages([page['page_number'] for page in old_pages], diff)
+        invalidated, renumbered = sync_positions(self.db.get_document_positions(document_id),
+                                                 affected, page_map)
+
+        result = {
+            'status': 'changed',
+            'pages_kept': len(kept_pages),
+            'pages_renumbered': sum(1 for old, new in page_map.items() if old != new),
+            'pages_removed': len(removed_ids),
+            'pages_added': len(diff['added']),
+            'embeddings_deleted': 0,
+            'positions_invalidated': len(invalidated),
+            'positions_renumbered': len(renumbered)
+        }
+        if dry_run:
+            return result
+
+        with self.db.transaction():
+            result['embeddings_deleted'] = self.db.delete_pages(removed_ids)
+            self.db.update_kept_pages(kept_pages)
+            self.db.invalidate_positions(document_id, invalidated)
+            for position_id, position in renumbered.items():
+                self.db.update_position_citations(position_id, position['summary'], position['key_proposals'],
+                                                  position['context_pages'])
+            # The new page count marks the text incomplete until the added pages are saved
+            self.db.update_document_page_count(document_id, ingest['page_count'])
+
+        # Extract only the pages that aren't stored (resumable, OCR for scans)
+        if diff['added']:
+            self._extract_text(document_id, pdf_path)
+
+        # Recorded last: if extraction fails or is interrupted, the next sync
+        # still sees a changed file and diffs again against the pages saved so far
+        self.db.update_document_file(document_id, ingest['sha256'], ingest['page_count'])
+        return result
+
+    def _save_pages(self, document_id: int, pages: Iterable[Dict], extraction_method: str,
+                    batch_size: Optional[int] = None,
+                    on_pages: Optional[Callable[[int, List[int]], None]] = None):
+        """Persist pages from an iterator in batches (default PAGE_SAVE_BATCH), reporting each to on_pages."""
+        batch_size = batch_size or self.PAGE_SAVE_BATCH
+        batch = []
+        for page in pages:
+            batch.append(page)
+            if len(batch) >= batch_size:
+                self._save_page_batch(document_id, batch, extraction_method, on_pages)
+                batch = []
+        if batch:
+            self._save_page_batch(document_id, batch, extraction_method, on_pages)
+
+    def _save_page_batch(self, document_id: int, batch: List[Dict], extraction_method: str,
+                         on_pages: Optional[Callable[[int, List[int]], None]]):
+        """Save one batch of pages and report it."""
+        self.db.save_extracted_pages(document_id, batch, extraction_method=extraction_method)
+        if on_pages is not None:
+            on_pages(document_id, [page['page_number'] for page in batch])
 
     def _get_party_name(self, party_id: int) -> str:
         """Get party name from database."""
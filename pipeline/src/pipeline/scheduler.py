@@ -0,0 +1,305 @@
+# ABOUTME: Stage scheduler streaming documents through extraction, embedding and category analysis at once
+# ABOUTME: Bounded asyncio queues connect the stages; each stage has its own worker pool and reports its queue depth
+
+import time
+import struct
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from analysis.chunking import chunk_page
+from analysis.embedding_batcher import EmbeddingBatcher
+from analysis.embedding_cache import EmbeddingCache
+from analysis.openai_client import AsyncRateLimitedClient
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Pages with less text than this aren't embedded (same rule as generate_embeddings.py)
+MIN_EMBED_CHARS = 50
+
+
+class StageScheduler:
+    """
+    Runs documents through the pipeline as a DAG of concurrent stages.
+
+        extract ──pages────▶ embed
+           └──────document──▶ analyze
+
+    Extraction saves pages in small batches and hands each batch to the
+    embed queue right away, so embedding starts on the first pages of a
+    plan while the rest (or its OCR) is still being read. A document
+    enters the analyze queue once all its pages are saved: category
+    analysis ranks passages with BM25 over the pages, not over the
+    embeddings, so it doesn't wait for the embed stage.
+
+    Worker pools are sized by resource type:
+        extract: threads driving the PDF extractor's and OCR processor's
+            process pools (CPU)
+        embed: coroutines sending batched embedding requests (network)
+        analyze: coroutines analyzing a document's categories concurrently
+            through the async client (network)
+
+    The embed and analyze queues are bounded: when a downstream stage
+    falls behind, extraction waits instead of piling pages up in memory.
+    """
+
+    STAGES = ('extract', 'embed', 'analyze')
+
+    def __init__(
+        self,
+        pipeline,
+        extract_workers: int = 2,
+        embed_workers: int = 2,
+        analyze_workers: int = 4,
+        queue_size: int = 256,
+        embeddings: bool = True,
+        analysis: bool = True,
+        status_interval: float = 10.0
+    ):
+        """
+        Initialize scheduler.
+
+        Args:
+            pipeline: DocumentPipeline whose database, extractors and
+                analyzer the stages use
+            extract_workers: Documents extracted at the same time
+            embed_workers: Embedding requests being prepared and sent at
+                the same time (in-flight requests are further bounded by
+                the async client's embeddings semaphore)
+            analyze_workers: Documents analyzed at the same time
+            queue_size: Pages the embed queue holds before extraction waits
+            embeddings: Run the embed stage
+            analysis: Run the analyze stage
+            status_interval: Seconds between queue depth reports (0 = off)
+        """
+        self.pipeline = pipeline
+        self.workers = {'extract': max(1, extract_workers), 'embed': max(1, embed_workers),
+                        'analyze': max(1, analyze_workers)}
+        self.queue_size = queue_size
+        self.embeddings = embeddings
+        self.analysis = analysis
+        self.status_interval = status_interval
+
+        # Chunks whose text was embedded before come from the cache
+        client = pipeline.llm_analyzer.client
+        if client.embedding_cache is None:
+            client.embedding_cache = EmbeddingCache(pipeline.db)
+
+        self.stats = {stage: {'done': 0, 'failed': 0, 'busy': 0, 'peak_depth': 0} for stage in self.STAGES}
+        self.batcher = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._loop = None
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Items waiting in each stage's queue (documents for extract/analyze, pages for embed)."""
+        return {stage: queue.qsize() for stage, queue in self._queues.items()}
+
+    def status_line(self) -> str:
+        """One-line summary of every stage: queued, busy, done and failed items."""
+        depths = self.queue_depths()
+        parts = []
+        for stage in self.STAGES:
+            if stage not in self._queues:
+                continue
+            stats = self.stats[stage]
+            unit = 'pages' if stage == 'embed' else 'docs'
+            part = f"{stage}: {depths[stage]} queued, {stats['busy']} busy, {stats['done']} {unit} done"
+            if stats['failed']:
+                part += f", {stats['failed']} failed"
+            parts.append(part)
+        return " | ".join(parts)
+
+    async def run(self, document_ids: List[int], categories: Optional[List[Dict]] = None) -> Dict:
+        """
+        Extract, embed and analyze documents with all stages running at once.
+
+        Args:
+            document_ids: Documents to run
+            categories: Categories to analyze (None = all)
+
+        Returns:
+            Dict with one result per document (process_document's for
+            analyzed documents, 'failed' on errors), per-stage stats and
+            duration_seconds
+        """
+        start = time.time()
+        self._loop = asyncio.get_running_loop()
+        self._queues = {'extract': asyncio.Queue()}
+        if self.embeddings:
+            self._queues['embed'] = asyncio.Queue(maxsize=self.queue_size)
+        if self.analysis:
+            self._queues['analyze'] = asyncio.Queue(maxsize=self.workers['analyze'] * 2)
+        for document_id in document_ids:
+            self._queues['extract'].put_nowait(document_id)
+        self._note_depth('extract')
+
+        results: Dict[int, Dict] = {}
+        extract_pool = ThreadPoolExecutor(max_workers=self.workers['extract'], thread_name_prefix='extract')
+        analyzer = self.pipeline.llm_analyzer
+
+        async with AsyncRateLimitedClient(analyzer.client) as client:
+            analyzer.async_client = client
+            self.batcher = EmbeddingBatcher(client, model=EMBEDDING_MODEL)
+            save_lock = asyncio.Lock()
+            # Cached text is loaded and indexed in worker threads, a few documents at a time
+            load_slots = asyncio.Semaphore(self.workers['analyze'])
+
+            tasks = [asyncio.create_task(self._extract_worker(extract_pool, results))
+                     for _ in range(self.workers['extract'])]
+            if self.embeddings:
+                tasks += [asyncio.create_task(self._embed_worker(save_lock))
+                          for _ in range(self.workers['embed'])]
+            if self.analysis:
+                tasks += [asyncio.create_task(self._analyze_worker(categories, load_slots, results))
+                          for _ in range(self.workers['analyze'])]
+            if self.status_interval > 0:
+                tasks.append(asyncio.create_task(self._report()))
+
+            try:
+                # In DAG order: a stage is drained for good once its producer is
+                for stage in self.STAGES:
+                    if stage in self._queues:
+                        await self._queues[stage].join()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                analyzer.async_client = None
+                # Idle after a normal finish; after an error, don't wait for blocked extractions
+                extract_pool.shutdown(wait=False, cancel_futures=True)
+
+        print(f"\n📊 {self.status_line()}")
+        peaks = {stage: self.stats[stage]['peak_depth'] for stage in self._queues}
+        print(f"   Peak queue depth: {', '.join(f'{stage} {peak}' for stage, peak in peaks.items())}")
+        print(f"   Peak requests in flight: "
+              f"{', '.join(f'{endpoint} {peak}' for endpoint, peak in client.peak_in_flight.items())}")
+
+        return {
+            'results': [results.get(document_id, {'document_id': document_id}) for document_id in document_ids],
+            'stats': self.stats,
+            'duration_seconds': time.time() - start
+        }
+
+    async def _extract_worker(self, pool: ThreadPoolExecutor, results: Dict[int, Dict]):
+        """Extract documents in a worker thread, then queue them for analysis."""
+        queue = self._queues['extract']
+        stats = self.stats['extract']
+        while True:
+            document_id = await queue.get()
+            stats['busy'] += 1
+            try:
+                await self._loop.run_in_executor(pool, self._extract, document_id)
+                stats['done'] += 1
+                if self.analysis:
+                    await self._put('analyze', document_id)
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"\n✗ Failed to extract document {document_id}: {e}\n")
+                results[document_id] = {'document_id': document_id, 'error': str(e), 'failed': True}
+            finally:
+                stats['busy'] -= 1
+                queue.task_done()
+
+    def _extract(self, document_id: int):
+        """Extract a document's text (runs in an extract thread), streaming saved pages to the embed queue."""
+        pipeline = self.pipeline
+        on_pages = self._queue_pages if self.embeddings else None
+        # Pages saved by an earlier (possibly interrupted) run may still lack embeddings
+        if on_pages is not None:
+            on_pages(document_id, None)
+        if pipeline.db.is_text_extracted(document_id):
+            return
+
+        doc_info = pipeline._get_document_info(document_id)
+        pdf_path = Path(doc_info['file_path'])
+        print(f"  📄 Extracting {pdf_path.name}")
+        pipeline._extract_text(document_id, pdf_path, on_pages=on_pages)
+
+    def _queue_pages(self, document_id: int, page_numbers: Optional[List[int]]):
+        """Queue saved pages without embeddings for the embed stage (blocks while the queue is full)."""
+        for page in self.pipeline.db.get_pages_without_embeddings(document_id, page_numbers):
+            if not page['raw_text'] or len(page['raw_text'].strip()) < MIN_EMBED_CHARS:
+                continue
+            asyncio.run_coroutine_threadsafe(self._put('embed', page), self._loop).result()
+
+    async def _embed_worker(self, save_lock: asyncio.Lock):
+        """Embed queued pages, taking whatever is waiting (up to one full request) at a time."""
+        queue = self._queues['embed']
+        stats = self.stats['embed']
+        # Roughly 4 characters per token
+        flush_chars = self.batcher.max_batch_tokens * 4
+        while True:
+            pages = [await queue.get()]
+            chars = len(pages[0]['raw_text'])
+            while chars < flush_chars and not queue.empty():
+                page = queue.get_nowait()
+                pages.append(page)
+                chars += len(page['raw_text'])
+
+            stats['busy'] += 1
+            try:
+                chunks = [(page['id'], chunk_index, chunk_text)
+                          for page in pages for chunk_index, chunk_text in chunk_page(page['raw_text'])]
+                embedded = await self.batcher.embed_async(
+                    [((page_id, chunk_index), chunk_text) for page_id, chunk_index, chunk_text in chunks]
+                )
+                rows = []
+                for page_id, chunk_index, chunk_text in chunks:
+                    if (page_id, chunk_index) not in embedded:
+                        continue
+                    embedding, token_count = embedded[(page_id, chunk_index)]
+                    rows.append({
+                        'document_text_id': page_id,
+                        'chunk_index': chunk_index,
+                        'chunk_text': chunk_text,
+                        'embedding': struct.pack(f'{len(embedding)}f', *embedding),
+                        'token_count': token_count,
+                        'embedding_model': EMBEDDING_MODEL
+                    })
+                if rows:
+                    # One writer at a time keeps ANN index inserts in order
+                    async with save_lock:
+                        await asyncio.to_thread(self.pipeline.db.save_embeddings_bulk, rows)
+
+                stored = {row['document_text_id'] for row in rows}
+                stats['done'] += len(stored)
+                stats['failed'] += len(pages) - len(stored)
+            except Exception as e:
+                stats['failed'] += len(pages)
+                print(f"\n✗ Failed to embed {len(pages)} pages: {e}\n")
+            finally:
+                stats['busy'] -= 1
+                for _ in pages:
+                    queue.task_done()
+
+    async def _analyze_worker(self, categories: Optional[List[Dict]], load_slots: asyncio.Semaphore,
+                              results: Dict[int, Dict]):
+        """Analyze extracted documents' categories."""
+        queue = self._queues['analyze']
+        stats = self.stats['analyze']
+        while True:
+            document_id = await queue.get()
+            stats['busy'] += 1
+            try:
+                result = await self.pipeline._process_document_safe_async(document_id, categories, load_slots)
+                results[document_id] = result
+                stats['failed' if result.get('failed') else 'done'] += 1
+            finally:
+                stats['busy'] -= 1
+                queue.task_done()
+
+    async def _put(self, stage: str, item):
+        """Put an item on a stage's queue, waiting for room, and track the peak depth."""
+        await self._queues[stage].put(item)
+        self._note_depth(stage)
+
+    def _note_depth(self, stage: str):
+        stats = self.stats[stage]
+        stats['peak_depth'] = max(stats['peak_depth'], self._queues[stage].qsize())
+
+    async def _report(self):
+        """Print the stages' queue depths periodically."""
+        while True:
+            await asyncio.sleep(self.status_interval)
+            print(f"\n📊 {self.status_line()}\n")
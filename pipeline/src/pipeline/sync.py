@@ -0,0 +1,168 @@
+# ABOUTME: Page-level diff of a replaced plan PDF against the pages already stored for it
+# ABOUTME: Aligns unchanged pages old → new and tracks the pages each analyzed position was based on
+
+import re
+import json
+import difflib
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from extraction.pdf_extractor import text_content_hash
+
+# "[Página 12]", "[Páginas 12, 14]", "[Páginas 12-14]"
+CITATION_RE = re.compile(r'\[P[áa]ginas?\s+([^\]]*)\]', re.IGNORECASE)
+PAGE_REF_RE = re.compile(r'(\d+)\s*[-–]\s*(\d+)|(\d+)')
+
+
+def stored_page_key(page: Dict) -> str:
+    """
+    Fingerprint of a stored page, comparable with read_page()'s content_hash.
+
+    Pages saved before content hashes were recorded fall back to the hash
+    of their text layer; old OCR pages can't be compared and never match.
+    """
+    if page['content_hash']:
+        return page['content_hash']
+    if page['extraction_method'] == 'pymupdf':
+        return text_content_hash(page['raw_text'])
+    return f"unknown:{page['id']}"
+
+
+def diff_pages(old_keys: Sequence[str], new_keys: Sequence[str]) -> Dict:
+    """
+    Align the page fingerprints of the stored and the new version of a document.
+
+    Unchanged pages are matched even when pages were inserted or removed
+    before them, so they keep their text and embeddings under a new number.
+    An edited page shows up as removed (its old version) and added (its
+    new version).
+
+    Returns:
+        Dict with kept ({old index: new index}), removed (old indices),
+        added (new indices) and insertions (old index each run of purely
+        new pages was inserted before; len(old_keys) when appended)
+    """
+    matcher = difflib.SequenceMatcher(None, list(old_keys), list(new_keys), autojunk=False)
+    kept, removed, added, insertions = {}, [], [], []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == 'equal':
+            kept.update(zip(range(old_start, old_end), range(new_start, new_end)))
+            continue
+        if tag == 'insert':
+            insertions.append(old_start)
+        removed.extend(range(old_start, old_end))
+        added.extend(range(new_start, new_end))
+    return {'kept': kept, 'removed': removed, 'added': added, 'insertions': insertions}
+
+
+def affected_pages(old_page_numbers: Sequence[int], diff: Dict) -> Set[int]:
+    """
+    Old page numbers whose change makes positions based on them stale.
+
+    These are the edited and removed pages, plus the stored pages on either
+    side of each run of inserted pages: plans are organized in sections, so
+    new pages land in the section of their neighbours and only the
+    categories analyzed from those pages could rank them into their context.
+
+    Args:
+        old_page_numbers: Page number of each stored page (diff's old indices)
+        diff: Result of diff_pages()
+    """
+    pages = {old_page_numbers[i] for i in diff['removed']}
+    for index in diff['insertions']:
+        pages.update(old_page_numbers[i] for i in (index - 1, index) if 0 <= i < len(old_page_numbers))
+    return pages
+
+
+def sync_positions(positions: Iterable[Dict], affected: Set[int],
+                   page_map: Dict[int, int]) -> Tuple[List[int], Dict[int, Dict]]:
+    """
+    Decide what happens to a document's stored positions after a diff.
+
+    A position is invalidated when the pages it was based on include an
+    affected page, or when the document changed and it has no known pages.
+    Every other position keeps its analysis, renumbered if its pages moved.
+
+    Args:
+        positions: Stored positions (as from get_document_positions)
+        affected: Old page numbers from affected_pages()
+        page_map: Old page number → new page number of kept pages
+
+    Returns:
+        (category IDs to invalidate, {position ID: renumber_position() result})
+    """
+    invalidated, renumbered = [], {}
+    for position in positions:
+        pages = position_pages(position)
+        if affected and (not pages or pages & affected):
+            invalidated.append(position['category_id'])
+            continue
+        moved = renumber_position(position, page_map)
+        if moved:
+            renumbered[position['id']] = moved
+    return invalidated, renumbered
+
+
+def cited_pages(texts: Iterable[str]) -> Set[int]:
+    """Page numbers cited as [Página N] in any of the texts."""
+    pages = set()
+    for text in texts:
+        for match in CITATION_RE.finditer(text or ''):
+            for start, end, single in PAGE_REF_RE.findall(match.group(1)):
+                if single:
+                    pages.add(int(single))
+                else:
+                    pages.update(range(int(start), int(end) + 1))
+    return pages
+
+
+def renumber_citations(text: str, page_map: Dict[int, int]) -> str:
+    """Rewrite the page numbers inside [Página N] citations (old → new)."""
+    def renumber(match):
+        return re.sub(r'\d+', lambda number: str(page_map.get(int(number.group()), int(number.group()))),
+                      match.group(0))
+    return CITATION_RE.sub(renumber, text or '')
+
+
+def position_texts(position: Dict) -> List[str]:
+    """Summary and key proposals of a stored position."""
+    proposals = json.loads(position['key_proposals']) if position['key_proposals'] else []
+    return [position['summary']] + [str(proposal) for proposal in proposals]
+
+
+def position_pages(position: Dict) -> Set[int]:
+    """
+    Pages a stored position was based on.
+
+    These are the pages whose passages the analysis was given. Positions
+    saved before context pages were recorded fall back to the pages they
+    cite ([Página N]), which may be empty.
+    """
+    if position.get('context_pages'):
+        return set(json.loads(position['context_pages']))
+    return cited_pages(position_texts(position))
+
+
+def renumber_position(position: Dict, page_map: Dict[int, int]) -> Optional[Dict]:
+    """
+    Position with its citations and context pages moved to new page numbers.
+
+    Returns:
+        Dict with summary, key_proposals (JSON) and context_pages (JSON or
+        None), or None if no page moves
+    """
+    context_pages = json.loads(position['context_pages']) if position.get('context_pages') else None
+    pages = cited_pages(position_texts(position)) | set(context_pages or [])
+    if all(page_map.get(page, page) == page for page in pages):
+        return None
+
+    proposals = json.loads(position['key_proposals']) if position['key_proposals'] else []
+    return {
+        'summary': renumber_citations(position['summary'], page_map),
+        'key_proposals': json.dumps(
+            [renumber_citations(proposal, page_map) if isinstance(proposal, str) else proposal
+             for proposal in proposals],
+            ensure_ascii=False
+        ),
+        'context_pages': json.dumps(sorted(page_map.get(page, page) for page in context_pages))
+        if context_pages is not None else None
+    }
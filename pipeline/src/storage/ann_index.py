@@ -0,0 +1,439 @@
+# ABOUTME: Approximate nearest neighbour search over document_embeddings with per-party NumPy IVF-flat indexes
+# ABOUTME: Persisted next to the database, kept up to date as embeddings are saved and reconciled on open
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted-file index with exact (flat) vectors inside each list.
+
+    Every search the pipeline runs is filtered to one party, so each party
+    has its own inverted lists: its vectors are clustered around its own
+    centroids with spherical k-means. A query is scored only against the
+    party's `nprobe` lists with the closest centroids, so `nprobe` trades
+    recall for latency: nprobe = the party's list count is an exact search,
+    small values touch a fraction of its vectors. With lists shared by all
+    parties, a party's nearest chunks would be spread over many lists
+    holding mostly other parties' chunks.
+
+    Parties are clustered when their first vectors are added and again
+    whenever they have grown RETRAIN_GROWTH-fold since, so a party embedded
+    a few chunks at a time still ends up with well-sized lists.
+    """
+
+    DEFAULT_NPROBE = 8
+
+    # Re-cluster a party once it has this many times the vectors it was clustered on
+    RETRAIN_GROWTH = 4
+
+    def __init__(self, dimensions: int, nlist: Optional[int] = None, nprobe: Optional[int] = None,
+                 path: Optional[str] = None, seed: int = 0):
+        """
+        Initialize an empty index.
+
+        Args:
+            dimensions: Embedding dimensions
+            nlist: Lists per party (default: 4·√party size, at most 4096)
+            nprobe: Lists scanned per query (defaults to ANN_NPROBE env var, or 8)
+            path: File the index is saved to
+            seed: Random seed for clustering (same data → same index)
+        """
+        self._dimensions = dimensions
+        self.lists_per_party = nlist
+        if nprobe is None:
+            nprobe = int(os.getenv("ANN_NPROBE", self.DEFAULT_NPROBE))
+        self.nprobe = nprobe
+        self.path = path
+        self.seed = seed
+
+        # party_id → {'centroids': (lists, dimensions), 'vectors': (n, dimensions), 'ids': (n,),
+        #             'lists': list of each row (n,), 'trained_size': vectors it was clustered on}
+        # Entries are replaced, never modified, so searches can read a snapshot without the lock
+        self._parties: Dict[int, Dict] = {}
+
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(self.party_size(party_id) for party_id in list(self._parties))
+
+    @property
+    def nlist(self) -> int:
+        """Total number of lists over all parties."""
+        return sum(len(party['centroids']) for party in list(self._parties.values()))
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    def party_size(self, party_id: int) -> int:
+        """Number of a party's vectors in the index."""
+        party = self._parties.get(party_id)
+        return len(party['ids']) if party else 0
+
+    def party_lists(self, party_id: int) -> int:
+        """Number of a party's lists (nprobe at or above this is an exact search)."""
+        party = self._parties.get(party_id)
+        return len(party['centroids']) if party else 0
+
+    @staticmethod
+    def default_path(db_path: str) -> str:
+        """Index file stored next to the database (data/database.db → data/database.ivf.npz)."""
+        return str(Path(db_path).with_suffix('.ivf.npz'))
+
+    @staticmethod
+    def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+    @classmethod
+    def _kmeans(cls, data: np.ndarray, nlist: int, iterations: int = 10,
+                max_training_points: int = 50_000, seed: int = 0) -> np.ndarray:
+        """
+        Spherical k-means centroids of (unit-length) vectors.
+
+        Args:
+            data: (n, dimensions) training vectors
+            nlist: Number of centroids
+            iterations: k-means iterations
+            max_training_points: Subsample size for large inputs
+            seed: Random seed
+        """
+        rng = np.random.default_rng(seed)
+        if len(data) > max_training_points:
+            data = data[rng.choice(len(data), max_training_points, replace=False)]
+        nlist = max(1, min(nlist, len(data)))
+
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = cls._nearest(centroids, data)
+            counts = np.bincount(assignments, minlength=nlist)
+            order = np.argsort(assignments, kind='stable')
+            starts = np.cumsum(counts) - counts
+            filled = counts > 0
+            sums = np.zeros_like(centroids)
+            sums[filled] = np.add.reduceat(data[order], starts[filled], axis=0)
+
+            # Re-seed empty lists with random points
+            empty = counts == 0
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+            centroids = cls._normalize_rows(sums)
+        return centroids
+
+    @staticmethod
+    def _nearest(centroids: np.ndarray, vectors: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        """Closest centroid of each (unit-length) vector."""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            assignments[start:start + batch_size] = np.argmax(
+                vectors[start:start + batch_size] @ centroids.T, axis=1
+            )
+        return assignments
+
+    @classmethod
+    def build_from_database(cls, db, nlist: Optional[int] = None, **kwargs) -> "IVFIndex":
+        """
+        Index every embedding in the database.
+
+        Args:
+            db: Database instance
+            nlist: Lists per party (default: 4·√party size)
+            **kwargs: Passed to the constructor (nprobe, path, seed)
+
+        Returns:
+            Populated IVFIndex whose path defaults to the one next to the database
+        """
+        with db.get_connection() as conn:
+            rows = conn.execute("""
+                SELECT de.id, d.party_id, de.embedding
+                FROM document_embeddings de
+                JOIN document_text dt ON de.document_text_id = dt.id
+                JOIN documents d ON dt.document_id = d.id
+            """).fetchall()
+
+        if not rows:
+            raise ValueError("No embeddings in database to build an index from")
+
+        vectors = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        kwargs.setdefault('path', cls.default_path(db.db_path))
+        index = cls(vectors.shape[1], nlist=nlist, **kwargs)
+        index.add(vectors, [row[0] for row in rows], [row[1] for row in rows])
+        return index
+
+    def add(self, vectors: np.ndarray, ids: Sequence[int], party_ids: Sequence[int]):
+        """
+        Insert vectors into their party's nearest lists.
+
+        A party seen for the first time, or grown RETRAIN_GROWTH-fold since
+        it was clustered, is (re-)clustered over all of its vectors.
+
+        Args:
+            vectors: (n, dimensions) embeddings
+            ids: document_embeddings.id of each vector
+            party_ids: Party of each vector
+        """
+        vectors = self._normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions))
+        ids = np.asarray(ids, dtype=np.int64)
+        party_ids = np.asarray(party_ids, dtype=np.int64)
+
+        with self._lock:
+            for party_id in np.unique(party_ids):
+                members = party_ids == party_id
+                self._add_to_party(int(party_id), vectors[members], ids[members])
+            self.dirty = True
+
+    def _add_to_party(self, party_id: int, vectors: np.ndarray, ids: np.ndarray):
+        """Add one party's vectors (caller holds the lock)."""
+        party = self._parties.get(party_id)
+        if party is not None:
+            vectors = np.concatenate([party['vectors'], vectors])
+            ids = np.concatenate([party['ids'], ids])
+
+        if party is None or len(ids) >= self.RETRAIN_GROWTH * party['trained_size']:
+            nlist = self.lists_per_party or int(4 * np.sqrt(len(vectors)))
+            centroids = self._kmeans(vectors, min(nlist, 4096), seed=self.seed)
+            party = {'centroids': centroids, 'trained_size': len(vectors),
+                     'lists': self._nearest(centroids, vectors)}
+        else:
+            party = dict(party, lists=np.concatenate([
+                party['lists'], self._nearest(party['centroids'], vectors[len(party['lists']):])
+            ]))
+
+        self._parties[party_id] = dict(party, vectors=vectors, ids=ids)
+
+    def remove(self, ids: Sequence[int]):
+        """Drop vectors by document_embeddings.id (e.g. embeddings of deleted pages)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            for party_id, party in list(self._parties.items()):
+                keep = ~np.isin(party['ids'], ids)
+                if keep.all():
+                    continue
+                self._parties[party_id] = dict(party, vectors=party['vectors'][keep], ids=party['ids'][keep],
+                                               lists=party['lists'][keep])
+                self.dirty = True
+
+    def _probe(self, party: Dict, queries: np.ndarray, k: int,
+               nprobe: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Rows and scores of a party's vectors in the lists closest to each (unit-length) query.
+
+        Each query's lists are taken closest centroid first until nprobe of
+        them were taken and they hold at least k vectors (or all were).
+
+        Returns:
+            (row indices, scores) per query
+        """
+        nprobe = min(nprobe or self.nprobe, len(party['centroids']))
+        order = np.argsort(-(queries @ party['centroids'].T), axis=1)  # (queries, lists)
+        list_sizes = np.bincount(party['lists'], minlength=len(party['centroids']))
+
+        # Lists each query needs: nprobe, or more until they hold k vectors
+        held = np.cumsum(list_sizes[order], axis=1)
+        needed = np.maximum(nprobe, (held < np.minimum(k, held[:, -1:])).sum(axis=1) + 1)
+        probed = np.zeros(order.shape, dtype=bool)
+        np.put_along_axis(probed, order, np.arange(order.shape[1])[None, :] < needed[:, None], axis=1)
+
+        probes = []
+        for query, row_mask in zip(queries, probed[:, party['lists']]):
+            rows = np.flatnonzero(row_mask)
+            probes.append((rows, party['vectors'][rows] @ query))
+        return probes
+
+    @staticmethod
+    def _top(party_id: int, ids: np.ndarray, scores: np.ndarray, k: int) -> List[Dict]:
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+
+        return [
+            {
+                'embedding_id': int(ids[i]),
+                'party_id': party_id,
+                'distance': 1.0 - float(scores[i]),
+                'similarity': float(scores[i])
+            }
+            for i in top
+        ]
+
+    def search(self, query_embedding, k: int = 15, nprobe: Optional[int] = None,
+               party_id: Optional[int] = None) -> List[Dict]:
+        """
+        Find approximately the k most similar vectors to a query.
+
+        Args:
+            query_embedding: Query vector
+            k: Number of results
+            nprobe: Lists to scan per party (overrides the index default; higher = better recall, slower)
+            party_id: Only search this party's chunks (default: every
+                party is searched and the results merged)
+
+        Returns:
+            List of dicts with embedding_id, party_id, distance and similarity, best first
+        """
+        party_ids = [party_id] if party_id is not None else list(self._parties)
+        results = self.search_many({0: query_embedding}, party_ids, k=k, nprobe=nprobe)
+        merged = [hit for party_id in party_ids for hit in results[(party_id, 0)]]
+        return sorted(merged, key=lambda hit: -hit['similarity'])[:k]
+
+    def search_many(self, queries: Mapping[Hashable, Sequence[float]], party_ids: Sequence[int],
+                    k: int = 15, nprobe: Optional[int] = None) -> Dict[Tuple[int, Hashable], List[Dict]]:
+        """
+        Run many queries against many parties.
+
+        Each party's lists are probed separately, so every party gets k
+        results unless it has fewer than k chunks in the index.
+
+        Args:
+            queries: Query key (e.g. category name) → query vector
+            party_ids: Parties to return results for
+            k: Number of results per (party, query)
+            nprobe: Lists to scan per (party, query) (overrides the index default)
+
+        Returns:
+            Dict mapping (party_id, query key) to results as returned by search()
+        """
+        keys = list(queries)
+        results = {(party_id, key): [] for party_id in party_ids for key in keys}
+        if not keys:
+            return results
+
+        matrix = self._normalize_rows(np.stack([np.asarray(queries[key], dtype=np.float32) for key in keys]))
+        for party_id in party_ids:
+            party = self._parties.get(party_id)
+            if party is None or not len(party['ids']):
+                continue
+            for key, (rows, scores) in zip(keys, self._probe(party, matrix, k, nprobe)):
+                results[(party_id, key)] = self._top(party_id, party['ids'][rows], scores, k)
+        return results
+
+    def save(self, path: Optional[str] = None):
+        """Write the index to disk (atomically replacing any previous file)."""
+        path = path or self.path
+        if not path:
+            raise ValueError("No path to save the index to")
+
+        with self._lock:
+            parties = sorted(self._parties.items())
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    dimensions=np.array(self.dimensions),
+                    parties=np.array([[party_id, len(party['centroids']), len(party['ids']),
+                                       party['trained_size']] for party_id, party in parties],
+                                     dtype=np.int64).reshape(-1, 4),
+                    centroids=np.concatenate([np.zeros((0, self.dimensions), dtype=np.float32)]
+                                             + [party['centroids'] for _, party in parties]),
+                    vectors=np.concatenate([np.zeros((0, self.dimensions), dtype=np.float32)]
+                                           + [party['vectors'] for _, party in parties]),
+                    ids=np.concatenate([np.zeros(0, dtype=np.int64)] + [party['ids'] for _, party in parties]),
+                    lists=np.concatenate([np.zeros(0, dtype=np.int64)] + [party['lists'] for _, party in parties])
+                )
+            os.replace(tmp_path, path)
+            self.path = path
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path: str, nprobe: Optional[int] = None) -> "IVFIndex":
+        """
+        Read an index saved with save().
+
+        Raises:
+            ValueError: If the file was written by the earlier shared-list format
+        """
+        with np.load(path) as data:
+            if 'parties' not in data:
+                raise ValueError(f"{path} uses the old shared-list format")
+            index = cls(int(data['dimensions']), nprobe=nprobe, path=path)
+            parties = data['parties']
+            centroids, vectors, ids, lists = data['centroids'], data['vectors'], data['ids'], data['lists']
+
+        list_start = row_start = 0
+        for party_id, list_count, row_count, trained_size in parties:
+            index._parties[int(party_id)] = {
+                'centroids': centroids[list_start:list_start + list_count],
+                'vectors': vectors[row_start:row_start + row_count],
+                'ids': ids[row_start:row_start + row_count],
+                'lists': lists[row_start:row_start + row_count],
+                'trained_size': int(trained_size)
+            }
+            list_start += list_count
+            row_start += row_count
+        return index
+
+    def reconcile(self, db) -> Tuple[int, int]:
+        """
+        Bring the index in line with document_embeddings.
+
+        The saved file can lag behind the table: a run that crashed before
+        saving, embeddings stored while no index file existed, or two runs
+        at once where the last one to close overwrote the other's inserts.
+        Every embedding missing from the index is added and every indexed
+        id that no longer exists is dropped. Ids are compared as sets, not
+        against the highest indexed id, because concurrent writers
+        interleave their ids.
+
+        Args:
+            db: Database the index was built from
+
+        Returns:
+            (embeddings added, embeddings dropped)
+        """
+        with db.get_connection() as conn:
+            table_ids = np.array([row[0] for row in conn.execute("SELECT id FROM document_embeddings")],
+                                 dtype=np.int64)
+        with self._lock:
+            indexed_ids = np.concatenate([np.zeros(0, dtype=np.int64)]
+                                         + [party['ids'] for party in self._parties.values()])
+
+        stale = np.setdiff1d(indexed_ids, table_ids)
+        if len(stale):
+            self.remove(stale)
+
+        missing = np.setdiff1d(table_ids, indexed_ids).tolist()
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            with db.get_connection() as conn:
+                rows = conn.execute(f"""
+                    SELECT de.id, d.party_id, de.embedding
+                    FROM document_embeddings de
+                    JOIN document_text dt ON de.document_text_id = dt.id
+                    JOIN documents d ON dt.document_id = d.id
+                    WHERE de.id IN ({','.join('?' * len(chunk))})
+                """, chunk).fetchall()
+            if rows:
+                vectors = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+                self.add(vectors, [row[0] for row in rows], [row[1] for row in rows])
+        return len(missing), len(stale)
+
+    @classmethod
+    def open(cls, db, nprobe: Optional[int] = None) -> Optional["IVFIndex"]:
+        """
+        Load the index stored next to a database, if one has been built.
+
+        The loaded index is reconciled with the database, so embeddings
+        stored or deleted since it was last saved are accounted for. A file
+        in the old shared-list format is rebuilt from the database.
+        """
+        path = cls.default_path(db.db_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            index = cls.load(path, nprobe=nprobe)
+        except ValueError as e:
+            print(f"⚠️  {e}; rebuilding it from the database")
+            index = cls.build_from_database(db, nprobe=nprobe, path=path)
+            index.save()
+            return index
+        index.reconcile(db)
+        return index
@@ -0,0 +1,69 @@
+# ABOUTME: Semantic search over chunk embeddings for many (party, query) pairs at once
+# ABOUTME: Uses the database's ANN index when one is attached, exact VectorIndex search otherwise
+
+from typing import Dict, Hashable, List, Mapping, Sequence, Tuple
+
+from .vector_index import VectorIndex
+
+
+def search_chunks(
+    db,
+    queries: Mapping[Hashable, Sequence[float]],
+    party_ids: Sequence[int],
+    k: int = 15
+) -> Dict[Tuple[int, Hashable], List[Dict]]:
+    """
+    Find the k chunks most similar to every query within each party.
+
+    With an IVF index attached (db.ann_index) only the lists closest to
+    each query that hold the party's chunks are scored, and only the
+    matching chunks' text is read from the database. A party the index
+    returns fewer hits for than it holds (up to k) is searched exactly
+    instead, loading just that party's embeddings; see short_parties().
+
+    Args:
+        db: Database instance
+        queries: Query key (e.g. category name) → query vector
+        party_ids: Parties to search
+        k: Number of results per (party, query)
+
+    Returns:
+        Dict mapping (party_id, query key) to dicts with page_number,
+        chunk_text, party_id, embedding_id, distance and similarity, best
+        match first
+    """
+    party_ids = list(party_ids)
+    index = db.ann_index
+    if index is None or len(index) == 0:
+        return VectorIndex.from_database(db, party_ids=party_ids).search_many(queries, party_ids=party_ids, k=k)
+
+    results = index.search_many(queries, party_ids, k=k)
+    short = short_parties(index, results, party_ids, queries, k)
+    if short:
+        exact = VectorIndex.from_database(db, party_ids=short)
+        results.update(exact.search_many(queries, party_ids=short, k=k))
+
+    # Exact results already carry their text; look up the rest in one pass
+    missing = sorted({hit['embedding_id'] for hits in results.values() for hit in hits if 'chunk_text' not in hit})
+    chunks = db.get_embedding_chunks(missing)
+    for key, hits in results.items():
+        results[key] = [dict(hit, **chunks[hit['embedding_id']]) if 'chunk_text' not in hit else hit
+                        for hit in hits if 'chunk_text' in hit or hit['embedding_id'] in chunks]
+    return results
+
+
+def short_parties(index, results: Dict[Tuple[int, Hashable], List[Dict]], party_ids: Sequence[int],
+                  queries: Mapping[Hashable, Sequence[float]], k: int) -> List[int]:
+    """
+    Parties whose ANN results need an exact search.
+
+    A party is short when any query returned fewer hits than
+    min(k, the party's vectors in the index). Parties the index doesn't
+    know (e.g. embedded while it wasn't loaded) count as short too.
+    """
+    short = []
+    for party_id in party_ids:
+        size = index.party_size(party_id)
+        if size == 0 or any(len(results[(party_id, key)]) < min(k, size) for key in queries):
+            short.append(party_id)
+    return short
@@ -2,26 +2,113 @@
 # ABOUTME: Supports flexible category system with retroactive analysis capability
 
 import sqlite3
+import struct
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from contextlib import contextmanager
 
 
 class Database:
     """Main database interface for political party analysis."""
 
-    def __init__(self, db_path: str):
+    # PRAGMAs applied to long-lived connections (persistent=True)
+    DEFAULT_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,      # ~64 MB page cache (negative = KiB)
+        'mmap_size': 268435456,    # 256 MB memory-mapped I/O
+        'temp_store': 'MEMORY',
+    }
+
+    # Columns added to existing tables after their first release: table → [(column, type)]
+    COLUMN_MIGRATIONS = {
+        'document_text': [
+            ('processing_time_ms', 'REAL'),  # Time to extract/OCR the page
+            ('ocr_confidence', 'REAL'),      # Mean EasyOCR confidence (NULL for text layers)
+            ('content_hash', 'TEXT'),        # Fingerprint of the page's source content
+        ],
+        'processing_log': [
+            ('prompt_tokens', 'INTEGER'),    # Input tokens of the LLM request
+            ('cached_tokens', 'INTEGER'),    # Input tokens served from the provider's prompt cache
+        ],
+        'party_positions': [
+            ('context_pages', 'TEXT'),       # JSON page numbers the analysis was given
+        ],
+    }
+
+    def __init__(self, db_path: str, persistent: bool = False,
+                 pragmas: Optional[Dict[str, Any]] = None):
+        """
+        Initialize database.
+
+        Args:
+            db_path: Path to SQLite database file
+            persistent: Keep one long-lived connection per thread instead of
+                opening and closing a connection on every call
+            pragmas: PRAGMAs to apply to each new connection (defaults to
+                DEFAULT_PRAGMAS when persistent, none otherwise)
+        """
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.persistent = persistent
+        if pragmas is None:
+            pragmas = dict(self.DEFAULT_PRAGMAS) if persistent else {}
+        self.pragmas = pragmas
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Optional IVFIndex kept in sync with document_embeddings inserts
+        self.ann_index = None
+        # Flushes of buffered writes (e.g. cache usage) to run before closing
+        self._close_callbacks = []
         self._initialize_schema()
 
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection with row factory and PRAGMAs applied."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=not self.persistent)
+        conn.row_factory = sqlite3.Row  # Return rows as dicts
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        """Get (or lazily open) the long-lived connection for this thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Return rows as dicts
+        """
+        Context manager for database connections.
+
+        Commits on success and rolls back on error. Inside a transaction()
+        block the enclosing unit of work's connection is reused and the
+        commit is deferred until the block exits.
+        """
+        active = getattr(self._local, 'transaction_conn', None)
+        if active is not None:
+            yield active
+            return
+
+        if self.persistent:
+            conn = self._thread_connection()
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            return
+
+        conn = self._connect()
         try:
             yield conn
             conn.commit()
@@ -31,6 +118,89 @@ class Database:
         finally:
             conn.close()
 
+    @contextmanager
+    def transaction(self):
+        """
+        Unit of work: group several Database calls into one transaction.
+
+        Every method called on this Database from the same thread inside the
+        block shares one connection and commits once at the end (or rolls
+        back everything on error). Nested transaction() blocks join the
+        outer one.
+
+        Example:
+            with db.transaction():
+                for page in pages:
+                    db.save_extracted_text(doc_id, page['page_number'], page['text'])
+        """
+        if getattr(self._local, 'transaction_conn', None) is not None:
+            yield self._local.transaction_conn
+            return
+
+        conn = self._thread_connection() if self.persistent else self._connect()
+        callbacks = []
+        self._local.transaction_conn = conn
+        self._local.after_commit = callbacks
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self._local.transaction_conn = None
+            self._local.after_commit = None
+            if not self.persistent:
+                conn.close()
+
+        for callback in callbacks:
+            callback()
+
+    def on_close(self, callback):
+        """Run callback at the start of close(), while the database is still usable."""
+        self._close_callbacks.append(callback)
+
+    def _after_commit(self, callback):
+        """Run callback once the current work is committed (dropped if a transaction() rolls back)."""
+        if getattr(self._local, 'transaction_conn', None) is not None:
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    def close(self):
+        """
+        Close all long-lived connections opened in persistent mode.
+
+        Callbacks registered with on_close() run first, so buffered writes
+        are flushed. An attached ANN index with unsaved changes is reconciled with the
+        table (picking up other processes' inserts) and written to disk.
+
+        If WAL was enabled, the log is checkpointed and the file switched back
+        to a rollback journal so database.db stays a single self-contained
+        file (the web app opens it read-only).
+        """
+        for callback in self._close_callbacks:
+            callback()
+
+        if self.ann_index is not None and self.ann_index.dirty:
+            self.ann_index.reconcile(self)
+            self.ann_index.save()
+
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+        if str(self.pragmas.get('journal_mode', '')).upper() == 'WAL':
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.execute("PRAGMA journal_mode = DELETE")
+            except sqlite3.OperationalError:
+                pass  # Another process still has the database open
+            finally:
+                conn.close()
+
     def _initialize_schema(self):
         """Create all database tables if they don't exist."""
         with self.get_connection() as conn:
@@ -108,6 +278,7 @@ class Database:
                     raw_llm_response TEXT,
                     tokens_used INTEGER,
                     cost_usd REAL,
+                    context_pages TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (party_id) REFERENCES parties(id),
                     FOREIGN KEY (document_id) REFERENCES documents(id),
@@ -187,6 +358,84 @@ class Database:
             # Index for embeddings
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_doc_text ON document_embeddings(document_text_id)")
 
+            # LLM response cache (content-addressed by request hash)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response_json TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    hit_count INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_response_cache(last_used_at)")
+
+            # Embedding cache (content-addressed by model and text hash)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    token_count INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+
+            # Persistent cache counters (hits/misses across runs)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+            # Batch API jobs: the JSONL request file, its upload and the provider batch,
+            # recorded at each step so an interrupted run resumes instead of resubmitting
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_batches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'prepared',
+                    input_path TEXT NOT NULL,
+                    input_file_id TEXT,
+                    batch_id TEXT,
+                    output_file_id TEXT,
+                    error_file_id TEXT,
+                    request_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # One row per request of a batch; status moves from pending once its result is saved
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_batch_requests (
+                    batch_row_id INTEGER NOT NULL,
+                    custom_id TEXT NOT NULL,
+                    document_id INTEGER,
+                    party_id INTEGER,
+                    category_id INTEGER,
+                    metadata TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    PRIMARY KEY (batch_row_id, custom_id),
+                    FOREIGN KEY (batch_row_id) REFERENCES llm_batches(id) ON DELETE CASCADE
+                )
+            """)
+
+            self._apply_column_migrations(cursor)
+
+    def _apply_column_migrations(self, cursor):
+        """Add columns introduced after a table was first created (ALTER TABLE)."""
+        for table, columns in self.COLUMN_MIGRATIONS.items():
+            cursor.execute(f"PRAGMA table_info({table})")
+            existing = {row[1] for row in cursor.fetchall()}
+            for column, definition in columns:
+                if column not in existing:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
     def add_party(self, name: str, abbreviation: str, folder_name: str, **kwargs) -> int:
         """Add a new political party."""
         with self.get_connection() as conn:
@@ -243,6 +492,33 @@ class Database:
                 VALUES (?, ?, ?, ?, ?)
             """, (document_id, page_number, raw_text, markdown_text, extraction_method))
 
+    def save_extracted_pages(self, document_id: int, pages: List[Dict],
+                             extraction_method: str = 'pymupdf'):
+        """
+        Save many extracted pages in a single transaction.
+
+        Args:
+            document_id: Database document ID
+            pages: Page dicts as returned by PDFExtractor/OCRProcessor
+                (page_number, text and optionally markdown_text, extraction_method,
+                processing_time_ms, ocr_confidence, content_hash)
+            extraction_method: Default method for pages that don't specify one
+        """
+        rows = [
+            (document_id, page['page_number'], page['text'],
+             page.get('markdown_text'), page.get('extraction_method', extraction_method),
+             page.get('processing_time_ms'), page.get('ocr_confidence'), page.get('content_hash'))
+            for page in pages
+        ]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO document_text
+                (document_id, page_number, raw_text, markdown_text, extraction_method,
+                 processing_time_ms, ocr_confidence, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
     def get_extracted_text(self, document_id: int) -> str:
         """Get cached extracted text for a document."""
         with self.get_connection() as conn:
@@ -256,30 +532,160 @@ class Database:
             return "\n\n".join(texts)
 
     def is_text_extracted(self, document_id: int) -> bool:
-        """Check if text has already been extracted for a document."""
+        """
+        Check if text has already been extracted for a document.
+
+        When the document's page count is known, every page must have been
+        saved; a partially extracted document (interrupted run) is not done.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT COUNT(*) as count FROM document_text WHERE document_id = ?
+                SELECT
+                    (SELECT COUNT(DISTINCT page_number) FROM document_text WHERE document_id = ?) as count,
+                    (SELECT page_count FROM documents WHERE id = ?) as page_count
+            """, (document_id, document_id))
+            row = cursor.fetchone()
+            if row['page_count']:
+                return row['count'] >= row['page_count']
+            return row['count'] > 0
+
+    def get_extracted_pages(self, document_id: int) -> Dict[int, str]:
+        """Get page_number → extraction_method for pages already saved for a document."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT page_number, extraction_method FROM document_text WHERE document_id = ?
             """, (document_id,))
-            return cursor.fetchone()['count'] > 0
+            return {row['page_number']: row['extraction_method'] for row in cursor.fetchall()}
+
+    def delete_extracted_text(self, document_id: int):
+        """Delete a document's extracted pages and the embeddings made from them."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM document_text WHERE document_id = ?", (document_id,))
+            self._delete_pages(cursor, [row[0] for row in cursor.fetchall()])
+
+    def get_document_pages(self, document_id: int) -> List[Dict]:
+        """Get a document's saved pages (id, page_number, raw_text, extraction_method, content_hash)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, page_number, raw_text, extraction_method, content_hash
+                FROM document_text
+                WHERE document_id = ?
+                ORDER BY page_number
+            """, (document_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def delete_pages(self, document_text_ids: List[int]) -> int:
+        """
+        Delete pages and the embeddings made from them.
+
+        Returns:
+            Number of embeddings deleted
+        """
+        with self.get_connection() as conn:
+            return self._delete_pages(conn.cursor(), document_text_ids)
+
+    def _delete_pages(self, cursor, document_text_ids: List[int]) -> int:
+        embedding_ids = []
+        for start in range(0, len(document_text_ids), 500):
+            chunk = document_text_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"""
+                SELECT id FROM document_embeddings WHERE document_text_id IN ({placeholders})
+            """, chunk)
+            embedding_ids.extend(row[0] for row in cursor.fetchall())
+            cursor.execute(f"DELETE FROM document_embeddings WHERE document_text_id IN ({placeholders})", chunk)
+            cursor.execute(f"DELETE FROM document_text WHERE id IN ({placeholders})", chunk)
+
+        if self.ann_index is not None and embedding_ids:
+            self._after_commit(lambda: self.ann_index.remove(embedding_ids))
+        return len(embedding_ids)
+
+    def update_kept_pages(self, pages: Dict[int, Tuple[int, str]]):
+        """
+        Update pages kept from a previous version of a document.
+
+        Args:
+            pages: document_text id → (new page_number, content_hash)
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "UPDATE document_text SET page_number = ?, content_hash = ? WHERE id = ?",
+                [(page_number, content_hash, text_id)
+                 for text_id, (page_number, content_hash) in pages.items()]
+            )
+
+    def update_document_file(self, document_id: int, file_hash: str, page_count: int):
+        """Record the hash and page count of a document's current PDF."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE documents SET file_hash = ?, page_count = ? WHERE id = ?",
+                           (file_hash, page_count, document_id))
+
+    def update_document_page_count(self, document_id: int, page_count: int):
+        """Record a document's page count."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE documents SET page_count = ? WHERE id = ?", (page_count, document_id))
 
     def save_party_position(self, party_id: int, document_id: int, category_id: int,
                            summary: str, key_proposals: List[str], **kwargs):
-        """Save analyzed party position for a category."""
+        """
+        Save analyzed party position for a category.
+
+        kwargs may include context_pages: the page numbers whose passages the
+        analysis was given (used by sync to tell which positions a changed
+        PDF affects).
+        """
+        context_pages = kwargs.get('context_pages')
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT OR REPLACE INTO party_positions
                 (party_id, document_id, category_id, summary, key_proposals,
                  ideology_position, budget_mentioned, confidence_score,
-                 raw_llm_response, tokens_used, cost_usd)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 raw_llm_response, tokens_used, cost_usd, context_pages)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (party_id, document_id, category_id, summary,
                   json.dumps(key_proposals, ensure_ascii=False),
                   kwargs.get('ideology_position'), kwargs.get('budget_mentioned'),
                   kwargs.get('confidence_score'), kwargs.get('raw_llm_response'),
-                  kwargs.get('tokens_used'), kwargs.get('cost_usd')))
+                  kwargs.get('tokens_used'), kwargs.get('cost_usd'),
+                  json.dumps(sorted(context_pages)) if context_pages is not None else None))
+
+    def get_document_positions(self, document_id: int) -> List[Dict]:
+        """Get a document's analyzed positions (id, category_id, summary, key_proposals, context_pages)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, category_id, summary, key_proposals, context_pages
+                FROM party_positions
+                WHERE document_id = ?
+            """, (document_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def update_position_citations(self, position_id: int, summary: str, key_proposals: str,
+                                  context_pages: Optional[str] = None):
+        """Replace a position's summary, key_proposals and context_pages (JSON), e.g. after page renumbering."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE party_positions SET summary = ?, key_proposals = ?, context_pages = ? WHERE id = ?
+            """, (summary, key_proposals, context_pages, position_id))
+
+    def invalidate_positions(self, document_id: int, category_ids: List[int]):
+        """Delete positions and their processing status so the categories get analyzed again."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for table in ('party_positions', 'category_processing_status'):
+                cursor.executemany(
+                    f"DELETE FROM {table} WHERE document_id = ? AND category_id = ?",
+                    [(document_id, category_id) for category_id in category_ids]
+                )
 
     def update_processing_status(self, document_id: int, category_id: int,
                                 status: str, error_message: str = None):
@@ -313,11 +719,12 @@ class Database:
             cursor.execute("""
                 INSERT INTO processing_log
                 (document_id, category_id, stage, status, error_message,
-                 tokens_used, cost_usd, duration_seconds)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                 tokens_used, prompt_tokens, cached_tokens, cost_usd, duration_seconds)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (kwargs.get('document_id'), kwargs.get('category_id'),
                   stage, status, kwargs.get('error_message'),
-                  kwargs.get('tokens_used'), kwargs.get('cost_usd'),
+                  kwargs.get('tokens_used'), kwargs.get('prompt_tokens'),
+                  kwargs.get('cached_tokens'), kwargs.get('cost_usd'),
                   kwargs.get('duration_seconds')))
 
     def get_all_categories(self) -> List[Dict]:
@@ -348,6 +755,52 @@ class Database:
                 (document_text_id, chunk_index, chunk_text, embedding, embedding_model, token_count)
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (document_text_id, chunk_index, chunk_text, embedding, embedding_model, token_count))
+            embedding_id = cursor.lastrowid
+        if self.ann_index is not None:
+            self._after_commit(lambda: self._add_to_ann_index(embedding_id, embedding_id))
+
+    def save_embeddings_bulk(self, rows: List[Dict]):
+        """
+        Save many embeddings in a single transaction.
+
+        Args:
+            rows: Dicts with document_text_id, chunk_index, chunk_text, embedding,
+                token_count and optionally embedding_model
+        """
+        values = [
+            (row['document_text_id'], row['chunk_index'], row['chunk_text'], row['embedding'],
+             row.get('embedding_model', 'text-embedding-3-small'), row['token_count'])
+            for row in rows
+        ]
+        if not values:
+            return
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO document_embeddings
+                (document_text_id, chunk_index, chunk_text, embedding, embedding_model, token_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, values)
+            # This transaction holds the write lock, so the newest ids are the rows just inserted
+            cursor.execute("SELECT MAX(id) FROM document_embeddings")
+            last_id = cursor.fetchone()[0]
+        if self.ann_index is not None:
+            first_id = last_id - len(values) + 1
+            self._after_commit(lambda: self._add_to_ann_index(first_id, last_id))
+
+    def _add_to_ann_index(self, first_id: int, last_id: int):
+        """Add the committed embeddings with ids first_id..last_id to the attached ANN index."""
+        with self.get_connection() as conn:
+            rows = conn.execute("""
+                SELECT de.id, d.party_id, de.embedding
+                FROM document_embeddings de
+                JOIN document_text dt ON de.document_text_id = dt.id
+                JOIN documents d ON dt.document_id = d.id
+                WHERE de.id BETWEEN ? AND ?
+            """, (first_id, last_id)).fetchall()
+        if rows:
+            vectors = [struct.unpack(f'{len(row[2]) // 4}f', row[2]) for row in rows]
+            self.ann_index.add(vectors, [row[0] for row in rows], [row[1] for row in rows])
 
     def get_all_document_text_ids(self) -> List[int]:
         """Get all document_text IDs for embedding generation."""
@@ -379,6 +832,55 @@ class Database:
             """, (document_text_id,))
             return cursor.fetchone()['count'] > 0
 
+    def get_pages_without_embeddings(self, document_id: int,
+                                     page_numbers: Optional[List[int]] = None) -> List[Dict]:
+        """
+        Get a document's saved pages that have no embeddings yet.
+
+        Args:
+            document_id: Database document ID
+            page_numbers: Only consider these pages (None = all)
+
+        Returns:
+            Dicts with id, page_number and raw_text, in page order
+        """
+        query = """
+            SELECT id, page_number, raw_text
+            FROM document_text
+            WHERE document_id = ?
+            AND id NOT IN (SELECT DISTINCT document_text_id FROM document_embeddings)
+        """
+        params = [document_id]
+        if page_numbers is not None:
+            query += f" AND page_number IN ({','.join('?' * len(page_numbers))})"
+            params.extend(page_numbers)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query + " ORDER BY page_number", params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_embedding_chunks(self, embedding_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Get the page number and text of embedded chunks.
+
+        Returns:
+            document_embeddings id → dict with page_number and chunk_text
+        """
+        chunks = {}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(embedding_ids), 500):
+                chunk = embedding_ids[start:start + 500]
+                cursor.execute(f"""
+                    SELECT de.id, dt.page_number, de.chunk_text
+                    FROM document_embeddings de
+                    JOIN document_text dt ON de.document_text_id = dt.id
+                    WHERE de.id IN ({','.join('?' * len(chunk))})
+                """, chunk)
+                for row in cursor.fetchall():
+                    chunks[row['id']] = {'page_number': row['page_number'], 'chunk_text': row['chunk_text']}
+        return chunks
+
     def get_embedding_stats(self) -> Dict:
         """Get statistics about embeddings."""
         with self.get_connection() as conn:
@@ -392,3 +894,200 @@ class Database:
                 FROM document_embeddings
             """)
             return dict(cursor.fetchone())
+
+    def get_cached_llm_response(self, cache_key: str) -> Optional[str]:
+        """
+        Get a cached LLM response (JSON).
+
+        Read-only: usage (hit_count, last_used_at) is written in batches by
+        record_llm_cache_usage().
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT response_json FROM llm_response_cache WHERE cache_key = ?
+            """, (cache_key,))
+            row = cursor.fetchone()
+            return row['response_json'] if row else None
+
+    def save_cached_llm_response(self, cache_key: str, model: str, response_json: str):
+        """Store an LLM response in the cache."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO llm_response_cache
+                (cache_key, model, response_json, size_bytes, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (cache_key, model, response_json, len(response_json.encode('utf-8')), datetime.now()))
+
+    def record_llm_cache_usage(self, touches: Dict[str, Tuple[int, datetime]], counters: Dict[str, int]):
+        """
+        Write accumulated cache usage in one transaction.
+
+        Args:
+            touches: cache_key → (hits since last flush, last time it was used)
+            counters: Persistent counter name ('hits' or 'misses') → increment
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                UPDATE llm_response_cache
+                SET hit_count = hit_count + ?, last_used_at = MAX(last_used_at, ?)
+                WHERE cache_key = ?
+            """, [(hits, last_used, key) for key, (hits, last_used) in touches.items()])
+            cursor.executemany("""
+                INSERT INTO llm_cache_stats (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+            """, [(name, amount) for name, amount in counters.items() if amount])
+
+    def prune_llm_cache(self, max_size_bytes: int) -> int:
+        """
+        Evict least recently used cache entries until the cache fits in max_size_bytes.
+
+        Returns number of entries evicted.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(SUM(size_bytes), 0) as total FROM llm_response_cache")
+            excess = cursor.fetchone()['total'] - max_size_bytes
+            if excess <= 0:
+                return 0
+
+            cursor.execute("""
+                SELECT cache_key, size_bytes FROM llm_response_cache ORDER BY last_used_at ASC
+            """)
+            evict = []
+            for row in cursor.fetchall():
+                if excess <= 0:
+                    break
+                evict.append((row['cache_key'],))
+                excess -= row['size_bytes']
+
+            cursor.executemany("DELETE FROM llm_response_cache WHERE cache_key = ?", evict)
+            return len(evict)
+
+    def get_llm_cache_stats(self) -> Dict:
+        """Get LLM response cache statistics."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, value FROM llm_cache_stats")
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
+
+            cursor.execute("""
+                SELECT COUNT(*) as entries, COALESCE(SUM(size_bytes), 0) as size_bytes
+                FROM llm_response_cache
+            """)
+            row = cursor.fetchone()
+
+            return {
+                'hits': counters.get('hits', 0),
+                'misses': counters.get('misses', 0),
+                'entries': row['entries'],
+                'size_bytes': row['size_bytes']
+            }
+
+    def create_llm_batch(self, kind: str, input_path: str, requests: List[Dict]) -> int:
+        """
+        Record a prepared batch and its requests.
+
+        Args:
+            kind: Job type (e.g. 'category_analysis', 'summary')
+            input_path: JSONL file holding the request bodies
+            requests: Dicts with custom_id and optional document_id,
+                party_id, category_id and metadata (JSON-serializable)
+
+        Returns:
+            The llm_batches row ID
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO llm_batches (kind, input_path, request_count) VALUES (?, ?, ?)
+            """, (kind, input_path, len(requests)))
+            batch_row_id = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO llm_batch_requests
+                (batch_row_id, custom_id, document_id, party_id, category_id, metadata)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(batch_row_id, request['custom_id'], request.get('document_id'),
+                   request.get('party_id'), request.get('category_id'),
+                   json.dumps(request.get('metadata') or {}, ensure_ascii=False))
+                  for request in requests])
+            return batch_row_id
+
+    def update_llm_batch(self, batch_row_id: int, **fields):
+        """Set columns of an llm_batches row (status, input_file_id, batch_id, ...)."""
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE llm_batches SET {assignments}, updated_at = ? WHERE id = ?
+            """, (*fields.values(), datetime.now(), batch_row_id))
+
+    def get_llm_batch(self, batch_row_id: int) -> Optional[Dict]:
+        """Get an llm_batches row by ID."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM llm_batches WHERE id = ?", (batch_row_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def get_open_llm_batches(self, kind: str) -> List[Dict]:
+        """Batches of a kind whose results haven't all been ingested, oldest first."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM llm_batches WHERE kind = ? AND status != 'ingested' ORDER BY id
+            """, (kind,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_llm_batch_requests(self, batch_row_id: int, status: Optional[str] = 'pending') -> List[Dict]:
+        """Requests of a batch (metadata decoded), optionally only those with a status."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            query = "SELECT * FROM llm_batch_requests WHERE batch_row_id = ?"
+            params = [batch_row_id]
+            if status is not None:
+                query += " AND status = ?"
+                params.append(status)
+            cursor.execute(query, params)
+            return [dict(row, metadata=json.loads(row['metadata'] or '{}')) for row in cursor.fetchall()]
+
+    def update_llm_batch_request(self, batch_row_id: int, custom_id: str, status: str):
+        """Mark a batch request as ingested ('completed' or 'failed')."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE llm_batch_requests SET status = ? WHERE batch_row_id = ? AND custom_id = ?
+            """, (status, batch_row_id, custom_id))
+
+    def get_cached_embeddings(self, model: str, text_hashes: List[str]) -> Dict[str, tuple]:
+        """
+        Look up cached embeddings by text hash.
+
+        Returns:
+            Dict mapping each found hash to (embedding blob, token_count)
+        """
+        found = {}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(text_hashes), 500):
+                batch = text_hashes[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                cursor.execute(f"""
+                    SELECT text_hash, embedding, token_count FROM embedding_cache
+                    WHERE model = ? AND text_hash IN ({placeholders})
+                """, (model, *batch))
+                for row in cursor.fetchall():
+                    found[row['text_hash']] = (row['embedding'], row['token_count'])
+        return found
+
+    def save_cached_embeddings(self, model: str, rows: List[tuple]):
+        """Store (text_hash, embedding blob, token_count) rows in the embedding cache."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding, token_count)
+                VALUES (?, ?, ?, ?)
+            """, [(model, text_hash, embedding, token_count) for text_hash, embedding, token_count in rows])
@@ -1,19 +1,15 @@
 # ABOUTME: Database initialization script - loads categories and existing parties
 # ABOUTME: Run this to set up the database with initial data from config
 
+import sys
 import json
-import hashlib
 from pathlib import Path
 from .database import Database
 
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
-def calculate_file_hash(file_path: Path) -> str:
-    """Calculate SHA256 hash of a file."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+from extraction.pdf_extractor import ingest_pdf
 
 
 def load_categories(db: Database, config_path: Path):
@@ -83,13 +79,14 @@ def load_existing_parties(db: Database, partidos_dir: Path):
                 folder_name=folder.name
             )
 
-            # Add document
-            file_hash = calculate_file_hash(pdf_path)
+            # Add document (hash and page count from one pass over the PDF)
+            ingest = ingest_pdf(pdf_path, pages=False, logos=False)
             doc_id = db.add_document(
                 party_id=party_id,
                 title=f"Plan de Gobierno {full_name} 2026",
                 file_path=str(pdf_path),
-                file_hash=file_hash
+                file_hash=ingest['sha256'],
+                page_count=ingest['page_count']
             )
 
             print(f"  ✓ Added party: {full_name} ({abbr})")
@@ -0,0 +1,224 @@
+# ABOUTME: Exact in-memory cosine search over document_embeddings using a NumPy float32 matrix
+# ABOUTME: Loads all vectors once, pre-normalized and grouped by party for filtered top-k queries
+
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class VectorIndex:
+    """
+    Exact nearest-neighbour index over chunk embeddings.
+
+    All vectors live in one contiguous float32 matrix with unit-length rows,
+    so cosine similarity against a query is a single matrix-vector product.
+    Rows are sorted by party, which makes the per-party filter a slice of
+    the matrix instead of a mask over every row.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        embedding_ids: Sequence[int],
+        party_ids: Sequence[int],
+        page_numbers: Sequence[int],
+        chunk_texts: Sequence[str]
+    ):
+        """
+        Initialize index from raw vectors and their metadata.
+
+        Args:
+            vectors: (n, dimensions) embedding matrix
+            embedding_ids: document_embeddings.id of each row
+            party_ids: Party of each row
+            page_numbers: Source page of each row
+            chunk_texts: Chunk text of each row
+        """
+        party_ids = np.asarray(party_ids, dtype=np.int64)
+        order = np.argsort(party_ids, kind='stable')
+
+        vectors = np.asarray(vectors, dtype=np.float32)[order]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.vectors = np.ascontiguousarray(vectors / norms)
+
+        self.embedding_ids = np.asarray(embedding_ids, dtype=np.int64)[order]
+        self.party_ids = party_ids[order]
+        self.page_numbers = np.asarray(page_numbers, dtype=np.int32)[order]
+        self.chunk_texts = [chunk_texts[i] for i in order]
+
+        # party_id → (start, end) row range
+        self.party_ranges: Dict[int, tuple] = {}
+        if len(self.party_ids):
+            parties, starts = np.unique(self.party_ids, return_index=True)
+            ends = list(starts[1:]) + [len(self.party_ids)]
+            for party_id, start, end in zip(parties, starts, ends):
+                self.party_ranges[int(party_id)] = (int(start), int(end))
+
+    def __len__(self) -> int:
+        return len(self.embedding_ids)
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+
+    @classmethod
+    def from_database(cls, db, party_ids: Optional[Sequence[int]] = None,
+                      model: Optional[str] = None) -> "VectorIndex":
+        """
+        Load embeddings from the database.
+
+        Args:
+            db: Database instance
+            party_ids: Only load these parties' chunks (default: all)
+            model: Only load embeddings made with this model (default: all)
+
+        Returns:
+            VectorIndex over the selected embeddings
+        """
+        sql = """
+            SELECT de.id, d.party_id, dt.page_number, de.chunk_text, de.embedding
+            FROM document_embeddings de
+            JOIN document_text dt ON de.document_text_id = dt.id
+            JOIN documents d ON dt.document_id = d.id
+            WHERE 1 = 1
+        """
+        params = []
+        if party_ids:
+            sql += f" AND d.party_id IN ({','.join('?' * len(party_ids))})"
+            params.extend(party_ids)
+        if model:
+            sql += " AND de.embedding_model = ?"
+            params.append(model)
+
+        with db.get_connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        if not rows:
+            return cls(np.zeros((0, 0), dtype=np.float32), [], [], [], [])
+
+        dimensions = len(rows[0][4]) // 4
+        vectors = np.empty((len(rows), dimensions), dtype=np.float32)
+        for i, row in enumerate(rows):
+            vectors[i] = np.frombuffer(row[4], dtype=np.float32)
+
+        return cls(
+            vectors,
+            embedding_ids=[row[0] for row in rows],
+            party_ids=[row[1] for row in rows],
+            page_numbers=[row[2] for row in rows],
+            chunk_texts=[row[3] for row in rows]
+        )
+
+    @staticmethod
+    def _normalize(query) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def search(self, query_embedding, k: int = 15, party_id: Optional[int] = None) -> List[Dict]:
+        """
+        Find the k chunks most similar to a query.
+
+        Args:
+            query_embedding: Query vector (list of floats or array)
+            k: Number of results
+            party_id: Only search this party's chunks
+
+        Returns:
+            List of dicts with page_number, chunk_text, party_id, embedding_id,
+            distance (cosine distance, like vec_distance_cosine) and
+            similarity, best match first
+        """
+        if party_id is not None:
+            if party_id not in self.party_ranges:
+                return []
+            start, end = self.party_ranges[party_id]
+        else:
+            start, end = 0, len(self)
+
+        if end <= start:
+            return []
+
+        scores = self.vectors[start:end] @ self._normalize(query_embedding)
+        return [self._result(start + i, scores[i]) for i in self._top_k(scores, k)]
+
+    def search_many(
+        self,
+        queries: Mapping[Hashable, Sequence[float]],
+        party_ids: Optional[Sequence[int]] = None,
+        k: int = 15
+    ) -> Dict[Tuple[int, Hashable], List[Dict]]:
+        """
+        Run many queries against many parties at once.
+
+        All query vectors are scored against the selected parties' chunks
+        with a single matrix-matrix product, then the top k rows of each
+        (party, query) block are picked.
+
+        Args:
+            queries: Query key (e.g. category name) → query vector
+            party_ids: Parties to search (default: every party in the index)
+            k: Number of results per (party, query)
+
+        Returns:
+            Dict mapping (party_id, query key) to results as returned by search()
+        """
+        keys = list(queries)
+        if party_ids is None:
+            party_ids = list(self.party_ranges)
+        results = {(party_id, key): [] for party_id in party_ids for key in keys}
+
+        ranges = [(party_id, self.party_ranges[party_id]) for party_id in party_ids
+                  if party_id in self.party_ranges]
+        if not keys or not ranges:
+            return results
+
+        matrix = np.stack([self._normalize(queries[key]) for key in keys], axis=1)  # (d, m)
+
+        # One product over the rows of all selected parties
+        if len(ranges) == len(self.party_ranges):
+            scores = self.vectors @ matrix
+            offsets = [start for _, (start, _) in ranges]
+        else:
+            scores = np.concatenate([self.vectors[start:end] for _, (start, end) in ranges]) @ matrix
+            sizes = [end - start for _, (start, end) in ranges]
+            offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).tolist()
+
+        for (party_id, (start, end)), offset in zip(ranges, offsets):
+            size = end - start
+            block = scores[offset:offset + size]  # (party rows, queries)
+
+            if k < size:
+                top = np.argpartition(-block, k - 1, axis=0)[:k]
+            else:
+                top = np.broadcast_to(np.arange(size)[:, None], block.shape)
+            top_scores = np.take_along_axis(block, top, axis=0)
+            order = np.argsort(-top_scores, axis=0)
+            top = np.take_along_axis(top, order, axis=0)
+
+            for column, key in enumerate(keys):
+                results[(party_id, key)] = [
+                    self._result(start + int(i), block[i, column]) for i in top[:, column]
+                ]
+
+        return results
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first."""
+        if k >= len(scores):
+            return np.argsort(-scores)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _result(self, row: int, similarity: float) -> Dict:
+        similarity = float(similarity)
+        return {
+            'embedding_id': int(self.embedding_ids[row]),
+            'party_id': int(self.party_ids[row]),
+            'page_number': int(self.page_numbers[row]),
+            'chunk_text': self.chunk_texts[row],
+            'distance': 1.0 - similarity,
+            'similarity': similarity
+        }
@@ -0,0 +1,45 @@
+# ABOUTME: Shared pytest fixtures: a local OpenAI stand-in server, clients pointed at it and a scratch database
+# ABOUTME: Tests import pipeline code the same way the scripts do (pipeline/ on sys.path, then src.X)
+
+import sys
+from pathlib import Path
+
+import pytest
+from openai import OpenAI, AsyncOpenAI
+
+# Add pipeline directory to path (src/ too, for modules that import like orchestrator.py does)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from src.storage.database import Database
+from scripts.openai_standin import StandInServer
+
+DIMENSIONS = 8
+
+
+@pytest.fixture
+def standin():
+    """Stand-in OpenAI API with small embeddings; tweak its attributes per test."""
+    server = StandInServer(dimensions=DIMENSIONS).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(standin):
+    """OpenAI client talking to the stand-in (SDK retries off so tests see every failure)."""
+    return OpenAI(api_key="standin", base_url=standin.url, max_retries=0)
+
+
+@pytest.fixture
+def async_client(standin):
+    """AsyncOpenAI client talking to the stand-in."""
+    return AsyncOpenAI(api_key="standin", base_url=standin.url, max_retries=0)
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Fresh pipeline database in a temporary directory."""
+    database = Database(str(tmp_path / "test.db"))
+    yield database
+    database.close()
@@ -0,0 +1,130 @@
+# ABOUTME: Tests the per-party IVF index against exact search, its persistence and reconciliation with the database
+# ABOUTME: Checks that per-party searches through search_chunks return k hits without falling back to exact search
+
+import numpy as np
+
+from src.storage.ann_index import IVFIndex
+from src.storage.chunk_search import search_chunks, short_parties
+from src.storage.vector_index import VectorIndex
+
+DIMENSIONS = 16
+PARTIES = 5
+
+
+def make_vectors(count: int, seed: int = 0):
+    """Vectors clustered around topics, spread over PARTIES parties."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((12, DIMENSIONS)).astype(np.float32)
+    vectors = centres[rng.integers(0, 12, count)] + 0.3 * rng.standard_normal((count, DIMENSIONS)).astype(np.float32)
+    ids = np.arange(1, count + 1)
+    return vectors, ids, ids % PARTIES + 1
+
+
+def exact_index(vectors, ids, party_ids) -> VectorIndex:
+    return VectorIndex(vectors, ids, party_ids, np.zeros(len(ids)), [''] * len(ids))
+
+
+def hit_ids(hits):
+    return [hit['embedding_id'] for hit in hits]
+
+
+def test_probing_every_list_matches_exact_search():
+    vectors, ids, party_ids = make_vectors(2000)
+    index = IVFIndex(DIMENSIONS)
+    index.add(vectors, ids, party_ids)
+    exact = exact_index(vectors, ids, party_ids)
+    queries = {f"q{i}": query for i, query in enumerate(make_vectors(5, seed=1)[0])}
+
+    found = index.search_many(queries, list(range(1, PARTIES + 1)), k=10, nprobe=index.nlist)
+    expected = exact.search_many(queries, party_ids=list(range(1, PARTIES + 1)), k=10)
+
+    for pair, hits in expected.items():
+        assert hit_ids(found[pair]) == hit_ids(hits)
+        assert all(hit['party_id'] == pair[0] for hit in found[pair])
+
+
+def test_per_party_search_returns_k_hits_with_default_nprobe():
+    vectors, ids, party_ids = make_vectors(4000)
+    index = IVFIndex(DIMENSIONS, nprobe=1)
+    index.add(vectors, ids, party_ids)
+    queries = {f"q{i}": query for i, query in enumerate(make_vectors(8, seed=2)[0])}
+    parties = list(range(1, PARTIES + 1))
+
+    results = index.search_many(queries, parties, k=15)
+
+    assert all(len(hits) == 15 for hits in results.values())
+    assert short_parties(index, results, parties, queries, 15) == []
+
+
+def test_parties_are_reclustered_as_they_grow():
+    vectors, ids, party_ids = make_vectors(1000)
+    index = IVFIndex(DIMENSIONS)
+    for start in range(0, 1000, 50):
+        index.add(vectors[start:start + 50], ids[start:start + 50], party_ids[start:start + 50])
+
+    assert len(index) == 1000
+    # Clustered on 200 vectors each, not stuck with the lists of the first 10
+    assert all(index.party_lists(party_id) > 20 for party_id in range(1, PARTIES + 1))
+    exact = exact_index(vectors, ids, party_ids)
+    query = vectors[0]
+    assert hit_ids(index.search(query, k=5, nprobe=index.nlist, party_id=1)) \
+        == hit_ids(exact.search(query, k=5, party_id=1))
+
+
+def test_save_load_and_remove(tmp_path):
+    vectors, ids, party_ids = make_vectors(600)
+    index = IVFIndex(DIMENSIONS)
+    index.add(vectors, ids, party_ids)
+    index.remove(ids[:100])
+    index.save(str(tmp_path / "index.ivf.npz"))
+
+    loaded = IVFIndex.load(str(tmp_path / "index.ivf.npz"))
+
+    assert len(loaded) == 500
+    assert loaded.nlist == index.nlist
+    query = vectors[300]
+    assert hit_ids(loaded.search(query, k=10, party_id=3)) == hit_ids(index.search(query, k=10, party_id=3))
+    assert not set(hit_ids(loaded.search(vectors[0], k=50, party_id=int(party_ids[0])))) & set(ids[:100].tolist())
+
+
+def make_pages(db) -> dict:
+    """One party with a one-page plan per party id; returns party_id → document_text id."""
+    pages = {}
+    for party_id in range(1, PARTIES + 1):
+        assert db.add_party(f"Partido {party_id}", f"P{party_id}", f"p{party_id}") == party_id
+        document_id = db.add_document(party_id, "Plan", f"/plans/{party_id}.pdf", f"hash{party_id}")
+        db.save_extracted_pages(document_id, [{'page_number': 1, 'text': 'texto'}])
+        pages[party_id] = db.get_document_pages(document_id)[0]['id']
+    return pages
+
+
+def save_embeddings(db, pages, vectors, ids, party_ids):
+    """Store vectors as chunk embeddings of their party's page."""
+    db.save_embeddings_bulk([
+        {'document_text_id': pages[int(party_id)], 'chunk_index': int(chunk), 'chunk_text': f"fragmento {chunk}",
+         'embedding': vector.astype(np.float32).tobytes(), 'token_count': 3}
+        for vector, chunk, party_id in zip(vectors, ids, party_ids)
+    ])
+
+
+def test_search_chunks_through_index_matches_exact_and_reconciles(db):
+    vectors, ids, party_ids = make_vectors(900)
+    pages = make_pages(db)
+    save_embeddings(db, pages, vectors[:600], ids[:600], party_ids[:600])
+    queries = {f"q{i}": query for i, query in enumerate(make_vectors(3, seed=3)[0])}
+    parties = list(range(1, PARTIES + 1))
+
+    exact = search_chunks(db, queries, parties, k=10)
+    db.ann_index = IVFIndex.build_from_database(db, path=None, nprobe=10_000)
+    assert len(db.ann_index) == 600
+    through_index = search_chunks(db, queries, parties, k=10)
+
+    for pair, hits in exact.items():
+        assert hit_ids(through_index[pair]) == hit_ids(hits)
+        assert [hit['chunk_text'] for hit in through_index[pair]] == [hit['chunk_text'] for hit in hits]
+
+    # Embeddings stored while the index wasn't attached are picked up by reconcile()
+    index, db.ann_index = db.ann_index, None
+    save_embeddings(db, pages, vectors[600:], ids[600:], party_ids[600:])
+    assert index.reconcile(db) == (300, 0)
+    assert len(index) == 900
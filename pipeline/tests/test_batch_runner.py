@@ -0,0 +1,180 @@
+# ABOUTME: Tests BatchRunner against the stand-in's files and batches endpoints
+# ABOUTME: Covers a full run, failed lines, caching answers and resuming after interruptions at each step
+
+import pytest
+
+from src.analysis import batch_runner as batch_runner_module
+from src.analysis.batch_runner import BatchRunner
+from src.analysis.response_cache import ResponseCache
+from src.storage.database import Database
+
+KIND = 'summary'
+
+
+def make_requests(count: int):
+    """Batch requests with one chat completion body each."""
+    return [{
+        'custom_id': f'summary-{i}',
+        'party_id': i + 1,
+        'metadata': {'position': i},
+        'body': {'model': 'gpt-4o', 'temperature': 0.3,
+                 'response_format': {'type': 'json_object'},
+                 'messages': [{'role': 'user', 'content': f'Resuma la propuesta {i}'}]}
+    } for i in range(count)]
+
+
+def make_runner(db, client, tmp_path, **kwargs):
+    return BatchRunner(db, client=client, work_dir=tmp_path / "batches", poll_seconds=0, **kwargs)
+
+
+def ingest(runner, batch):
+    """Mark every yielded result like a caller would; returns custom_id → error (None on success)."""
+    outcome = {}
+    for request, response, error in runner.results(batch):
+        runner.mark(request, 'completed' if response else 'failed')
+        outcome[request['custom_id']] = error
+    return outcome
+
+
+def test_full_run(db, client, standin, tmp_path):
+    runner = make_runner(db, client, tmp_path)
+
+    batch = runner.submit(runner.prepare(KIND, make_requests(3)))
+    runner.wait(batch)
+    results = list(runner.results(batch))
+
+    assert batch['status'] == 'completed'
+    assert [request['custom_id'] for request, _, _ in results] == ['summary-0', 'summary-1', 'summary-2']
+    for request, response, error in results:
+        assert error is None
+        assert response.choices[0].message.content.startswith('{')
+        assert request['metadata'] == {'position': int(request['custom_id'].split('-')[1])}
+
+    for request, _, _ in results:
+        runner.mark(request, 'completed')
+    runner.finish(batch)
+    assert runner.open_batches(KIND) == []
+
+
+def test_failed_lines_are_reported(db, client, standin, tmp_path):
+    standin.poison_text = 'VENENO'
+    requests = make_requests(3)
+    requests[1]['body']['messages'][0]['content'] = 'VENENO'
+    runner = make_runner(db, client, tmp_path)
+
+    batch = runner.wait(runner.submit(runner.prepare(KIND, requests)))
+    outcome = ingest(runner, batch)
+
+    assert outcome['summary-0'] is None and outcome['summary-2'] is None
+    assert 'Invalid input' in outcome['summary-1']
+
+
+def test_results_are_stored_in_response_cache(db, client, standin, tmp_path):
+    cache = ResponseCache(db)
+    requests = make_requests(2)
+    runner = make_runner(db, client, tmp_path, cache=cache)
+
+    batch = runner.wait(runner.submit(runner.prepare(KIND, requests)))
+    ingest(runner, batch)
+
+    body = requests[0]['body']
+    key = cache.make_key(body['model'], body['messages'], body['temperature'], body['response_format'])
+    assert cache.get(key) is not None
+
+
+def test_resume_after_interrupted_wait(db, client, standin, tmp_path, monkeypatch):
+    # Long enough that the batch can't finish before the wait is interrupted
+    standin.batch_seconds = 60
+    runner = make_runner(db, client, tmp_path)
+    batch = runner.submit(runner.prepare(KIND, make_requests(4)))
+
+    def interrupt(seconds):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(batch_runner_module.time, 'sleep', interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            runner.wait(batch)
+
+    # A new process finds the batch and keeps polling it instead of resubmitting
+    resumed_db = Database(str(db.db_path))
+    resumed = make_runner(resumed_db, client, tmp_path)
+    [open_batch] = resumed.open_batches(KIND)
+    assert open_batch['batch_id'] == batch['batch_id']
+    assert open_batch['status'] == 'in_progress'
+
+    standin.batch_seconds = 0
+    resumed.wait(resumed.submit(open_batch))
+    assert len(ingest(resumed, open_batch)) == 4
+    assert standin.stats['batches'] == 1
+    resumed_db.close()
+
+
+def test_resume_after_interrupted_ingest(db, client, standin, tmp_path):
+    runner = make_runner(db, client, tmp_path)
+    batch = runner.wait(runner.submit(runner.prepare(KIND, make_requests(4))))
+
+    # Stop after ingesting two results
+    for count, (request, response, error) in enumerate(runner.results(batch)):
+        if count == 2:
+            break
+        runner.mark(request, 'completed')
+    downloads = standin.stats['requests']
+
+    [open_batch] = runner.open_batches(KIND)
+    remaining = ingest(runner, open_batch)
+
+    assert sorted(remaining) == ['summary-2', 'summary-3']
+    # The result file kept on disk is reused, so nothing is fetched again
+    assert standin.stats['requests'] == downloads
+    runner.finish(open_batch)
+    assert runner.open_batches(KIND) == []
+
+
+def test_resume_after_upload_before_batch_creation(db, client, standin, tmp_path, monkeypatch):
+    runner = make_runner(db, client, tmp_path)
+    batch = runner.prepare(KIND, make_requests(2))
+
+    def interrupted(**kwargs):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client.batches, 'create', interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            runner.submit(batch)
+
+    [open_batch] = runner.open_batches(KIND)
+    assert open_batch['status'] == 'submitting' and open_batch['batch_id'] is None
+
+    uploads = len(standin.files)
+    runner.submit(open_batch)
+    assert len(standin.files) == uploads
+    assert standin.stats['batches'] == 1
+    runner.wait(open_batch)
+    assert len(ingest(runner, open_batch)) == 2
+
+
+def test_resume_after_batch_creation_before_it_was_recorded(db, client, standin, tmp_path, monkeypatch):
+    runner = make_runner(db, client, tmp_path)
+    batch = runner.prepare(KIND, make_requests(2))
+    create = client.batches.create
+
+    def created_then_interrupted(**kwargs):
+        create(**kwargs)
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client.batches, 'create', created_then_interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            runner.submit(batch)
+    [remote_id] = standin.batches
+
+    [open_batch] = runner.open_batches(KIND)
+    assert open_batch['status'] == 'submitting' and open_batch['batch_id'] is None
+
+    # The batch created remotely is found by its input file instead of being paid for twice
+    runner.submit(open_batch)
+    assert open_batch['batch_id'] == remote_id
+    assert standin.stats['batches'] == 1
+    runner.wait(open_batch)
+    assert len(ingest(runner, open_batch)) == 2
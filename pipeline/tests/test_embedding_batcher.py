@@ -0,0 +1,119 @@
+# ABOUTME: Tests EmbeddingBatcher against the local stand-in API
+# ABOUTME: Covers batch packing, mapping results back to chunk keys and bisect-retry around failing inputs
+
+import asyncio
+
+from src.analysis.embedding_batcher import EmbeddingBatcher
+from scripts.openai_standin import fake_embedding
+
+from conftest import DIMENSIONS
+
+
+class ByteEncoding:
+    """Stand-in for tiktoken's cl100k_base (one token per UTF-8 byte) so tests need no download."""
+
+    def encode(self, text: str):
+        return list(text.encode('utf-8'))
+
+    def decode(self, tokens) -> str:
+        return bytes(tokens).decode('utf-8', errors='ignore')
+
+
+def make_batcher(client, **kwargs) -> EmbeddingBatcher:
+    return EmbeddingBatcher(client, encoding=ByteEncoding(), **kwargs)
+
+
+def make_items(count: int):
+    """(document_text_id, chunk_index) → text items like the chunker produces."""
+    return [((i // 3 + 1, i % 3), f"fragmento {i} sobre educación y salud pública") for i in range(count)]
+
+
+def assert_mapped(results, items):
+    """Every result holds the stand-in's vector for its own chunk's text."""
+    for key, text in items:
+        embedding, token_count = results[key]
+        assert embedding == fake_embedding(text, DIMENSIONS)
+        assert token_count > 0
+
+
+def test_make_batches_respects_input_and_token_limits(client):
+    items = make_items(10)
+    batcher = make_batcher(client, max_batch_inputs=4)
+    batches = batcher.make_batches(items)
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [key for batch in batches for key, _, _ in batch] == [key for key, _ in items]
+
+    tokens = batcher.count_tokens(items[0][1])
+    batcher = make_batcher(client, max_batch_tokens=tokens * 3)
+    for batch in batcher.make_batches(items):
+        assert sum(count for _, _, count in batch) <= tokens * 3
+
+
+def test_embed_maps_results_to_keys(client, standin):
+    items = make_items(10)
+    batcher = make_batcher(client, max_batch_inputs=4)
+
+    results = batcher.embed(items)
+
+    assert set(results) == {key for key, _ in items}
+    assert_mapped(results, items)
+    assert batcher.failures == {}
+    assert batcher.requests_made == 3
+    assert standin.stats['requests'] == 3
+    assert standin.stats['inputs'] == 10
+
+
+def test_embed_isolates_failing_input_by_bisecting(client, standin):
+    standin.poison_text = "VENENO"
+    items = make_items(8)
+    poisoned = items[5][0]
+    items[5] = (poisoned, "fragmento VENENO que el endpoint rechaza")
+    batcher = make_batcher(client, max_batch_inputs=8, retry_delay=0)
+
+    results = batcher.embed(items)
+
+    assert set(batcher.failures) == {poisoned}
+    assert set(results) == {key for key, _ in items} - {poisoned}
+    assert_mapped(results, [item for item in items if item[0] != poisoned])
+    # 400s aren't retried as-is: 8 → 4+4 → 2+2 → 1+1 (log2(8) levels of splits)
+    assert standin.stats['errors'] == 4
+
+
+def test_embed_retries_transient_errors(client, standin):
+    standin.rate_limit_every = 2
+    standin.retry_after_ms = 0
+    items = make_items(6)
+    batcher = make_batcher(client, max_batch_inputs=2, retry_delay=0)
+
+    results = batcher.embed(items)
+
+    assert batcher.failures == {}
+    assert_mapped(results, items)
+    assert standin.stats['rate_limited'] > 0
+
+
+def test_embed_gives_up_on_batches_after_transient_errors(client, standin):
+    standin.rate_limit_every = 1
+    standin.retry_after_ms = 0
+    items = make_items(8)
+    batcher = make_batcher(client, max_batch_inputs=4, max_retries=2, retry_delay=0)
+
+    results = batcher.embed(items)
+
+    assert results == {}
+    assert set(batcher.failures) == {key for key, _ in items}
+    # Two batches, two attempts each: an outage isn't bisected into more requests
+    assert standin.stats['requests'] == 4
+
+
+def test_embed_async_matches_sync(async_client, standin):
+    standin.poison_text = "VENENO"
+    items = make_items(9)
+    poisoned = items[0][0]
+    items[0] = (poisoned, "VENENO")
+    batcher = make_batcher(async_client, max_batch_inputs=3, retry_delay=0)
+
+    results = asyncio.run(batcher.embed_async(items))
+
+    assert set(batcher.failures) == {poisoned}
+    assert_mapped(results, items[1:])
@@ -0,0 +1,68 @@
+# ABOUTME: Tests multi-category analysis against the stand-in's chat endpoint
+# ABOUTME: A failing group or single-category fallback should only fail its own categories
+
+from types import SimpleNamespace
+
+import pytest
+
+from src.analysis import llm_analyzer
+from src.analysis.llm_analyzer import LLMAnalyzer, MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_PER_CATEGORY
+from src.analysis.retrieval import DocumentIndex
+
+from test_embedding_batcher import ByteEncoding
+
+POISON = 'VENENO'
+
+
+class FailingClient:
+    """Chat client that rejects requests whose last message mentions POISON."""
+
+    def __init__(self, client):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.client = client
+
+    def create(self, **kwargs):
+        if POISON in kwargs['messages'][-1]['content']:
+            raise RuntimeError("upstream error")
+        return self.client.chat.completions.create(**kwargs)
+
+
+@pytest.fixture
+def analyzer(client, monkeypatch):
+    monkeypatch.setattr(llm_analyzer.tiktoken, 'encoding_for_model', lambda model: ByteEncoding())
+    analyzer = LLMAnalyzer(api_key='standin')
+    analyzer.client = FailingClient(client)
+    return analyzer
+
+
+def make_categories(names):
+    return [{'id': i + 1, 'category_key': f'cat{i}', 'name': name, 'description': name,
+             'key_topics': [name], 'prompt_context': name} for i, name in enumerate(names)]
+
+
+def test_failed_groups_keep_other_groups_results(analyzer, standin):
+    # Groups of two: the second request fails outright
+    categories = make_categories(['economía', 'salud', POISON, 'empleo', 'ambiente', 'cultura'])
+    index = DocumentIndex.from_text("El plan propone invertir en salud, empleo y ambiente.")
+    errors = {}
+
+    analyses = analyzer.analyze_document_for_categories('', categories, 'Partido', document_index=index,
+                                                        tokens_per_category=MAX_OUTPUT_TOKENS // 2,
+                                                        errors=errors)
+
+    assert set(analyses) == {'cat0', 'cat1', 'cat4', 'cat5'}
+    assert set(errors) == {'cat2', 'cat3'}
+    assert all('summary' in analysis for analysis in analyses.values())
+
+
+def test_failed_single_category_fallback_keeps_the_rest(analyzer, standin, monkeypatch):
+    # Groups of one fall back to analyze_document_for_category
+    monkeypatch.setattr(llm_analyzer, 'MAX_OUTPUT_TOKENS', OUTPUT_TOKENS_PER_CATEGORY)
+    categories = make_categories(['economía', POISON, 'salud'])
+
+    results = analyzer.analyze_multiple_categories("El plan propone invertir en salud.", categories,
+                                                   'Partido', grouped=True)
+
+    assert [result['success'] for result in results] == [True, False, True]
+    assert 'upstream error' in results[1]['error']
+    assert results[2]['analysis']['summary'].startswith('Respuesta simulada')
@@ -0,0 +1,77 @@
+# ABOUTME: Tests the OCR server's guards: loopback-only binding, a generated private authkey and the data-dir restriction
+# ABOUTME: Uses a fake processor so no EasyOCR models are loaded
+
+import os
+import stat
+import socket
+import threading
+from multiprocessing.connection import AuthenticationError, Client
+
+import pytest
+
+from src.extraction import ocr_server
+from src.extraction.ocr_server import OCRClient, OCRServer, server_authkey
+
+
+class FakeProcessor:
+    """Minimal OCRProcessor stand-in that 'reads' one page per requested PDF."""
+
+    languages = ['es', 'en']
+    reader = None
+    pages_per_minute = 60.0
+    last_run_stats = {}
+
+    def iter_pages(self, pdf_path, dpi=300, skip_pages=None, pages=None):
+        yield {'page_number': 1, 'text': pdf_path.name, 'char_count': len(pdf_path.name),
+               'ocr_confidence': 0.9}
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """OCR server on a free loopback port serving tmp_path/data, with no authkey in the environment."""
+    monkeypatch.delenv("OCR_SERVER_AUTHKEY", raising=False)
+    monkeypatch.setattr(ocr_server, 'DATA_DIR', tmp_path / "data")
+    (tmp_path / "data").mkdir()
+
+    # Reserve a free port for the server
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    server = OCRServer(address=('127.0.0.1', port), processor=FakeProcessor(), data_dir=tmp_path / "data")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    key_path = tmp_path / "data" / ocr_server.AUTHKEY_FILE
+    for _ in range(100):
+        try:
+            Client(server.address, authkey=key_path.read_bytes()).close()
+            break
+        except (OSError, EOFError):
+            threading.Event().wait(0.02)
+    return server
+
+
+def test_refuses_non_loopback_addresses(monkeypatch):
+    with pytest.raises(ValueError):
+        OCRServer(address=('0.0.0.0', 6010), processor=FakeProcessor())
+    monkeypatch.setenv("OCR_SERVER", "192.168.1.20:6010")
+    with pytest.raises(ValueError):
+        ocr_server.server_address()
+
+
+def test_generates_private_authkey(server, tmp_path):
+    key_path = tmp_path / "data" / ocr_server.AUTHKEY_FILE
+    assert stat.S_IMODE(os.stat(key_path).st_mode) == 0o600
+    assert len(server_authkey(tmp_path / "data")) == 64
+
+    with pytest.raises(AuthenticationError):
+        Client(server.address, authkey=b"eleccionescr-ocr")
+
+
+def test_only_ocrs_pdfs_inside_data_dir(server, tmp_path):
+    client = OCRClient(address=server.address)
+
+    inside = tmp_path / "data" / "plan.pdf"
+    assert [page['text'] for page in client.iter_pages(inside)] == ['plan.pdf']
+
+    with pytest.raises(RuntimeError, match="inside the data directory"):
+        list(client.iter_pages(tmp_path / "data" / ".." / "secret.pdf"))
@@ -0,0 +1,71 @@
+# ABOUTME: Tests the page diff of a replaced plan and which stored positions it invalidates
+# ABOUTME: Edits, removals and insertions should only touch positions analyzed from the affected pages
+
+import json
+
+from pipeline.sync import affected_pages, diff_pages, sync_positions
+
+
+def position(position_id: int, category_id: int, pages, summary: str = "Resumen") -> dict:
+    """Stored position as returned by get_document_positions()."""
+    return {'id': position_id, 'category_id': category_id, 'summary': summary, 'key_proposals': '[]',
+            'context_pages': json.dumps(pages) if pages is not None else None}
+
+
+def resync(old_keys, new_keys, positions):
+    """Run the diff and position rules for a document with pages numbered from 1."""
+    old_numbers = list(range(1, len(old_keys) + 1))
+    new_numbers = list(range(1, len(new_keys) + 1))
+    diff = diff_pages(old_keys, new_keys)
+    page_map = {old_numbers[old]: new_numbers[new] for old, new in diff['kept'].items()}
+    return diff, sync_positions(positions, affected_pages(old_numbers, diff), page_map)
+
+
+def test_one_page_edit_leaves_unrelated_positions_intact():
+    positions = [position(1, 10, [1, 2]), position(2, 20, [3]), position(3, 30, [2, 4])]
+
+    diff, (invalidated, renumbered) = resync(['a', 'b', 'c', 'd'], ['a', 'b', 'C', 'd'], positions)
+
+    assert diff['removed'] == [2] and diff['added'] == [2] and diff['insertions'] == []
+    assert invalidated == [20]
+    assert renumbered == {}
+
+
+def test_removed_page_renumbers_later_positions():
+    positions = [position(1, 10, [1], "Ver [Página 1]"), position(2, 20, [2]),
+                 position(3, 30, [4], "Ver [Página 4]")]
+
+    _, (invalidated, renumbered) = resync(['a', 'b', 'c', 'd'], ['a', 'c', 'd'], positions)
+
+    assert invalidated == [20]
+    assert set(renumbered) == {3}
+    assert renumbered[3]['summary'] == "Ver [Página 3]"
+    assert json.loads(renumbered[3]['context_pages']) == [3]
+
+
+def test_inserted_pages_only_invalidate_their_neighbours():
+    positions = [position(1, 10, [1]), position(2, 20, [2]), position(3, 30, [3]), position(4, 40, [4])]
+
+    diff, (invalidated, renumbered) = resync(['a', 'b', 'c', 'd'], ['a', 'b', 'x', 'y', 'c', 'd'], positions)
+
+    assert diff['insertions'] == [2] and diff['removed'] == []
+    assert sorted(invalidated) == [20, 30]
+    assert json.loads(renumbered[4]['context_pages']) == [6]
+    assert 1 not in renumbered
+
+
+def test_appended_pages_invalidate_positions_on_the_last_page():
+    positions = [position(1, 10, [1]), position(2, 20, [3])]
+
+    _, (invalidated, renumbered) = resync(['a', 'b', 'c'], ['a', 'b', 'c', 'd'], positions)
+
+    assert invalidated == [20]
+    assert renumbered == {}
+
+
+def test_positions_without_known_pages_are_invalidated_on_any_change():
+    positions = [position(1, 10, None), position(2, 20, [1])]
+
+    _, (invalidated, _) = resync(['a', 'b'], ['a', 'B'], positions)
+
+    assert invalidated == [10]